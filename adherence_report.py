@@ -0,0 +1,259 @@
+import csv
+import hashlib
+import hmac
+import io
+import time
+from datetime import date, timedelta
+from urllib.parse import urlencode
+
+import numpy as np
+from linebot.models import TextSendMessage
+
+import repository
+from database import get_conn
+from config import (
+    CHANNEL_SECRET, REPORT_BASE_URL, REPORT_LINK_SECRET, REPORT_LINK_TTL_MINUTES,
+    REPORT_CHUNK_ROWS, REPORT_SUMMARY_DAYS
+)
+
+# ========================
+# 📊 服藥報告：每位用藥者、藥品、時段在每週 / 每月的服藥率、延遲分布與連續服藥天數
+# ========================
+# dose_log 依 (member, 日期, 時段, 藥品) 的索引順序分批讀取（REPORT_CHUNK_ROWS 筆一批），每批轉成 numpy 欄位陣列；
+# 同一位用藥者的資料到齊後一次以向量運算算出所有 (藥品, 時段, 期間) 的統計並立即輸出，
+# 記憶體只需容納一位用藥者在報表區間內的紀錄，不會載入整份歷史。
+#
+# - 服藥率 = 已服用 / 回覆次數（沒有回覆的提醒不在 dose_log 中，不列入分母）
+# - 延遲 = 回覆時間 - 提醒時間（分鐘，只計已服用），輸出中位數與 90 百分位
+# - 連續服藥天數 = 同一藥品同一時段連續每天「已服用」的最長天數（期間內）
+
+REPORT_COLUMNS = [
+    "member", "drug_name_zh", "slot_time", "period_start", "responses", "taken", "skipped",
+    "adherence_rate", "late_median_minutes", "late_p90_minutes", "longest_streak_days",
+]
+PERIODS = ("week", "month", "all")
+
+
+# ------------------------------------------------------------
+# 分批讀取
+# ------------------------------------------------------------
+
+def _to_arrays(rows):
+    members, drugs, days, slots, statuses, responded = zip(*rows)
+    return {
+        "member": np.array(members, dtype=object),
+        "drug": np.array(drugs, dtype=object),
+        "day": np.array(days, dtype="datetime64[D]"),
+        "slot": np.array([slot.total_seconds() for slot in slots], dtype=np.int64),
+        "taken": np.array(statuses, dtype=object) == "taken",
+        "responded": np.array(responded, dtype="datetime64[s]"),
+    }
+
+
+def iter_dose_chunks(recorder_id, start, end, chunk_rows=REPORT_CHUNK_ROWS):
+    """依 (member, 日期, 時段, 藥品) 順序分批讀取 start ~ end（含）的 dose_log，每批為欄位陣列 dict。"""
+    # 報表以 generator 逐步輸出（可能在請求結束後才讀完），使用獨立連線；中途停止時直接關閉連線
+    conn = get_conn(readonly=True)
+    try:
+        cursor = conn.cursor()
+        cursor.execute(repository.sql("dose.report_rows"), (recorder_id, start, end))
+        while True:
+            rows = cursor.fetchmany(chunk_rows)
+            if not rows:
+                break
+            yield _to_arrays(rows)
+    finally:
+        conn.close()
+
+
+def iter_member_frames(chunks):
+    """把分批的欄位陣列切成每位用藥者一份；跨批次的用藥者會合併後才輸出。"""
+    pending = []
+    for chunk in chunks:
+        members = chunk["member"]
+        boundaries = (np.flatnonzero(members[1:] != members[:-1]) + 1).tolist()
+        for lower, upper in zip([0, *boundaries], [*boundaries, len(members)]):
+            piece = {key: values[lower:upper] for key, values in chunk.items()}
+            if pending and pending[0]["member"][0] != piece["member"][0]:
+                yield {key: np.concatenate([p[key] for p in pending]) for key in pending[0]}
+                pending = []
+            pending.append(piece)
+    if pending:
+        yield {key: np.concatenate([p[key] for p in pending]) for key in pending[0]}
+
+
+# ------------------------------------------------------------
+# 向量化統計
+# ------------------------------------------------------------
+
+def _period_starts(days, period):
+    if period == "week":
+        # 1970-01-01 是星期四，往前推到星期一
+        return days - (days.astype(np.int64) + 3) % 7
+    if period == "month":
+        return days.astype("datetime64[M]").astype("datetime64[D]")
+    return np.full(days.shape, days.min())
+
+
+def _group_quantiles(group, values, group_count, quantiles):
+    """每組 values 的分位數（取不大於該位置的觀測值）；沒有資料的組為 NaN。"""
+    results = [np.full(group_count, np.nan) for _ in quantiles]
+    if not len(values):
+        return results
+    order = np.lexsort((values, group))
+    group, values = group[order], values[order]
+    counts = np.bincount(group, minlength=group_count)
+    starts = np.cumsum(counts) - counts
+    for result, q in zip(results, quantiles):
+        index = starts + np.floor((counts - 1) * q).astype(np.int64)
+        has_values = counts > 0
+        result[has_values] = values[index[has_values]]
+    return results
+
+
+def _longest_streaks(group, days, group_count):
+    """每組連續日期的最長天數（group、days 為已服用的紀錄）。"""
+    longest = np.zeros(group_count, dtype=np.int64)
+    if not len(group):
+        return longest
+    day_numbers = days.astype(np.int64)
+    order = np.lexsort((day_numbers, group))
+    group, day_numbers = group[order], day_numbers[order]
+    run_starts = np.ones(len(group), dtype=bool)
+    run_starts[1:] = (group[1:] != group[:-1]) | (day_numbers[1:] - day_numbers[:-1] != 1)
+    run_lengths = np.bincount(np.cumsum(run_starts) - 1)
+    np.maximum.at(longest, group[run_starts], run_lengths)
+    return longest
+
+
+def summarize_member(frame, period="week"):
+    """一位用藥者的所有 (藥品, 時段, 期間) 統計，依藥名、時段、期間排序，回傳 REPORT_COLUMNS 順序的 tuple。"""
+    drug_names, drug_index = np.unique(frame["drug"].astype(str), return_inverse=True)
+    period_starts = _period_starts(frame["day"], period)
+    keys = np.stack([drug_index.ravel(), frame["slot"], period_starts.astype(np.int64)], axis=1)
+    groups, group = np.unique(keys, axis=0, return_inverse=True)
+    group = group.ravel()
+    group_count = len(groups)
+
+    taken = frame["taken"]
+    responses = np.bincount(group, minlength=group_count)
+    taken_counts = np.bincount(group, weights=taken, minlength=group_count).astype(np.int64)
+
+    scheduled = frame["day"].astype("datetime64[s]") + frame["slot"].astype("timedelta64[s]")
+    lateness = np.maximum((frame["responded"] - scheduled).astype(np.int64) / 60, 0)
+    late_median, late_p90 = _group_quantiles(group[taken], lateness[taken], group_count, (0.5, 0.9))
+    streaks = _longest_streaks(group[taken], frame["day"][taken], group_count)
+
+    member = frame["member"][0]
+    for i, (drug, slot, period_start) in enumerate(groups.tolist()):
+        yield (
+            member,
+            drug_names[drug],
+            f"{slot // 3600:02d}:{slot // 60 % 60:02d}",
+            str(np.datetime64(period_start, "D")),
+            int(responses[i]),
+            int(taken_counts[i]),
+            int(responses[i] - taken_counts[i]),
+            round(taken_counts[i] / responses[i], 3),
+            "" if np.isnan(late_median[i]) else round(float(late_median[i]), 1),
+            "" if np.isnan(late_p90[i]) else round(float(late_p90[i]), 1),
+            int(streaks[i]),
+        )
+
+
+def iter_report_rows(recorder_id, start, end, period="week", chunk_rows=REPORT_CHUNK_ROWS):
+    """start ~ end（含）的服藥報告，逐位用藥者計算並輸出。"""
+    if period not in PERIODS:
+        raise ValueError(f"period 必須是 {PERIODS} 之一：{period}")
+    for frame in iter_member_frames(iter_dose_chunks(recorder_id, start, end, chunk_rows)):
+        yield from summarize_member(frame, period)
+
+
+def iter_csv(recorder_id, start, end, period="week", flush_bytes=16 * 1024):
+    """逐段輸出 CSV 文字（開頭帶 BOM，Excel 開啟中文才不會亂碼）。"""
+    buffer = io.StringIO()
+    buffer.write("\ufeff")
+    writer = csv.writer(buffer)
+    writer.writerow(REPORT_COLUMNS)
+    for row in iter_report_rows(recorder_id, start, end, period):
+        writer.writerow(row)
+        if buffer.tell() >= flush_bytes:
+            yield buffer.getvalue()
+            buffer.seek(0)
+            buffer.truncate()
+    yield buffer.getvalue()
+
+
+# ------------------------------------------------------------
+# 下載連結（HMAC 簽章，不需登入）
+# ------------------------------------------------------------
+
+def _signature(recorder_id, period, start, end, expires):
+    secret = (REPORT_LINK_SECRET or CHANNEL_SECRET).encode()
+    message = f"{recorder_id}|{period}|{start}|{end}|{expires}".encode()
+    return hmac.new(secret, message, hashlib.sha256).hexdigest()
+
+
+def build_report_link(recorder_id, start, end, period="week"):
+    """CSV 下載網址；未設定 REPORT_BASE_URL 時回傳 None。"""
+    if not REPORT_BASE_URL:
+        return None
+    expires = int(time.time()) + REPORT_LINK_TTL_MINUTES * 60
+    query = {
+        "recorder_id": recorder_id, "period": period,
+        "start": start.isoformat(), "end": end.isoformat(), "expires": expires,
+        "sig": _signature(recorder_id, period, start.isoformat(), end.isoformat(), expires),
+    }
+    return f"{REPORT_BASE_URL.rstrip('/')}/reports/adherence.csv?{urlencode(query)}"
+
+
+def verify_report_link(args):
+    """檢查下載連結的簽章與期限，通過時回傳 (recorder_id, start, end, period)，否則回傳 None。"""
+    try:
+        recorder_id, period = args["recorder_id"], args["period"]
+        start, end, expires = args["start"], args["end"], int(args["expires"])
+        signature = _signature(recorder_id, period, start, end, expires)
+        if not hmac.compare_digest(signature, args["sig"]) or expires < time.time() or period not in PERIODS:
+            return None
+        return recorder_id, date.fromisoformat(start), date.fromisoformat(end), period
+    except (KeyError, ValueError):
+        return None
+
+
+# ------------------------------------------------------------
+# LINE 摘要
+# ------------------------------------------------------------
+
+_SUMMARY_MAX_LINES = 40
+
+
+def create_adherence_summary_message(recorder_id, days=REPORT_SUMMARY_DAYS):
+    """最近 days 天每位用藥者、藥品、時段的服藥摘要，附 CSV 下載連結（有設定 REPORT_BASE_URL 時）。"""
+    end = date.today()
+    start = end - timedelta(days=days - 1)
+    lines = [f"📊 服藥報告（{start:%m/%d}～{end:%m/%d}）"]
+    current_member = None
+    truncated = False
+    for member, drug, slot, _, responses, taken, _, rate, late_median, _, streak in iter_report_rows(
+            recorder_id, start, end, period="all"):
+        if len(lines) >= _SUMMARY_MAX_LINES:
+            truncated = True
+            break
+        if member != current_member:
+            lines.append(f"\n👤 {member}")
+            current_member = member
+        detail = f"- {drug} {slot}：{rate:.0%}（{taken}/{responses}）"
+        if late_median != "":
+            detail += f"，延遲中位數 {late_median:g} 分"
+        if streak > 1:
+            detail += f"，最長連續 {streak} 天"
+        lines.append(detail)
+
+    if current_member is None:
+        return TextSendMessage(text=f"最近 {days} 天還沒有服藥紀錄。\n點選提醒訊息下方的「已服用 / 略過」即可記錄。")
+    if truncated:
+        lines.append("…其餘項目請見完整報表")
+    link = build_report_link(recorder_id, start, end)
+    if link:
+        lines.append(f"\n📄 完整報表（CSV，{REPORT_LINK_TTL_MINUTES} 分鐘內有效）：\n{link}")
+    return TextSendMessage(text="\n".join(lines))
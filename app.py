@@ -1,6 +1,6 @@
-from flask import Flask, request, abort, current_app
-from linebot import LineBotApi, WebhookHandler
-from config import CHANNEL_ACCESS_TOKEN, CHANNEL_SECRET
+from flask import Flask, Response, request, abort, current_app, stream_with_context
+from linebot import WebhookHandler
+from config import CHANNEL_SECRET, DB_BACKEND, DOSE_ADHERENCE_DAYS
 from linebot.exceptions import InvalidSignatureError, LineBotApiError
 from linebot.models import (
     MessageEvent, TextMessage, TextSendMessage, ImageMessage,
@@ -11,6 +11,7 @@ from linebot.models import (
 )
 from urllib.parse import parse_qs, quote
 from handlers.message_handler import handle_text_message, handle_family_postback
+from handlers.image_handler import handle_image_message
 from medication_reminder import (
     handle_postback, create_patient_selection_message, create_medication_management_menu, 
     create_patient_edit_message, create_frequency_quickreply)
@@ -18,20 +19,31 @@ from scheduler import start_scheduler
 from models import (
     set_temp_state, clear_temp_state, get_temp_state, add_medication_reminder_full,
     get_times_per_day_by_code, get_frequency_name_by_code, bind_family,unbind_family,
-    create_user_if_not_exists, update_medication_reminder_times
+    create_user_if_not_exists, update_medication_reminder_times,
+    record_dose_response, get_dose_adherence, get_family_members, add_patient_member,
+    rename_patient_member, link_patient_member, link_existing_member, get_latest_ocr_record
 )
-from database import get_conn
+from database import reset_routing
+from migrate import migrate_up
+from line_client import get_line_bot_api, collect_event_messages
+from frequency_resolver import get_frequency_resolver
+from adherence_report import create_adherence_summary_message, iter_csv, verify_report_link
+from drug_index import get_drug_index
 import json
 import traceback
 import re
+from datetime import datetime
 
 # 導入 OCR 解析模組
 from medication_ocr_parser import call_ocr_service, parse_medication_order, convert_frequency_to_times
 
 app = Flask(__name__)
-line_bot_api = LineBotApi(CHANNEL_ACCESS_TOKEN)
+line_bot_api = get_line_bot_api()
 handler = WebhookHandler(CHANNEL_SECRET)
 
+# 每個請求重新開始讀寫分流：請求內寫入後的讀取才改走 primary
+app.before_request(reset_routing)
+
 # Helper to reply messages
 def reply_message(reply_token, messages):
     try:
@@ -147,9 +159,10 @@ def welcome_invited_user(reply_token, line_bot_api):
     ])
 
 @handler.add(FollowEvent)
+@collect_event_messages
 def handle_follow(event):
-    create_user_if_not_exists(recorder_id)
     recorder_id = event.source.user_id
+    create_user_if_not_exists(recorder_id)
     body = request.get_data(as_text=True)
     try:
         event_json = json.loads(body)
@@ -226,7 +239,23 @@ def callback():
     return 'OK'
 
 
+@app.route("/reports/adherence.csv", methods=['GET'])
+def adherence_report_csv():
+    """服藥報告 CSV：連結由 LINE 摘要產生並以 HMAC 簽章，邊計算邊輸出。"""
+    report = verify_report_link(request.args)
+    if report is None:
+        abort(403)
+    recorder_id, start, end, period = report
+    filename = f"adherence_{start:%Y%m%d}_{end:%Y%m%d}_{period}.csv"
+    return Response(
+        stream_with_context(iter_csv(recorder_id, start, end, period)),
+        mimetype="text/csv",
+        headers={"Content-Disposition": f"attachment; filename={filename}"},
+    )
+
+
 @handler.add(MessageEvent, message=TextMessage)
+@collect_event_messages
 def handle_message(event):
     reply_token = event.reply_token
     line_user_id = event.source.user_id
@@ -249,7 +278,7 @@ def handle_message(event):
                 TextSendMessage(text="📌 您即將進行家人綁定：\n系統偵測到您收到的邀請碼，為了保護您的帳戶安全，請確認是否要與對方建立綁定關係。")
             ])
         
-            # 接著顯示確認視窗
+            # 接著顯示確認視窗（與上面的提示併成同一次 reply，見 line_client.collect_event_messages）
             push_binding_confirmation(line_user_id, invite_code)
             return
 
@@ -262,28 +291,16 @@ def handle_message(event):
         set_temp_state(line_user_id, {"state": "AWAITING_PATIENT_FOR_EDIT_TIME"})
         reply_message(reply_token, create_patient_selection_message(line_user_id, context="edit_time"))
 
+    elif message_text == "服藥報告":
+        try:
+            reply_message(reply_token, create_adherence_summary_message(line_user_id))
+        except Exception as e:
+            app.logger.error(f"[服藥報告] 錯誤：{e}")
+            reply_message(reply_token, TextSendMessage(text="❌ 產生服藥報告失敗，請稍後再試。"))
+
     elif message_text == "選擇頻率":
-        conn = get_conn()
-        cursor = conn.cursor(dictionary=True)
         line_user_id = event.source.user_id
-
-        cursor.execute("""
-            SELECT 
-                mr.member, 
-                mr.drug_name_zh, 
-                mr.frequency_count_code AS frequency_code, 
-                fc.frequency_name,
-                mr.dose_quantity,  
-                mr.days
-            FROM medication_record mr
-            LEFT JOIN frequency_code fc ON mr.frequency_count_code = fc.frequency_code
-            WHERE mr.recorder_id = %s AND mr.source_detail = 'OCR_Scan'
-            ORDER BY mr.created_at DESC
-            LIMIT 1
-        """, (line_user_id,))
-
-        latest_ocr = cursor.fetchone()
-        conn.close()
+        latest_ocr = get_latest_ocr_record(line_user_id)
 
         if latest_ocr:
             converted_ocr = {
@@ -330,6 +347,9 @@ def handle_message(event):
     elif message_text == "查詢用藥時間": # 新增此判斷
         set_temp_state(line_user_id, {"state": "AWAITING_PATIENT_FOR_QUERY"}) # 設定新狀態
         reply_message(reply_token, create_patient_selection_message(line_user_id, context="query_reminder"))
+    elif message_text == "藥袋辨識":
+        set_temp_state(line_user_id, {"state": "AWAITING_MED_BAG_PHOTO", "member": current_state_info.get("member")})
+        reply_message(reply_token, TextSendMessage(text="📷 請拍攝或上傳藥袋照片，系統會自動辨識藥品資訊。"))
      # ✅ 使用者選擇手動輸入藥品
     elif message_text == "手動輸入藥品":
         set_temp_state(line_user_id, {"state": "AWAITING_MEDICINE_NAME", "member": current_state_info.get("member")})
@@ -344,17 +364,7 @@ def handle_message(event):
             return
 
         try:
-            conn = get_conn()
-            cursor = conn.cursor()
-            cursor.execute("SELECT COUNT(*) FROM patients WHERE recorder_id = %s AND member = %s", (inviter_id, member))
-            if cursor.fetchone()[0] == 0:
-                cursor.execute("INSERT INTO patients (recorder_id, member, linked_user_id) VALUES (%s, %s, %s)",
-                            (inviter_id, member, line_user_id))
-            else:
-                cursor.execute("UPDATE patients SET linked_user_id = %s WHERE recorder_id = %s AND member = %s",
-                            (line_user_id, inviter_id, member))
-
-            conn.commit()
+            link_patient_member(inviter_id, member, line_user_id)
 
             # 通知被邀請人
             line_bot_api.reply_message(reply_token, TextSendMessage(
@@ -370,8 +380,6 @@ def handle_message(event):
             app.logger.error(f"[custom_relationship_input] 錯誤：{e}")
             line_bot_api.reply_message(reply_token, TextSendMessage(text="❌ 綁定失敗，請稍後再試。"))
         finally:
-            if conn and conn.is_connected():
-                conn.close()
             clear_temp_state(line_user_id)
 
     # ✅ 使用者輸入藥品名稱
@@ -481,47 +489,21 @@ def handle_message(event):
     elif state == "AWAITING_NEW_PATIENT_NAME":
         new_name = message_text
         clear_temp_state(line_user_id)
-        conn = get_conn()
-        reply_text = "抱歉，資料庫連線失敗。"
-        if conn:
-            try:
-                cursor = conn.cursor()
-                cursor.execute("SELECT recorder_id FROM users WHERE recorder_id = %s", (line_user_id,))
-                user = cursor.fetchone()
-                if user:
-                    recorder_id_for_db = user[0]
-                    cursor.execute("SELECT COUNT(*) FROM patients WHERE recorder_id = %s AND member = %s", (recorder_id_for_db, new_name))
-                    if cursor.fetchone()[0] > 0: # 檢查計數是否大於 0
-                        reply_text = f"成員「{new_name}」已經存在囉！"
-                    else:
-                        cursor.execute("INSERT INTO patients (recorder_id, member) VALUES (%s, %s)", (recorder_id_for_db, new_name))
-                        conn.commit()
-                        reply_text = f"好的，「{new_name}」已成功新增！"
-                else:
-                    reply_text = "抱歉，找不到您的使用者資料。"
-            except Exception as e:
-                app.logger.error(f"Error adding new patient: {e}")
-                traceback.print_exc()
-                reply_text = "新增成員失敗，請稍後再試。"
-            finally:
-                if conn.is_connected():
-                    conn.close()
+        if new_name in get_family_members(line_user_id):
+            reply_text = f"成員「{new_name}」已經存在囉！"
+        elif add_patient_member(line_user_id, new_name):
+            reply_text = f"好的，「{new_name}」已成功新增！"
+        else:
+            reply_text = "新增成員失敗，請稍後再試。"
         reply_message(reply_token, TextSendMessage(text=reply_text))
     elif state == "AWAITING_NEW_NAME":
         new_name = message_text
         member_to_edit = current_state_info.get("member_to_edit")
         clear_temp_state(line_user_id)
-        conn = get_conn()
-        reply_text = "抱歉，資料庫連線失敗。"
-        if conn and member_to_edit:
+        reply_text = "修改失敗，找不到該成員。"
+        if member_to_edit:
             try:
-                cursor = conn.cursor()
-                cursor.execute(
-                    "UPDATE patients SET member = %s WHERE recorder_id = %s AND member = %s",
-                    (new_name, line_user_id, member_to_edit)
-                )
-                conn.commit()
-                if cursor.rowcount > 0:
+                if rename_patient_member(line_user_id, member_to_edit, new_name):
                     reply_text = f"名稱已成功修改為「{new_name}」！"
                 else:
                     reply_text = "修改失敗，找不到該成員。" # 或成員名稱重複導致更新失敗
@@ -529,15 +511,51 @@ def handle_message(event):
                 app.logger.error(f"Error editing patient name: {e}")
                 traceback.print_exc()
                 reply_text = "修改名稱失敗，請稍後再試。"
-            finally:
-                if conn.is_connected():
-                    conn.close()
         reply_message(reply_token, TextSendMessage(text=reply_text))
     else:
         handle_text_message(event, line_bot_api)
 
 
+@handler.add(MessageEvent, message=ImageMessage)
+@collect_event_messages
+def handle_image(event):
+    handle_image_message(event, line_bot_api)
+
+
+def handle_dose_response(reply_token, line_user_id, params):
+    """提醒訊息的「已服用 / 略過」：寫入服藥紀錄，回覆最近幾天的服藥統計。"""
+    status = params.get("status")
+    try:
+        patient_id = int(params.get("patient_id"))
+        scheduled_date = datetime.strptime(params.get("date"), "%Y%m%d").date()
+        slot_time = datetime.strptime(params.get("time"), "%H%M").strftime("%H:%M")
+    except (TypeError, ValueError):
+        status = None
+    if status not in ("taken", "skipped"):
+        reply_message(reply_token, TextSendMessage(text="❗ 服藥回覆參數有誤，請從提醒訊息重新點選。"))
+        return
+
+    try:
+        logged = record_dose_response(line_user_id, patient_id, scheduled_date, slot_time, status)
+        if not logged:
+            reply_message(reply_token, TextSendMessage(text=f"ℹ️ {scheduled_date:%m/%d} {slot_time} 的提醒已經記錄過了。"))
+            return
+        adherence = get_dose_adherence(patient_id, DOSE_ADHERENCE_DAYS)
+    except Exception as e:
+        app.logger.error(f"[dose_log] 錯誤：{e}")
+        reply_message(reply_token, TextSendMessage(text="❌ 記錄失敗，請稍後再試。"))
+        return
+
+    result = "已服用" if status == "taken" else "略過"
+    lines = [f"✅ 已記錄 {scheduled_date:%m/%d} {slot_time} 的 {logged} 項藥品：{result}"]
+    if adherence:
+        lines.append(f"📊 {adherence[0]['member']} 最近 {DOSE_ADHERENCE_DAYS} 天：")
+        lines.extend(f"- {row['drug_name_zh']}：已服用 {row['taken']} 次、略過 {row['skipped']} 次" for row in adherence)
+    reply_message(reply_token, TextSendMessage(text="\n".join(lines)))
+
+
 @handler.add(PostbackEvent)
+@collect_event_messages
 def handle_postback_event(event):
     reply_token = event.reply_token
     line_user_id = event.source.user_id
@@ -555,46 +573,37 @@ def handle_postback_event(event):
                 text=f"✅ 綁定成功！您已成功綁定 {inviter_id[-6:]}"
             ))
 
-            # 關係確認（排除本人）
-            conn = get_conn()
-            if conn:
-                try:
-                    cursor = conn.cursor(dictionary=True)
-                    cursor.execute("SELECT member FROM patients WHERE recorder_id = %s AND member != '本人'", (inviter_id,))
-                    members = cursor.fetchall()
-                    if members:
-                        from urllib.parse import quote
-                        quick_buttons = [
-                            QuickReplyButton(
-                                action=PostbackAction(
-                                    label=m['member'],
-                                    data=f"action=confirm_relationship&inviter_id={inviter_id}&member={quote(m['member'])}"
-                                )
-                            )
-                            for m in members
-                        ]
-
-                        quick_buttons.append(
-                            QuickReplyButton(
-                                action=PostbackAction(
-                                    label="⊕ 新增其他關係",
-                                    data=f"action=input_custom_relationship&inviter_id={inviter_id}"
-                                )
-                            )
+            # 關係確認（排除本人）；名單來自用藥者快取
+            members = [m for m in get_family_members(inviter_id) if m != '本人']
+            if members:
+                from urllib.parse import quote
+                quick_buttons = [
+                    QuickReplyButton(
+                        action=PostbackAction(
+                            label=m,
+                            data=f"action=confirm_relationship&inviter_id={inviter_id}&member={quote(m)}"
                         )
+                    )
+                    for m in members
+                ]
 
-                        line_bot_api.push_message(line_user_id, TextSendMessage(
-                            text="📌 這位邀請你的人跟你是什麼關係？",
-                            quick_reply=QuickReply(items=quick_buttons)
-                        ))
-                    else:
-                        line_bot_api.push_message(line_user_id, TextSendMessage(
-                            text="⚠️ 邀請人尚未設定家人，請通知對方先新增家人資料（不能僅有『本人』）。"
-                        ))
-                except Exception as e:
-                    app.logger.error(f"[confirm_bind] 錯誤：{e}")
-                finally:
-                    conn.close()
+                quick_buttons.append(
+                    QuickReplyButton(
+                        action=PostbackAction(
+                            label="⊕ 新增其他關係",
+                            data=f"action=input_custom_relationship&inviter_id={inviter_id}"
+                        )
+                    )
+                )
+
+                line_bot_api.push_message(line_user_id, TextSendMessage(
+                    text="📌 這位邀請你的人跟你是什麼關係？",
+                    quick_reply=QuickReply(items=quick_buttons)
+                ))
+            else:
+                line_bot_api.push_message(line_user_id, TextSendMessage(
+                    text="⚠️ 邀請人尚未設定家人，請通知對方先新增家人資料（不能僅有『本人』）。"
+                ))
         else:
             line_bot_api.reply_message(reply_token, TextSendMessage(
                 text="❌ 綁定失敗，邀請碼無效或已使用或過期。"
@@ -618,16 +627,7 @@ def handle_postback_event(event):
             return
 
         try:
-            conn = get_conn()
-            cursor = conn.cursor()
-            cursor.execute("""
-                UPDATE patients
-                SET linked_user_id = %s
-                WHERE recorder_id = %s AND member = %s
-            """, (line_user_id, inviter_id, member))
-            conn.commit()
-
-            if cursor.rowcount > 0:
+            if link_existing_member(inviter_id, member, line_user_id):
                 line_bot_api.reply_message(reply_token, TextSendMessage(
                     text=f"✅ 綁定完成：您是「{member}」，將收到由對方設定的提醒。"
                 ))
@@ -641,9 +641,6 @@ def handle_postback_event(event):
             line_bot_api.reply_message(reply_token, TextSendMessage(
                 text="❌ 綁定失敗，請稍後再試。"
             ))
-        finally:
-            if conn and conn.is_connected():
-                conn.close()
 
     elif action == "confirm_unbind":
         target_user_id = params.get("target")
@@ -689,6 +686,9 @@ def handle_postback_event(event):
             )
         )
 
+    elif action == "dose_log":
+        handle_dose_response(reply_token, line_user_id, params)
+
     elif action == "reject_use_ocr_from_db":
         clear_temp_state(line_user_id)
         set_temp_state(line_user_id, {"state": "AWAITING_PATIENT_FOR_REMINDER"})
@@ -886,7 +886,13 @@ def handle_postback_event(event):
 
 
 # Start scheduler (assuming this is for background tasks)
-start_scheduler(line_bot_api)
+# OCR worker 以 spawn 啟動時會以 __mp_main__ 重新載入本模組，worker 中不可再啟動排程
+if __name__ != "__mp_main__":
+    if DB_BACKEND == "sqlite":
+        migrate_up()          # 單機 SQLite：啟動時建立或更新 schema
+    get_frequency_resolver()  # 啟動時先編譯頻率同義詞比對器
+    get_drug_index()          # 與藥名索引
+    start_scheduler(line_bot_api)
 
 if __name__ == "__main__":
     app.run()
\ No newline at end of file
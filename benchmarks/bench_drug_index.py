@@ -0,0 +1,66 @@
+"""
+藥名索引基準測試：以合成的 drug_info 藥名量測索引建立時間與查詢延遲。
+
+    python benchmarks/bench_drug_index.py [--drugs 20000] [--queries 5000]
+"""
+import argparse
+import os
+import random
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from config import DRUG_MATCH_MIN_SCORE  # noqa: E402
+from drug_index import DrugNameIndex  # noqa: E402
+
+SUFFIXES = ["錠", "膠囊", "糖漿", "口服液", "軟膏", "注射液", "持續性藥效錠"]
+
+
+def _synthetic_names(count, rng):
+    chars = [chr(code) for code in range(0x4E00, 0x4E00 + 3000)]
+    return [
+        "".join(rng.choice(chars) for _ in range(rng.randint(2, 6))) + rng.choice(SUFFIXES)
+        for _ in range(count)
+    ]
+
+
+def _misread(name, rng):
+    """模擬 OCR 錯字：隨機換掉一個字。"""
+    pos = rng.randrange(len(name))
+    return name[:pos] + chr(rng.randint(0x4E00, 0x4E00 + 3000)) + name[pos + 1:]
+
+
+def run(drug_count, query_count, seed=7):
+    rng = random.Random(seed)
+    names = _synthetic_names(drug_count, rng)
+
+    started = time.perf_counter()
+    index = DrugNameIndex(enumerate(names))
+    build_seconds = time.perf_counter() - started
+
+    targets = [rng.randrange(drug_count) for _ in range(query_count)]
+    queries = [_misread(names[i], rng) for i in targets]
+    latencies = []
+    hits = 0
+    for target, query in zip(targets, queries):
+        started = time.perf_counter()
+        match = index.best_match(query, min_score=DRUG_MATCH_MIN_SCORE)
+        latencies.append(time.perf_counter() - started)
+        hits += bool(match and match[0] == target)
+    latencies.sort()
+
+    print(f"drugs indexed   : {len(index)}")
+    print(f"build seconds   : {build_seconds:.2f}")
+    print(f"queries         : {query_count}")
+    print(f"top-1 correct   : {hits / query_count:.1%}")
+    print(f"p50 ms          : {latencies[len(latencies) // 2] * 1000:.3f}")
+    print(f"p99 ms          : {latencies[int(len(latencies) * 0.99)] * 1000:.3f}")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--drugs", type=int, default=20000)
+    parser.add_argument("--queries", type=int, default=5000)
+    args = parser.parse_args()
+    run(args.drugs, args.queries)
@@ -0,0 +1,138 @@
+"""
+藥袋語料基準測試：以 benchmarks/ocr_corpus 中的藥袋文字與預期解析結果，
+量測 parse_medication_order（含頻率解析）的欄位正確率與處理速度。
+
+    python benchmarks/bench_ocr_corpus.py [--rounds 500] [--min-accuracy 1.0] [--verbose] [--db]
+
+語料格式：每個案例為 NN_名稱.txt（OCR 原始文字）與 NN_名稱.expected.json（預期的藥品列表）。
+新增版面時兩個檔案一起加入；預期結果請人工確認，不要直接貼上解析器的輸出。
+"""
+import argparse
+import glob
+import json
+import logging
+import os
+import sys
+import time
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+from frequency_resolver import reload_frequency_resolver  # noqa: E402
+from medication_ocr_parser import parse_medication_order  # noqa: E402
+
+CORPUS_DIR = os.path.join(ROOT, "benchmarks", "ocr_corpus")
+FIELDS = ("name", "dosage", "frequency_text", "times", "purpose", "side_effects", "visit_date", "days_supply")
+
+
+def load_corpus(corpus_dir=CORPUS_DIR):
+    cases = []
+    for text_path in sorted(glob.glob(os.path.join(corpus_dir, "*.txt"))):
+        expected_path = text_path[:-len(".txt")] + ".expected.json"
+        with open(text_path, encoding="utf-8") as f:
+            text = f.read()
+        with open(expected_path, encoding="utf-8") as f:
+            expected = json.load(f)
+        cases.append((os.path.basename(text_path)[:-len(".txt")], text, expected))
+    return cases
+
+
+def _align(expected, actual):
+    """
+    配對預期與實際結果：先以藥名配對，其餘依出現順序配對（藥名辨識錯誤時其他欄位仍可計分）。
+    回傳 [(預期, 實際或 None)] 與多出來的實際結果。
+    """
+    remaining = list(actual)
+    matches = {}
+    for i, exp in enumerate(expected):
+        act = next((a for a in remaining if a.get("name") == exp.get("name")), None)
+        if act is not None:
+            matches[i] = act
+            remaining.remove(act)
+    for i in range(len(expected)):
+        if i not in matches and remaining:
+            matches[i] = remaining.pop(0)
+    return [(exp, matches.get(i)) for i, exp in enumerate(expected)], remaining
+
+
+def score(cases, verbose=False):
+    field_hits = dict.fromkeys(FIELDS, 0)
+    expected_drugs = 0
+    found_drugs = 0
+    spurious_drugs = 0
+    for name, text, expected in cases:
+        actual = parse_medication_order(text)
+        pairs, extra = _align(expected, actual)
+        expected_drugs += len(expected)
+        spurious_drugs += len(extra)
+        for exp, act in pairs:
+            if act is None:
+                if verbose:
+                    print(f"  [{name}] 漏掉藥品：{exp.get('name')}")
+                continue
+            found_drugs += 1
+            for field in FIELDS:
+                if act.get(field) == exp.get(field):
+                    field_hits[field] += 1
+                elif verbose:
+                    print(f"  [{name}] {exp.get('name')}.{field}：預期 {exp.get(field)!r}，實際 {act.get(field)!r}")
+        if verbose:
+            for act in extra:
+                print(f"  [{name}] 多出藥品：{act.get('name')}")
+
+    field_accuracy = {field: hits / expected_drugs if expected_drugs else 1.0 for field, hits in field_hits.items()}
+    return {
+        "cases": len(cases),
+        "drugs": expected_drugs,
+        "recall": found_drugs / expected_drugs if expected_drugs else 1.0,
+        "spurious": spurious_drugs,
+        "fields": field_accuracy,
+        "overall": sum(field_accuracy.values()) / len(FIELDS),
+    }
+
+
+def measure_throughput(cases, rounds):
+    texts = [text for _, text, _ in cases] * rounds
+    total_lines = sum(text.count("\n") + 1 for text in texts)
+    started = time.perf_counter()
+    for text in texts:
+        parse_medication_order(text)
+    elapsed = time.perf_counter() - started
+    return {"bags": len(texts), "lines": total_lines,
+            "bags_per_second": len(texts) / elapsed, "lines_per_second": total_lines / elapsed}
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--rounds", type=int, default=500, help="量測速度時重複整份語料的次數")
+    parser.add_argument("--min-accuracy", type=float, default=None, help="整體欄位正確率低於此值時以 exit code 1 結束")
+    parser.add_argument("--verbose", action="store_true", help="列出每個錯誤的欄位")
+    parser.add_argument("--db", action="store_true", help="頻率同義詞改從資料庫載入（預設使用內建資料）")
+    args = parser.parse_args(argv)
+
+    # 語料中的頁首、頁尾等雜訊行會產生大量警告，基準測試時不輸出
+    logging.disable(logging.WARNING)
+    reload_frequency_resolver(use_database=args.db)
+    cases = load_corpus()
+
+    result = score(cases, verbose=args.verbose)
+    print(f"cases           : {result['cases']}")
+    print(f"drugs expected  : {result['drugs']}")
+    print(f"drug recall     : {result['recall']:.1%}")
+    print(f"spurious drugs  : {result['spurious']}")
+    for field, accuracy in result["fields"].items():
+        print(f"  {field:<14}: {accuracy:.1%}")
+    print(f"overall accuracy: {result['overall']:.1%}")
+
+    speed = measure_throughput(cases, args.rounds)
+    print(f"bags / second   : {speed['bags_per_second']:,.0f}")
+    print(f"lines / second  : {speed['lines_per_second']:,.0f}")
+
+    if args.min_accuracy is not None and result["overall"] < args.min_accuracy:
+        print(f"FAIL: overall accuracy {result['overall']:.1%} < {args.min_accuracy:.1%}")
+        return 1
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
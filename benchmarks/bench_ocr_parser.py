@@ -0,0 +1,73 @@
+"""
+parse_medication_order 基準測試：量測每秒處理行數與每行記憶體配置。
+
+    python benchmarks/bench_ocr_parser.py [--rounds 2000]
+"""
+import argparse
+import os
+import sys
+import time
+import tracemalloc
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from medication_ocr_parser import parse_medication_order  # noqa: E402
+
+SAMPLE_BAGS = [
+    # 原始範例版面：單一空白分隔
+    """看診日期:114.06.12
+本次發藥天數:3日份
+
+藥品名稱 單次劑量 用藥頻率 主要用途 副作用
+普拿疼 2 一日三次 止痛
+脈優錠 1 飯後早中晚 治療高血壓 嘔吐 頭暈
+""",
+    # 全形空白、全形數字與多餘欄位
+    """看診日期：１１４．０７．０１
+本次發藥天數：７日份
+藥名　　劑量　　用法　　總量　　用途　　副作用
+Panadol 500mg　　1錠　　一日三次　　21　　止痛退燒　　噁心 皮疹
+脈優錠　　1　　飯後早中晚　　21　　治療高血壓　　嘔吐
+""",
+    # 副作用跨行
+    """藥品名稱 單次劑量 用藥頻率 主要用途 副作用
+樂舒眠 1 睡前 助眠 嗜睡 頭暈
+  口乾 注意力不集中
+胃乳片 2 飯前 保護胃黏膜
+看診日期:114.05.20
+本次發藥天數:14日份
+""",
+]
+
+
+def run(rounds):
+    corpus = SAMPLE_BAGS * rounds
+    total_lines = sum(text.count("\n") + 1 for text in corpus)
+
+    started = time.perf_counter()
+    for text in corpus:
+        parse_medication_order(text)
+    elapsed = time.perf_counter() - started
+
+    tracemalloc.start()
+    before = tracemalloc.take_snapshot()
+    for text in SAMPLE_BAGS:
+        parse_medication_order(text)
+    after = tracemalloc.take_snapshot()
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    sample_lines = sum(text.count("\n") + 1 for text in SAMPLE_BAGS)
+    allocated = sum(stat.count_diff for stat in after.compare_to(before, "filename") if stat.count_diff > 0)
+
+    print(f"bags parsed     : {len(corpus)}")
+    print(f"lines parsed    : {total_lines}")
+    print(f"lines / second  : {total_lines / elapsed:,.0f}")
+    print(f"bags / second   : {len(corpus) / elapsed:,.0f}")
+    print(f"net blocks/line: {allocated / sample_lines:.1f}")
+    print(f"peak traced KiB : {peak / 1024:.1f}")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--rounds", type=int, default=2000)
+    run(parser.parse_args().rounds)
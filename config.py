@@ -7,3 +7,72 @@ DB_CONFIG = {
     'host': 'localhost',
     'database': 'pill_0617',
 }
+
+# 資料庫後端："mysql"（DB_CONFIG）或 "sqlite"（單機嵌入式，免網路，適合小型診所與本機測試）
+# sqlite 使用 SQLITE_PATH 的檔案（相對路徑以專案目錄為準），啟動時自動套用 migrations；不支援讀寫分離
+DB_BACKEND = "mysql"
+SQLITE_PATH = "medbot.sqlite3"
+
+# 讀取用 replica 連線設定（None 表示不分流，全部走 DB_CONFIG），例如 {**DB_CONFIG, 'host': 'replica-host'}
+# 本機測試可指向第二個 MySQL（如 port 3307 的 replica），或直接設為 DB_CONFIG 當作替身
+DB_REPLICA_CONFIG = None
+
+# 資料存取層（repository.py）連線池大小（primary 與 replica 各一個）；借不到連線時改用一般連線
+DB_POOL_SIZE = 10
+
+# 已知使用者快取：0 表示以精確集合記錄；大於 0 時改用 Bloom filter，數值為預估使用者數
+KNOWN_USER_BLOOM_CAPACITY = 0
+KNOWN_USER_BLOOM_ERROR_RATE = 0.0001
+
+# LINE API 共用連線池與逾時設定（秒）
+LINE_API_CONNECT_TIMEOUT = 3
+LINE_API_READ_TIMEOUT = 10
+LINE_API_POOL_SIZE = 10
+LINE_API_SLOW_CALL_MS = 2000
+
+# 資料清理（housekeeping）：每批刪除筆數、批次間最短間隔（秒）、單次執行時間上限（秒）
+HOUSEKEEPING_BATCH_SIZE = 500
+HOUSEKEEPING_PAUSE_SECONDS = 0.2
+HOUSEKEEPING_MAX_SECONDS = 300
+INVITE_CODE_RETENTION_DAYS = 7
+TEMP_STATE_RETENTION_HOURS = 24
+MEDICATION_HISTORY_RETENTION_DAYS = 365
+# 療程結束超過幾天後把藥品記錄搬到 medication_record_archive（提醒在結束日隔天就會停止）
+COURSE_ARCHIVE_GRACE_DAYS = 7
+
+# 服藥紀錄（dose_log）：按月分區，預先建立的未來月數；原始紀錄保留月數（0 表示不刪除，每日彙總不受影響）
+# 提醒訊息回覆後顯示最近幾天的服藥統計
+DOSE_LOG_PARTITION_MONTHS_AHEAD = 3
+DOSE_LOG_RETENTION_MONTHS = 24
+DOSE_ADHERENCE_DAYS = 7
+
+# 服藥報告：CSV 下載連結的網址前綴（例如 "https://medbot.example.com"，None 表示 LINE 摘要不附連結）、
+# 連結簽章金鑰（None 使用 CHANNEL_SECRET）、連結有效分鐘數、讀取服藥紀錄每批筆數、LINE 摘要涵蓋天數
+REPORT_BASE_URL = None
+REPORT_LINK_SECRET = None
+REPORT_LINK_TTL_MINUTES = 60
+REPORT_CHUNK_ROWS = 5000
+REPORT_SUMMARY_DAYS = 28
+
+# OCR：後端類別（模組.類別名稱）、process pool 大小、等待佇列上限與逾時（秒）
+OCR_BACKEND = "ocr_engine.LocalOcrBackend"
+OCR_POOL_WORKERS = 2
+OCR_MAX_PENDING = 8
+OCR_TIMEOUT_SECONDS = 30
+
+# 藥袋照片處理：暫存目錄（None 使用系統暫存目錄）、單張大小上限（位元組）、同時處理張數
+OCR_SPOOL_DIR = None
+OCR_MAX_IMAGE_BYTES = 10 * 1024 * 1024
+OCR_PIPELINE_WORKERS = 4
+
+# 藥袋辨識結果快取：記憶體筆數上限、磁碟快取目錄（None 表示不使用磁碟層）、磁碟檔案保留天數
+OCR_CACHE_MAX_ENTRIES = 256
+OCR_CACHE_DIR = None
+OCR_CACHE_DISK_MAX_AGE_DAYS = 30
+
+# 用藥頻率解析器：資料庫讀不到同義詞而改用 migrations 內建資料時，隔幾秒再從資料庫重新載入
+FREQUENCY_RESOLVER_RETRY_SECONDS = 60
+
+# 藥名比對：OCR 藥名對應到 drug_info 的最低相似度（0~1）、藥名索引檢查異動的間隔（分鐘）
+DRUG_MATCH_MIN_SCORE = 0.5
+DRUG_INDEX_REFRESH_MINUTES = 10
@@ -1,5 +1,76 @@
+import functools
+from contextvars import ContextVar
+
 import mysql.connector
-from config import DB_CONFIG
+import sqlite_backend
+from config import DB_BACKEND, DB_CONFIG, DB_REPLICA_CONFIG
+
+# ========================
+# 讀寫分離：讀取走 replica，寫入與寫入後的讀取走 primary
+# ========================
+# 函式以 @read_only / @read_write 標示；沒有標示的一律走 primary。
+# 同一個請求（Flask request、排程工作）內一旦寫入（@read_write 函式取得 primary 連線，或 repository commit），
+# 之後的讀取都改走 primary（read-your-writes），避免 replica 延遲讀到舊資料。每個請求開始時呼叫 reset_routing() 清除。
+# 狀態放在 contextvar：交給其他執行緒處理的工作請以 contextvars.copy_context().run 提交以沿用。
+
+_route = ContextVar("db_route", default=None)          # "read" / "write" / None（未標示）
+_wrote = ContextVar("db_wrote_in_request", default=False)
+
+
+def replica_enabled():
+    # SQLite 單機模式只有一個資料庫檔，不分流
+    return DB_BACKEND != "sqlite" and bool(DB_REPLICA_CONFIG)
+
+
+def reset_routing():
+    """新請求開始：清除寫入後的 primary 黏著。"""
+    _wrote.set(False)
+
+
+def mark_written():
+    """記錄目前請求已寫入，之後的讀取改走 primary。"""
+    _wrote.set(True)
+
+
+def use_replica(readonly=None):
+    """
+    判斷這次連線是否走 replica：readonly 明確指定時以它為準，否則看目前函式的標示。
+    已寫入過的請求一律回 primary。
+    """
+    if readonly is None:
+        readonly = _route.get() == "read"
+    return readonly and replica_enabled() and not _wrote.get()
+
+
+def _routed(route):
+    def decorator(func):
+        @functools.wraps(func)
+        def wrapper(*args, **kwargs):
+            # 寫入函式內呼叫的讀取函式仍走 primary，與寫入看到同一份資料
+            token = _route.set("write" if _route.get() == "write" else route)
+            try:
+                return func(*args, **kwargs)
+            finally:
+                _route.reset(token)
+        return wrapper
+    return decorator
+
+
+# 只讀取資料的函式：連線走 replica（請求內已寫入時仍走 primary）
+read_only = _routed("read")
+# 會寫入的函式：連線走 primary，取得連線後目前請求的讀取也改走 primary
+read_write = _routed("write")
+
 
-def get_conn():
+def get_conn(readonly=None):
+    """
+    取得資料庫連線。readonly=None 時依目前函式的 @read_only / @read_write 標示決定，
+    沒有設定 DB_REPLICA_CONFIG 時一律連 primary；DB_BACKEND = "sqlite" 時回傳 SQLite 連線。
+    """
+    if DB_BACKEND == "sqlite":
+        return sqlite_backend.connect()
+    if use_replica(readonly):
+        return mysql.connector.connect(**DB_REPLICA_CONFIG)
+    if readonly is None and _route.get() == "write":
+        mark_written()
     return mysql.connector.connect(**DB_CONFIG)
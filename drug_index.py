@@ -0,0 +1,180 @@
+import heapq
+import logging
+import math
+import threading
+import unicodedata
+from collections import defaultdict
+
+from database import get_conn, read_only
+
+# ========================
+# 💊 藥名模糊比對（字元 bigram 倒排索引）
+# ========================
+# OCR 辨識出的藥名常有錯字或多餘字元，以 drug_info.drug_name_zh 建立記憶體內的 bigram 倒排索引，
+# 查詢時只看與輸入有共同 bigram 的藥品，依 Dice 係數排序取前 k 名，不需要對資料庫做 LIKE 掃描。
+
+
+def normalize_drug_name(name):
+    """比對用的藥名：全形轉半形、去除空白、忽略大小寫。"""
+    return "".join(unicodedata.normalize("NFKC", name or "").split()).casefold()
+
+
+def _bigrams(normalized):
+    # 前後加上邊界符號，讓開頭與結尾的字也有權重，單字藥名也能比對
+    padded = f"\x02{normalized}\x03"
+    return {padded[i:i + 2] for i in range(len(padded) - 1)}
+
+
+class DrugNameIndex:
+
+    def __init__(self, entries):
+        """entries 為 (drug_id, drug_name_zh) 的序列。"""
+        self._ids = []
+        self._names = []
+        self._grams = []
+        self._exact = {}
+        self._postings = defaultdict(list)
+        for drug_id, name in entries:
+            normalized = normalize_drug_name(name)
+            if not normalized:
+                continue
+            slot = len(self._ids)
+            self._ids.append(drug_id)
+            self._names.append(name)
+            grams = _bigrams(normalized)
+            self._grams.append(frozenset(grams))
+            self._exact.setdefault(normalized, slot)
+            for gram in grams:
+                self._postings[gram].append(slot)
+
+    def __len__(self):
+        return len(self._ids)
+
+    def search(self, query, top_k=3, min_score=0.0):
+        """
+        回傳最相近的藥品 [(drug_id, drug_name_zh, 相似度)]，相似度介於 0 到 1，由高到低排序。
+        """
+        normalized = normalize_drug_name(query)
+        if not normalized:
+            return []
+        exact = self._exact.get(normalized)
+        if exact is not None and top_k == 1:
+            return [(self._ids[exact], self._names[exact], 1.0)]
+
+        query_grams = _bigrams(normalized)
+        query_size = len(query_grams)
+        postings = self._postings
+        all_grams = self._grams
+        # 前綴過濾：Dice ≥ threshold 的藥品至少要共有 required 個 bigram，
+        # 因此一定含有最罕見的 (query_size - required + 1) 個 bigram 之一。
+        # 由罕見到常見展開倒排列表，已找到 top_k 筆後以第 k 名的分數提高門檻，
+        # 「錠」、「糖漿」這類幾乎每筆都有的 bigram 通常不必展開。
+        probe = sorted(query_grams, key=lambda gram: len(postings.get(gram, ())))
+        threshold = min_score
+        best = []   # (score, slot) 的 min-heap，最多 top_k 筆
+        seen = set()
+        for position, gram in enumerate(probe):
+            required = max(1, math.ceil(threshold * query_size / (2 - threshold)))
+            if position > query_size - required:
+                break
+            for slot in postings.get(gram, ()):
+                if slot in seen:
+                    continue
+                seen.add(slot)
+                score = 2 * len(query_grams & all_grams[slot]) / (query_size + len(all_grams[slot]))
+                if score < min_score:
+                    continue
+                if len(best) < top_k:
+                    heapq.heappush(best, (score, slot))
+                elif score > best[0][0]:
+                    heapq.heapreplace(best, (score, slot))
+                if len(best) == top_k:
+                    threshold = max(min_score, best[0][0])
+        best.sort(reverse=True)
+        return [(self._ids[slot], self._names[slot], round(score, 4)) for score, slot in best]
+
+    def best_match(self, query, min_score=0.0):
+        """回傳最相近的一筆 (drug_id, drug_name_zh, 相似度)，沒有符合門檻的藥品時回傳 None。"""
+        results = self.search(query, top_k=1, min_score=min_score)
+        return results[0] if results else None
+
+
+@read_only
+def load_drug_entries():
+    """從 drug_info 讀取 (drug_id, drug_name_zh)；查詢失敗時回傳 None。"""
+    conn = None
+    cursor = None
+    try:
+        conn = get_conn()
+        cursor = conn.cursor(buffered=True)
+        cursor.execute("SELECT drug_id, drug_name_zh FROM drug_info WHERE drug_name_zh IS NOT NULL")
+        return cursor.fetchall()
+    except Exception as e:
+        logging.warning(f"WARN: 無法載入 drug_info 藥名索引: {e}")
+        return None
+    finally:
+        if cursor:
+            cursor.close()
+        if conn:
+            conn.close()
+
+
+@read_only
+def _drug_table_signature():
+    """drug_info 的變更指紋（筆數與最大 drug_id），用來判斷是否需要重建索引。"""
+    conn = None
+    cursor = None
+    try:
+        conn = get_conn()
+        cursor = conn.cursor(buffered=True)
+        cursor.execute("SELECT COUNT(*), MAX(drug_id) FROM drug_info")
+        return tuple(cursor.fetchone())
+    except Exception as e:
+        logging.warning(f"WARN: 無法檢查 drug_info 是否異動: {e}")
+        return None
+    finally:
+        if cursor:
+            cursor.close()
+        if conn:
+            conn.close()
+
+
+_index = None
+_index_signature = None
+_index_lock = threading.Lock()
+
+
+def get_drug_index():
+    """取得共用的藥名索引，第一次呼叫時建立；資料庫不可用時回傳空索引。"""
+    if _index is None:
+        refresh_drug_index(force=True)
+    return _index
+
+
+def refresh_drug_index(force=False):
+    """
+    drug_info 有異動（或 force=True）時重建索引。
+    排程會定期呼叫；修改 drug_info 的程式也可以直接呼叫 refresh_drug_index(force=True)。
+    """
+    global _index, _index_signature
+    with _index_lock:
+        signature = _drug_table_signature()
+        if not force and _index is not None and signature == _index_signature:
+            return _index
+        entries = load_drug_entries()
+        if entries is None:
+            if _index is None:
+                _index = DrugNameIndex([])
+            return _index
+        _index = DrugNameIndex(entries)
+        _index_signature = signature
+        logging.info(f"💊 藥名索引已重建，共 {len(_index)} 筆")
+        return _index
+
+
+def match_drug_name(ocr_name, min_score):
+    """
+    以索引找出 OCR 藥名最可能對應的 drug_info 藥品。
+    回傳 (drug_id, drug_name_zh, 相似度) 或 None。
+    """
+    return get_drug_index().best_match(ocr_name, min_score=min_score)
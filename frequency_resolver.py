@@ -0,0 +1,249 @@
+import functools
+import logging
+import sqlite3
+import threading
+from collections import deque
+from datetime import time, timedelta
+from time import monotonic
+
+import sqlite_backend
+from config import FREQUENCY_RESOLVER_RETRY_SECONDS
+from database import get_conn, read_only
+
+# ========================
+# 用藥頻率文字 → 頻率代碼 / 建議服藥時間
+# ========================
+# 同義詞與建議時間來自資料庫 frequency_synonym、frequency_code 與 suggested_dosage_time，
+# 啟動時編譯成 Aho-Corasick 多字串比對器，解析只需對頻率文字做一次線性掃描。
+# 新增說法只要在 frequency_synonym 加一列，不需要改程式。
+
+# 內建的同義詞（0002_frequency_synonym）、頻率代碼與建議時間（0009_frequency_code_seed）只定義在 migrations，
+# 資料庫無法連線或離線基準測試時由 load_seed_tables 從 migrations 讀出。
+# frequency_code 表中的正式名稱也視為同義詞，但排在明確設定的同義詞之後
+DEFAULT_NAME_PRIORITY = 1000
+
+
+class PhraseMatcher:
+    """
+    Aho-Corasick 多字串比對器。以 casefold 後的文字比對，
+    find_all 一次掃描即回傳所有命中的 (起點, 長度, 值)。
+    """
+
+    def __init__(self, phrases):
+        self._goto = [{}]
+        self._fail = [0]
+        self._output = [[]]
+        for phrase, value in phrases:
+            self._add(phrase.casefold(), value)
+        self._build_fail_links()
+
+    def _add(self, phrase, value):
+        if not phrase:
+            return
+        state = 0
+        for ch in phrase:
+            nxt = self._goto[state].get(ch)
+            if nxt is None:
+                nxt = len(self._goto)
+                self._goto[state][ch] = nxt
+                self._goto.append({})
+                self._fail.append(0)
+                self._output.append([])
+            state = nxt
+        self._output[state].append((len(phrase), value))
+
+    def _build_fail_links(self):
+        queue = deque(self._goto[0].values())
+        while queue:
+            state = queue.popleft()
+            for ch, nxt in self._goto[state].items():
+                queue.append(nxt)
+                fallback = self._fail[state]
+                while fallback and ch not in self._goto[fallback]:
+                    fallback = self._fail[fallback]
+                target = self._goto[fallback].get(ch, 0)
+                self._fail[nxt] = target if target != nxt else 0
+                # 合併失敗鏈上的輸出，掃描時不必再沿鏈回溯
+                self._output[nxt] = self._output[nxt] + self._output[self._fail[nxt]]
+
+    def find_all(self, text):
+        goto, fail, output = self._goto, self._fail, self._output
+        state = 0
+        matches = []
+        for end, ch in enumerate(text.casefold(), 1):
+            while state and ch not in goto[state]:
+                state = fail[state]
+            state = goto[state].get(ch, 0)
+            for length, value in output[state]:
+                matches.append((end - length, length, value))
+        return matches
+
+
+def _format_time_slot(value):
+    """MySQL TIME 欄位可能回傳 timedelta 或 time，統一轉為 HH:MM。"""
+    if isinstance(value, timedelta):
+        minutes = int(value.total_seconds()) // 60
+        return f"{minutes // 60:02d}:{minutes % 60:02d}"
+    if isinstance(value, time):
+        return value.strftime("%H:%M")
+    return str(value)[:5]
+
+
+class FrequencyResolver:
+    """將用藥頻率文字解析為頻率代碼與建議服藥時間。"""
+
+    def __init__(self, synonyms, suggested_times):
+        # 同一片語重複設定時保留優先序較高（數字較小）者
+        best = {}
+        for phrase, code, priority in synonyms:
+            key = phrase.strip().casefold()
+            if key and (key not in best or priority < best[key][1]):
+                best[key] = (code, priority)
+        self._matcher = PhraseMatcher((phrase, value) for phrase, value in best.items())
+        self._suggested_times = {code: list(times) for code, times in suggested_times.items()}
+
+    def resolve_code(self, frequency_text):
+        """
+        回傳頻率文字對應的 frequency_code，比對不到時回傳 None。
+        多個片語命中時依序比較：優先序、出現位置（越前面越好）、片語長度（越長越好）。
+        """
+        if not frequency_text:
+            return None
+        matches = self._matcher.find_all(frequency_text.strip())
+        if not matches:
+            return None
+        start, length, (code, priority) = min(matches, key=lambda m: (m[2][1], m[0], -m[1]))
+        return code
+
+    def times_for_code(self, frequency_code):
+        return list(self._suggested_times.get(frequency_code, []))
+
+    def resolve_times(self, frequency_text):
+        code = self.resolve_code(frequency_text)
+        return self.times_for_code(code) if code else []
+
+
+def _read_frequency_tables(cursor):
+    cursor.execute("SELECT phrase, frequency_code, priority FROM frequency_synonym")
+    synonyms = [(phrase, code, int(priority)) for phrase, code, priority in cursor.fetchall()]
+    cursor.execute("SELECT frequency_code, frequency_name FROM frequency_code")
+    synonyms += [(name, code, DEFAULT_NAME_PRIORITY) for code, name in cursor.fetchall() if name]
+    cursor.execute("""
+        SELECT frequency_code, time_slot_1, time_slot_2, time_slot_3, time_slot_4
+        FROM suggested_dosage_time
+    """)
+    suggested_times = {
+        code: [_format_time_slot(slot) for slot in slots if slot is not None]
+        for code, *slots in cursor.fetchall()
+    }
+    return synonyms, suggested_times
+
+
+@read_only
+def load_frequency_tables():
+    """
+    從資料庫讀取同義詞與建議時間。
+    回傳 (synonyms, suggested_times)；查詢失敗時回傳 None。
+    """
+    conn = None
+    cursor = None
+    try:
+        conn = get_conn()
+        cursor = conn.cursor(buffered=True)
+        return _read_frequency_tables(cursor)
+    except Exception as e:
+        logging.warning(f"WARN: 無法載入頻率同義詞表，改用 migrations 內建資料: {e}")
+        return None
+    finally:
+        if cursor:
+            cursor.close()
+        if conn:
+            conn.close()
+
+
+@functools.lru_cache(maxsize=1)
+def load_seed_tables():
+    """
+    migrations 內建的同義詞與建議時間：把 SQLite 版 migrations 套用到記憶體資料庫後讀出。
+    回傳格式與 load_frequency_tables 相同。
+    """
+    from migrate import discover_migrations, split_statements
+
+    db = sqlite3.connect(":memory:", detect_types=sqlite3.PARSE_DECLTYPES)
+    try:
+        for _, _, up_path, _ in discover_migrations(dialect="sqlite"):
+            with open(up_path, encoding="utf-8") as f:
+                for statement in split_statements(f.read()):
+                    db.execute(sqlite_backend.translate(statement))
+        return _read_frequency_tables(db.cursor())
+    finally:
+        db.close()
+
+
+# 共用的解析器；_retry_at 不為 None 表示目前是資料庫讀取失敗後的內建資料，到時間後重新從資料庫載入
+_resolver = None
+_retry_at = None
+_resolver_lock = threading.Lock()
+
+
+def _build(use_database):
+    """回傳 (解析器, 是否因資料庫讀不到而改用內建資料)。"""
+    seed_synonyms, seed_times = load_seed_tables()
+    tables = load_frequency_tables() if use_database else None
+    if not tables or not tables[0]:
+        if use_database:
+            logging.warning(f"WARN: 頻率解析器改用 migrations 內建資料，{FREQUENCY_RESOLVER_RETRY_SECONDS} 秒後重新從資料庫載入")
+        return FrequencyResolver(seed_synonyms, seed_times), use_database
+    synonyms, suggested_times = tables
+    # 資料庫沒有設定建議時間的代碼沿用內建時間
+    merged_times = dict(seed_times)
+    merged_times.update(suggested_times)
+    return FrequencyResolver(synonyms, merged_times), False
+
+
+def build_frequency_resolver(use_database=True):
+    """
+    依資料庫內容編譯新的解析器；資料庫不可用或沒有同義詞時使用 migrations 內建資料。
+    use_database=False 時直接使用內建資料（離線基準測試用）。
+    """
+    return _build(use_database)[0]
+
+
+def _install(use_database):
+    global _resolver, _retry_at
+    _resolver, fell_back = _build(use_database)
+    _retry_at = monotonic() + FREQUENCY_RESOLVER_RETRY_SECONDS if fell_back else None
+    return _resolver
+
+
+def get_frequency_resolver():
+    """
+    取得共用的解析器，第一次呼叫時編譯。
+    資料庫讀取失敗時先用內建資料，FREQUENCY_RESOLVER_RETRY_SECONDS 後的呼叫再重新從資料庫載入；
+    重新載入期間其他執行緒繼續使用目前的解析器。
+    """
+    resolver = _resolver
+    if resolver is not None and (_retry_at is None or monotonic() < _retry_at):
+        return resolver
+    if not _resolver_lock.acquire(blocking=resolver is None):
+        return resolver
+    try:
+        if _resolver is None or (_retry_at is not None and monotonic() >= _retry_at):
+            _install(use_database=True)
+        return _resolver
+    finally:
+        _resolver_lock.release()
+
+
+def reload_frequency_resolver(use_database=True):
+    """同義詞或建議時間異動後重新編譯。"""
+    with _resolver_lock:
+        return _install(use_database)
+
+
+def resolve_frequency_code(frequency_text):
+    return get_frequency_resolver().resolve_code(frequency_text)
+
+
+def resolve_frequency_times(frequency_text):
+    return get_frequency_resolver().resolve_times(frequency_text)
@@ -0,0 +1,189 @@
+import contextvars
+import hashlib
+import logging
+import os
+import tempfile
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+from linebot.models import TextSendMessage, QuickReply, QuickReplyButton, MessageAction
+
+from config import OCR_SPOOL_DIR, OCR_MAX_IMAGE_BYTES, OCR_PIPELINE_WORKERS, DRUG_MATCH_MIN_SCORE
+from drug_index import match_drug_name
+from models import get_temp_state, set_temp_state
+from ocr_engine import get_ocr_pool, OcrQueueFull, OcrTimeout
+from ocr_cache import ocr_cache
+from medication_ocr_parser import parse_medication_order
+
+logging.basicConfig(level=logging.INFO)
+
+CONTENT_CHUNK_SIZE = 64 * 1024
+
+# 下載、等待 OCR 與推播結果都在這裡執行；同時處理的張數決定了記憶體上限
+_pipeline_executor = ThreadPoolExecutor(max_workers=OCR_PIPELINE_WORKERS, thread_name_prefix="image-pipeline")
+
+
+# 多張照片同時辨識完成時，避免累積結果互相覆蓋
+_state_lock = threading.Lock()
+
+
+class ImageTooLarge(Exception):
+    pass
+
+
+def handle_image_message(event, line_bot_api):
+    """
+    收到藥袋照片：立即回覆「辨識中」，其餘工作交給背景執行緒，完成後再推播結果。
+    """
+    line_user_id = event.source.user_id
+    current_state = get_temp_state(line_user_id) or {}
+    member = current_state.get("member") or "本人"
+
+    line_bot_api.reply_message(event.reply_token, TextSendMessage(
+        text=f"📷 已收到「{member}」的藥袋照片，正在辨識中，完成後會通知您。"
+    ))
+    # 沿用本次請求的資料庫讀寫分流狀態，背景處理讀得到剛寫入的暫存狀態
+    _pipeline_executor.submit(contextvars.copy_context().run,
+                              _process_image, line_bot_api, line_user_id, event.message.id, member)
+
+
+def _spool_message_content(line_bot_api, message_id):
+    """
+    以串流方式把圖片內容分段寫入暫存檔，記憶體中最多只保留一個 chunk。
+    寫入時同時計算內容的 SHA-256 作為辨識結果快取的 key。
+    回傳 (暫存檔路徑, 雜湊值)，暫存檔由呼叫端負責刪除。
+    """
+    content = line_bot_api.get_message_content(message_id)
+    fd, path = tempfile.mkstemp(prefix="medbag-", suffix=".img", dir=OCR_SPOOL_DIR)
+    size = 0
+    digest = hashlib.sha256()
+    try:
+        with os.fdopen(fd, "wb") as f:
+            for chunk in content.iter_content(CONTENT_CHUNK_SIZE):
+                size += len(chunk)
+                if size > OCR_MAX_IMAGE_BYTES:
+                    raise ImageTooLarge(f"圖片超過 {OCR_MAX_IMAGE_BYTES} bytes")
+                digest.update(chunk)
+                f.write(chunk)
+    except Exception:
+        os.unlink(path)
+        raise
+    finally:
+        # 沒讀完就中斷（例如圖片過大）時要關閉回應，連線才會還給連線池
+        _close_content(content)
+    return path, digest.hexdigest()
+
+
+def _close_content(content):
+    # Content.response 是 RequestsHttpResponse，其 response 才是 requests.Response
+    response = getattr(content.response, "response", content.response)
+    close = getattr(response, "close", None)
+    if close:
+        close()
+
+
+def _remove_file(path):
+    try:
+        os.unlink(path)
+    except OSError as e:
+        logging.warning(f"⚠️ 無法刪除暫存圖片 {path}：{e}")
+
+
+def _recognize_image(line_bot_api, message_id):
+    """
+    回傳 (OCR 文字, 解析結果)。相同內容的照片直接取用快取，不再送進 OCR pool。
+    """
+    path, digest = _spool_message_content(line_bot_api, message_id)
+    cached = ocr_cache.get(digest)
+    if cached is not None:
+        _remove_file(path)
+        return cached
+
+    try:
+        future = get_ocr_pool().submit_file(path)
+    except Exception:
+        _remove_file(path)
+        raise
+    # worker 可能在逾時後仍在讀檔，等工作真正結束才刪除暫存檔
+    future.add_done_callback(lambda _: _remove_file(path))
+    ocr_text = get_ocr_pool().wait(future)
+    medications = parse_medication_order(ocr_text)
+    if medications:
+        ocr_cache.put(digest, ocr_text, medications)
+    return ocr_text, medications
+
+
+def _process_image(line_bot_api, line_user_id, message_id, member):
+    try:
+        ocr_text, medications = _recognize_image(line_bot_api, message_id)
+    except OcrQueueFull:
+        _push(line_bot_api, line_user_id, "⚠️ 目前辨識的照片較多，請稍後再上傳一次。")
+        return
+    except OcrTimeout:
+        _push(line_bot_api, line_user_id, "⚠️ 藥袋辨識逾時，請重新拍照或改用手動輸入。")
+        return
+    except ImageTooLarge:
+        _push(line_bot_api, line_user_id, "⚠️ 照片檔案過大，請縮小後再上傳。")
+        return
+    except Exception as e:
+        logging.error(f"❌ 藥袋照片處理失敗（message_id={message_id}）：{e}")
+        _push(line_bot_api, line_user_id, "❌ 藥袋辨識失敗，請稍後再試或改用手動輸入。")
+        return
+
+    if not medications:
+        _push(line_bot_api, line_user_id, "⚠️ 無法從照片中辨識出藥品資訊，請重新拍照或改用手動輸入。")
+        return
+
+    _match_drug_names(medications)
+    with _state_lock:
+        # 同一位用藥者在確認前連續上傳多張藥袋，辨識結果累積後一次匯入
+        current_state = get_temp_state(line_user_id) or {}
+        if current_state.get("state") == "AWAITING_OCR_CONFIRMATION" and current_state.get("member") == member:
+            medications = (current_state.get("ocr_medications") or []) + medications
+        set_temp_state(line_user_id, {
+            "state": "AWAITING_OCR_CONFIRMATION",
+            "member": member,
+            "ocr_medications": medications
+        })
+    _push(line_bot_api, line_user_id, create_ocr_result_message(member, medications))
+
+
+def _match_drug_names(medications):
+    """
+    把 OCR 藥名對應到 drug_info 中最相近的正式藥名；原始辨識結果保留在 ocr_name。
+    """
+    for med in medications:
+        match = match_drug_name(med["name"], DRUG_MATCH_MIN_SCORE)
+        if not match:
+            continue
+        drug_id, drug_name, score = match
+        med["drug_id"] = drug_id
+        if drug_name != med["name"]:
+            med["ocr_name"] = med["name"]
+            med["name"] = drug_name
+
+
+def create_ocr_result_message(member, medications):
+    lines = [f"📋 藥袋辨識結果（{member}）："]
+    for i, med in enumerate(medications, start=1):
+        times = "、".join(med.get("times") or []) or "未設定"
+        name = f"{med['name']}（辨識為「{med['ocr_name']}」）" if med.get("ocr_name") else med["name"]
+        lines.append(f"{i}. {name}｜劑量 {med['dosage']}｜{med['frequency_text']}（{times}）")
+    lines.append("\n如有其他藥袋可繼續拍照上傳；是否依此一次建立全部用藥提醒？")
+    return TextSendMessage(
+        text="\n".join(lines),
+        quick_reply=QuickReply(items=[
+            QuickReplyButton(action=MessageAction(label="是", text="是")),
+            QuickReplyButton(action=MessageAction(label="否", text="否"))
+        ])
+    )
+
+
+def _push(line_bot_api, line_user_id, message):
+    """推播辨識結果或提示文字（str 轉為 TextSendMessage）；失敗只記錄，不中斷背景工作。"""
+    if isinstance(message, str):
+        message = TextSendMessage(text=message)
+    try:
+        line_bot_api.push_message(line_user_id, message)
+    except Exception as e:
+        logging.error(f"❌ 推播藥袋辨識結果失敗：{e}")
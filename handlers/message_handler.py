@@ -16,7 +16,9 @@ from models import (
     get_medication_reminders_for_user,
     get_temp_state,
     get_family_bindings,
-    unbind_family 
+    unbind_family,
+    bulk_import_medications,
+    get_family_members
 )
 
 import re
@@ -26,7 +28,6 @@ from urllib.parse import quote, parse_qs
 from medication_reminder import (
     create_patient_selection_message, # 用於「新增用藥提醒」等需要選擇用藥者的入口
     create_medication_management_menu, # 用於「用藥管理」入口
-    handle_ocr_recognition_result, # 處理 OCR 結果
     handle_medication_record_command, # 處理用藥記錄的起始指令
     handle_medication_record_member_selected,
     handle_medication_record_date_selected,
@@ -35,8 +36,6 @@ from medication_reminder import (
     handle_medication_record_time_selected
 )
 
-from database import get_conn # 確保導入 get_conn
-
 def create_usage_instructions_message():
     instructions = """
     「用藥提醒小幫手」功能說明：
@@ -159,9 +158,26 @@ def handle_text_message(event, line_bot_api):
         return
 
 
-    # 處理 OCR 辨識結果的訊息 (假設這是在圖片訊息後傳送的文本)
+    # 處理 OCR 辨識結果的確認 (handlers.image_handler 推播辨識結果後)
     elif state == "AWAITING_OCR_CONFIRMATION" and message_text in ["是", "否"]:
-        handle_ocr_recognition_result(reply_token, line_user_id, message_text, line_bot_api)
+        if message_text == "否":
+            clear_temp_state(line_user_id)
+            line_bot_api.reply_message(reply_token, TextSendMessage(text="好的，已取消本次辨識結果。您可以重新拍照或改用手動輸入。"))
+            return
+        member = current_state.get("member") or "本人"
+        try:
+            summary = bulk_import_medications(line_user_id, member, current_state.get("ocr_medications") or [])
+        except Exception as e:
+            print(f"Error importing OCR medications: {e}")
+            line_bot_api.reply_message(reply_token, TextSendMessage(text="❗ 匯入藥袋資料時發生錯誤，請稍後再試。"))
+            return
+        clear_temp_state(line_user_id)
+        lines = [f"✅ 已為「{member}」匯入 {summary['inserted']} 筆藥品，新增 {summary['reminders_added']} 個提醒時段。"]
+        if summary["duplicates"]:
+            lines.append(f"已略過 {summary['duplicates']} 筆重複的藥品。")
+        if summary["unresolved"]:
+            lines.append(f"以下藥品無法辨識服用頻率，請手動設定提醒：{'、'.join(summary['unresolved'])}")
+        line_bot_api.reply_message(reply_token, TextSendMessage(text="\n".join(lines)))
         return
 
     # 處理「用藥記錄」相關的文字輸入
@@ -342,41 +358,19 @@ def handle_invite_code_request(reply_token, line_user_id, line_bot_api):
 
 # 這是 create_patient_selection_for_reminders_view 的實現，用於「查看提醒」
 def create_patient_selection_for_reminders_view(line_id):
-    conn = get_conn()
-    if not conn:
-        return TextSendMessage(text="抱歉，無法連接到使用者資料庫。")
-    items = []
-    try:
-        cursor = conn.cursor(dictionary=True)
-        # 修改點：users 表格的 primary key 是 recorder_id，所以直接用 line_id 查詢
-        cursor.execute("SELECT recorder_id FROM users WHERE recorder_id = %s", (line_id,))
-        user = cursor.fetchone()
-        if not user:
-            return TextSendMessage(text="找不到您的使用者資料。")
-        recorder_id_for_db = user['recorder_id'] # 使用 recorder_id
-
-        # 修改點：patient 表格是 recorder_id 和 member
-        cursor.execute("SELECT member FROM patients WHERE recorder_id = %s ORDER BY member", (recorder_id_for_db,))
-        existing_patients = cursor.fetchall()
-
-        if not existing_patients:
-            return TextSendMessage(text="您目前沒有任何用藥對象可以查看提醒。")
-
-        for patient in existing_patients:
-            items.append(
-                QuickReplyButton(
-                    action=PostbackAction(
-                        label=f"查看「{patient['member']}」",
-                        data=f"action=show_reminders_for_member&member={quote(patient['member'])}", # 修改 action data
-                        display_text=f"查看「{patient['member']}」的提醒"
-                    )
-                )
+    # 名單來自 models 的用藥者快取，不需查詢資料庫
+    existing_patients = sorted(get_family_members(line_id))
+    if not existing_patients:
+        return TextSendMessage(text="您目前沒有任何用藥對象可以查看提醒。")
+
+    items = [
+        QuickReplyButton(
+            action=PostbackAction(
+                label=f"查看「{member}」",
+                data=f"action=show_reminders_for_member&member={quote(member)}",
+                display_text=f"查看「{member}」的提醒"
             )
-        return TextSendMessage(text="請選擇您想查看提醒的家人：", quick_reply=QuickReply(items=items))
-
-    except Exception as e:
-        print(f"Error in create_patient_selection_for_reminders_view: {e}")
-        return TextSendMessage(text="抱歉，在讀取用藥者資訊時發生錯誤。")
-    finally:
-        if conn and conn.is_connected():
-            conn.close()
\ No newline at end of file
+        )
+        for member in existing_patients
+    ]
+    return TextSendMessage(text="請選擇您想查看提醒的家人：", quick_reply=QuickReply(items=items))
@@ -0,0 +1,308 @@
+import logging
+import time
+from datetime import date
+
+from database import get_conn
+from ocr_cache import ocr_cache
+from config import (
+    HOUSEKEEPING_BATCH_SIZE, HOUSEKEEPING_PAUSE_SECONDS, HOUSEKEEPING_MAX_SECONDS,
+    INVITE_CODE_RETENTION_DAYS, TEMP_STATE_RETENTION_HOURS, MEDICATION_HISTORY_RETENTION_DAYS,
+    COURSE_ARCHIVE_GRACE_DAYS, DB_BACKEND, DOSE_LOG_PARTITION_MONTHS_AHEAD, DOSE_LOG_RETENTION_MONTHS
+)
+
+logging.basicConfig(level=logging.INFO)
+
+# ------------------------------------------------------------
+# 清理工作：(名稱, DELETE 語句, 參數)
+# 每個語句最後都以 LIMIT %s 限制單批筆數，避免長時間鎖表
+# ------------------------------------------------------------
+HOUSEKEEPING_JOBS = [
+    (
+        # 療程全部結束並已封存的頻率（見 archive_finished_courses），提醒時段一併刪除；
+        # 從未有藥品記錄的提醒不受影響
+        "finished_reminder_times",
+        """
+        DELETE FROM reminder_time
+        WHERE NOT EXISTS (
+              SELECT 1
+              FROM frequency_code fc
+              JOIN medication_record mr ON mr.frequency_count_code = fc.frequency_code
+              WHERE fc.frequency_name = reminder_time.frequency_name
+                AND mr.recorder_id = reminder_time.recorder_id
+                AND mr.member = reminder_time.member
+          )
+          AND EXISTS (
+              SELECT 1
+              FROM frequency_code fc
+              JOIN medication_record_archive a ON a.frequency_count_code = fc.frequency_code
+              WHERE fc.frequency_name = reminder_time.frequency_name
+                AND a.recorder_id = reminder_time.recorder_id
+                AND a.member = reminder_time.member
+          )
+        LIMIT %s
+        """,
+        (),
+    ),
+    (
+        "expired_invite_codes",
+        """
+        DELETE FROM invite_codes
+        WHERE expires_at < NOW() - INTERVAL %s DAY
+        LIMIT %s
+        """,
+        (INVITE_CODE_RETENTION_DAYS,),
+    ),
+    (
+        "stale_temp_states",
+        """
+        DELETE FROM user_temp_state
+        WHERE updated_at < NOW() - INTERVAL %s HOUR
+        LIMIT %s
+        """,
+        (TEMP_STATE_RETENTION_HOURS,),
+    ),
+    (
+        # 只刪除已經沒有對應提醒時段的舊藥品記錄，仍在提醒中的藥品不受影響
+        "aged_medication_records",
+        """
+        DELETE FROM medication_record
+        WHERE created_at < NOW() - INTERVAL %s DAY
+          AND NOT EXISTS (
+              SELECT 1
+              FROM reminder_time rt
+              JOIN frequency_code fc ON fc.frequency_name = rt.frequency_name
+              WHERE rt.recorder_id = medication_record.recorder_id
+                AND rt.member = medication_record.member
+                AND fc.frequency_code = medication_record.frequency_count_code
+          )
+        LIMIT %s
+        """,
+        (MEDICATION_HISTORY_RETENTION_DAYS,),
+    ),
+    (
+        # 封存的藥品記錄仍指向原本的看診資料，兩邊都沒有引用時才刪除
+        "orphan_medication_mains",
+        """
+        DELETE FROM medication_main
+        WHERE visit_date < CURDATE() - INTERVAL %s DAY
+          AND NOT EXISTS (
+              SELECT 1 FROM medication_record mr WHERE mr.mm_id = medication_main.mm_id
+          )
+          AND NOT EXISTS (
+              SELECT 1 FROM medication_record_archive a WHERE a.mm_id = medication_main.mm_id
+          )
+        LIMIT %s
+        """,
+        (MEDICATION_HISTORY_RETENTION_DAYS,),
+    ),
+]
+
+
+def _run_job(conn, sql, params, batch_size, pause_seconds, deadline):
+    """
+    分批執行單一清理工作，直到沒有資料可刪或超過時間上限。
+    每批之間至少休息 pause_seconds，且不少於該批耗時，讓清理最多佔用一半的資料庫時間。
+    """
+    cursor = conn.cursor()
+    started = time.monotonic()
+    removed = 0
+    batches = 0
+    try:
+        while time.monotonic() < deadline:
+            batch_started = time.monotonic()
+            cursor.execute(sql, (*params, batch_size))
+            conn.commit()
+            batches += 1
+            removed += cursor.rowcount
+            if cursor.rowcount < batch_size:
+                break
+            time.sleep(max(pause_seconds, time.monotonic() - batch_started))
+    finally:
+        cursor.close()
+    return {"rows": removed, "batches": batches, "seconds": round(time.monotonic() - started, 3)}
+
+
+# ------------------------------------------------------------
+# 療程封存：course_end_date 超過 grace_days 天的藥品記錄搬到 medication_record_archive
+# 每批先取出 mr_id，再以同一批 mr_id 複製與刪除，兩個語句在同一個交易內
+# ------------------------------------------------------------
+_ARCHIVE_COLUMNS = (
+    "mr_id, mm_id, recorder_id, member, drug_name_zh, frequency_count_code, frequency_name, "
+    "source_detail, dose_quantity, dosage_unit, days, course_end_date, created_at"
+)
+
+
+def archive_finished_courses(conn, batch_size, pause_seconds, deadline, grace_days=COURSE_ARCHIVE_GRACE_DAYS):
+    """分批封存已結束的療程，回傳與 _run_job 相同格式的統計。"""
+    cursor = conn.cursor()
+    started = time.monotonic()
+    archived = 0
+    batches = 0
+    try:
+        while time.monotonic() < deadline:
+            batch_started = time.monotonic()
+            cursor.execute("""
+                SELECT mr_id FROM medication_record
+                WHERE course_end_date < CURDATE() - INTERVAL %s DAY
+                ORDER BY course_end_date
+                LIMIT %s
+            """, (grace_days, batch_size))
+            mr_ids = [row[0] for row in cursor.fetchall()]
+            if not mr_ids:
+                break
+            placeholders = ", ".join(["%s"] * len(mr_ids))
+            cursor.execute(f"""
+                INSERT IGNORE INTO medication_record_archive ({_ARCHIVE_COLUMNS})
+                SELECT {_ARCHIVE_COLUMNS} FROM medication_record WHERE mr_id IN ({placeholders})
+            """, mr_ids)
+            cursor.execute(f"DELETE FROM medication_record WHERE mr_id IN ({placeholders})", mr_ids)
+            conn.commit()
+            batches += 1
+            archived += len(mr_ids)
+            if len(mr_ids) < batch_size:
+                break
+            time.sleep(max(pause_seconds, time.monotonic() - batch_started))
+    finally:
+        cursor.close()
+    return {"rows": archived, "batches": batches, "seconds": round(time.monotonic() - started, 3)}
+
+
+# ------------------------------------------------------------
+# 服藥紀錄分區：dose_log 依 scheduled_date 按月分區（見 migrations/0004_dose_log.up.sql）
+# 由 p_future 切出到未來 months_ahead 個月的分區；超過保留月數的分區整個 DROP，不必逐筆刪除。
+# 第一次執行時另外切出 p_history（本月之前）；p_history 中若有資料（例如舊版 migration 寫死的邊界晚於資料月份），
+# 依月份切成獨立分區，讓保留期限能按月刪除。
+# ------------------------------------------------------------
+
+def _add_months(day, months):
+    """day 所在月份加 months 個月後的月初。"""
+    index = day.year * 12 + day.month - 1 + months
+    return date(index // 12, index % 12 + 1, 1)
+
+
+def maintain_dose_log_partitions(conn, months_ahead=DOSE_LOG_PARTITION_MONTHS_AHEAD,
+                                 retention_months=DOSE_LOG_RETENTION_MONTHS, today=None):
+    """建立未來月份的分區、切分 p_history 並刪除過期分區，回傳 {"added": [...], "split": [...], "dropped": [...]}。"""
+    today = today or date.today()
+    cursor = conn.cursor()
+    try:
+        cursor.execute("""
+            SELECT PARTITION_NAME, PARTITION_DESCRIPTION
+            FROM information_schema.PARTITIONS
+            WHERE TABLE_SCHEMA = DATABASE() AND TABLE_NAME = 'dose_log' AND PARTITION_NAME IS NOT NULL
+        """)
+        bounds = {
+            name: date.fromisoformat(description.strip("'"))
+            for name, description in cursor.fetchall() if description != "MAXVALUE"
+        }
+
+        # p_history 中最早的資料到 p_history 上限之間，每個月切成一個分區
+        split = []
+        if "p_history" in bounds:
+            cursor.execute("SELECT MIN(scheduled_date) FROM dose_log PARTITION (p_history)")
+            earliest = cursor.fetchone()[0]
+            if earliest is not None:
+                history_upper = _add_months(earliest, 0)
+                lower = history_upper
+                while lower < bounds["p_history"]:
+                    upper = min(_add_months(lower, 1), bounds["p_history"])
+                    split.append((f"p{lower:%Y%m}", upper))
+                    lower = upper
+                partitions = ", ".join(f"PARTITION {name} VALUES LESS THAN ('{upper}')" for name, upper in split)
+                cursor.execute(
+                    f"ALTER TABLE dose_log REORGANIZE PARTITION p_history INTO "
+                    f"(PARTITION p_history VALUES LESS THAN ('{history_upper}'), {partitions})"
+                )
+                bounds.update(split, p_history=history_upper)
+
+        # 最後一個分區到本月之間若有空檔（例如久未執行），併成一個分區，名稱取上限的前一個月；
+        # 還沒有任何分區時先切出 p_history（本月之前）
+        added = []
+        lower = max(bounds.values(), default=_add_months(today, 0))
+        if not bounds:
+            added.append(("p_history", lower))
+        upper_limit = _add_months(today, months_ahead + 1)
+        while lower < upper_limit:
+            upper = max(_add_months(lower, 1), _add_months(today, 0))
+            added.append((f"p{_add_months(upper, -1):%Y%m}", upper))
+            lower = upper
+        if added:
+            partitions = ", ".join(f"PARTITION {name} VALUES LESS THAN ('{upper}')" for name, upper in added)
+            cursor.execute(
+                f"ALTER TABLE dose_log REORGANIZE PARTITION p_future INTO "
+                f"({partitions}, PARTITION p_future VALUES LESS THAN (MAXVALUE))"
+            )
+
+        dropped = []
+        if retention_months:
+            cutoff = _add_months(today, -retention_months)
+            dropped = sorted(name for name, upper in bounds.items() if upper <= cutoff)
+            if dropped:
+                cursor.execute(f"ALTER TABLE dose_log DROP PARTITION {', '.join(dropped)}")
+        return {"added": [name for name, _ in added], "split": [name for name, _ in split], "dropped": dropped}
+    finally:
+        cursor.close()
+
+
+def _run_dose_log_retention(conn, batch_size, pause_seconds, deadline):
+    if DB_BACKEND == "sqlite":
+        # SQLite 沒有分區，過期紀錄與其他清理工作一樣分批刪除
+        if not DOSE_LOG_RETENTION_MONTHS:
+            return {"rows": 0, "batches": 0, "seconds": 0.0}
+        cutoff = _add_months(date.today(), -DOSE_LOG_RETENTION_MONTHS)
+        return _run_job(conn, "DELETE FROM dose_log WHERE scheduled_date < %s LIMIT %s",
+                        (cutoff,), batch_size, pause_seconds, deadline)
+    return maintain_dose_log_partitions(conn)
+
+
+def run_housekeeping(batch_size=HOUSEKEEPING_BATCH_SIZE, pause_seconds=HOUSEKEEPING_PAUSE_SECONDS,
+                     max_seconds=HOUSEKEEPING_MAX_SECONDS):
+    """
+    依序執行所有清理工作，回傳每項工作的刪除筆數、批次數與耗時。
+    """
+    logging.info("🧹 開始執行資料清理")
+    deadline = time.monotonic() + max_seconds
+    report = {}
+    conn = get_conn()
+    if not conn:
+        logging.error("無法連接到資料庫，跳過資料清理。")
+        return report
+
+    try:
+        # 先封存結束的療程，finished_reminder_times 才看得到哪些提醒已經沒有藥品
+        try:
+            report["finished_courses"] = archive_finished_courses(conn, batch_size, pause_seconds, deadline)
+            stat = report["finished_courses"]
+            logging.info(f"🧹 finished_courses：封存 {stat['rows']} 筆（{stat['batches']} 批，{stat['seconds']} 秒）")
+        except Exception as e:
+            conn.rollback()
+            logging.error(f"❌ 療程封存失敗：{e}")
+        for name, sql, params in HOUSEKEEPING_JOBS:
+            if time.monotonic() >= deadline:
+                logging.warning(f"⏱️ 資料清理超過時間上限，略過 {name}")
+                break
+            try:
+                report[name] = _run_job(conn, sql, params, batch_size, pause_seconds, deadline)
+                stat = report[name]
+                logging.info(f"🧹 {name}：刪除 {stat['rows']} 筆（{stat['batches']} 批，{stat['seconds']} 秒）")
+            except Exception as e:
+                conn.rollback()
+                logging.error(f"❌ 清理工作 {name} 失敗：{e}")
+        try:
+            report["dose_log"] = _run_dose_log_retention(conn, batch_size, pause_seconds, deadline)
+            logging.info(f"🧹 dose_log：{report['dose_log']}")
+        except Exception as e:
+            conn.rollback()
+            logging.error(f"❌ 服藥紀錄分區維護失敗：{e}")
+    finally:
+        conn.close()
+
+    removed = ocr_cache.prune_disk()
+    if removed:
+        logging.info(f"🧹 ocr_cache_files：刪除 {removed} 個過期的 OCR 快取檔")
+    report["ocr_cache_files"] = {"rows": removed}
+    return report
+
+
+if __name__ == "__main__":
+    run_housekeeping()
@@ -0,0 +1,55 @@
+import hashlib
+import math
+import threading
+
+from config import KNOWN_USER_BLOOM_CAPACITY, KNOWN_USER_BLOOM_ERROR_RATE
+
+
+class BloomFilter:
+    """
+    固定大小的 Bloom filter，用於使用者數量很大時節省記憶體。
+    可能誤判「已存在」（機率約為 error_rate），但不會誤判「不存在」。
+    """
+
+    def __init__(self, capacity, error_rate=0.0001):
+        self.size = int(-capacity * math.log(error_rate) / (math.log(2) ** 2)) + 1
+        self.hash_count = max(1, round(self.size / capacity * math.log(2)))
+        self._bits = bytearray((self.size + 7) // 8)
+
+    def _positions(self, key):
+        digest = hashlib.blake2b(key.encode("utf-8"), digest_size=16).digest()
+        h1 = int.from_bytes(digest[:8], "little")
+        h2 = int.from_bytes(digest[8:], "little") | 1
+        for i in range(self.hash_count):
+            yield (h1 + i * h2) % self.size
+
+    def add(self, key):
+        for pos in self._positions(key):
+            self._bits[pos >> 3] |= 1 << (pos & 7)
+
+    def __contains__(self, key):
+        return all(self._bits[pos >> 3] & (1 << (pos & 7)) for pos in self._positions(key))
+
+
+class KnownUsers:
+    """
+    記錄已確認存在於 users 表的 recorder_id，讓每則訊息不必再查詢資料庫。
+    bloom_capacity 為 0 時使用精確集合，否則使用 Bloom filter。
+    """
+
+    def __init__(self, bloom_capacity=0, error_rate=0.0001):
+        self._lock = threading.Lock()
+        if bloom_capacity:
+            self._members = BloomFilter(bloom_capacity, error_rate)
+        else:
+            self._members = set()
+
+    def __contains__(self, recorder_id):
+        return recorder_id in self._members
+
+    def add(self, recorder_id):
+        with self._lock:
+            self._members.add(recorder_id)
+
+
+known_users = KnownUsers(KNOWN_USER_BLOOM_CAPACITY, KNOWN_USER_BLOOM_ERROR_RATE)
@@ -0,0 +1,277 @@
+import functools
+import logging
+import re
+import threading
+import time
+from contextlib import contextmanager
+from contextvars import ContextVar
+from urllib.parse import urlsplit
+
+import requests
+from requests.adapters import HTTPAdapter
+from linebot import LineBotApi
+from linebot.exceptions import LineBotApiError
+from linebot.http_client import RequestsHttpClient, RequestsHttpResponse
+
+from config import (
+    CHANNEL_ACCESS_TOKEN, LINE_API_CONNECT_TIMEOUT, LINE_API_READ_TIMEOUT,
+    LINE_API_POOL_SIZE, LINE_API_SLOW_CALL_MS
+)
+
+# 路徑中的 LINE ID / 訊息 ID 會被替換成 {id}，讓延遲統計依端點彙總
+_ID_SEGMENT = re.compile(r"^(?:[UCR][0-9a-f]{32}|\d+|[A-Za-z0-9_-]{20,})$")
+
+
+def _endpoint_key(method, url):
+    path = urlsplit(url).path
+    segments = ["{id}" if _ID_SEGMENT.match(seg) else seg for seg in path.split("/")]
+    return f"{method} {'/'.join(segments)}"
+
+
+class LineApiMetrics:
+    """
+    以端點為單位累計 LINE API 呼叫次數、錯誤數與延遲（毫秒）。
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._stats = {}
+
+    def record(self, endpoint, elapsed_ms, ok):
+        with self._lock:
+            stat = self._stats.setdefault(endpoint, {"calls": 0, "errors": 0, "total_ms": 0.0, "max_ms": 0.0})
+            stat["calls"] += 1
+            stat["total_ms"] += elapsed_ms
+            stat["max_ms"] = max(stat["max_ms"], elapsed_ms)
+            if not ok:
+                stat["errors"] += 1
+
+    def snapshot(self):
+        with self._lock:
+            return {
+                endpoint: {
+                    **stat,
+                    "avg_ms": round(stat["total_ms"] / stat["calls"], 1) if stat["calls"] else 0.0,
+                }
+                for endpoint, stat in self._stats.items()
+            }
+
+
+line_api_metrics = LineApiMetrics()
+
+
+class PooledRequestsHttpClient(RequestsHttpClient):
+    """
+    以共用 requests.Session 實作的 HttpClient：
+    keep-alive 連線池讓 webhook 與排程執行緒重複使用已建立的 TLS 連線，
+    並固定套用 (connect, read) 逾時，避免 LINE 端點緩慢時卡住執行緒。
+    """
+
+    def __init__(self, timeout=(LINE_API_CONNECT_TIMEOUT, LINE_API_READ_TIMEOUT)):
+        super().__init__(timeout)
+        self.session = requests.Session()
+        # 不自動重試：push / reply 重送可能造成使用者收到重複訊息
+        adapter = HTTPAdapter(pool_connections=2, pool_maxsize=LINE_API_POOL_SIZE, max_retries=0)
+        self.session.mount("https://", adapter)
+
+    def _request(self, method, url, timeout=None, **kwargs):
+        if timeout is None:
+            timeout = self.timeout
+        endpoint = _endpoint_key(method, url)
+        started = time.perf_counter()
+        ok = False
+        try:
+            response = self.session.request(method, url, timeout=timeout, **kwargs)
+            ok = response.status_code < 400
+            return RequestsHttpResponse(response)
+        finally:
+            elapsed_ms = (time.perf_counter() - started) * 1000
+            line_api_metrics.record(endpoint, elapsed_ms, ok)
+            if elapsed_ms > LINE_API_SLOW_CALL_MS:
+                logging.warning(f"⚠️ LINE API 回應緩慢：{endpoint} {elapsed_ms:.0f} ms")
+
+    def get(self, url, headers=None, params=None, stream=False, timeout=None):
+        return self._request("GET", url, timeout=timeout, headers=headers, params=params, stream=stream)
+
+    def post(self, url, headers=None, data=None, timeout=None):
+        return self._request("POST", url, timeout=timeout, headers=headers, data=data)
+
+    def delete(self, url, headers=None, data=None, timeout=None):
+        return self._request("DELETE", url, timeout=timeout, headers=headers, data=data)
+
+    def put(self, url, headers=None, data=None, timeout=None):
+        return self._request("PUT", url, timeout=timeout, headers=headers, data=data)
+
+
+# ------------------------------------------------------------
+# 事件訊息合併：同一個 webhook 事件送給事件使用者的 reply 與 push 併成一次 reply
+# ------------------------------------------------------------
+# 許多流程先 reply 再立刻 push 給同一位使用者（例如「綁定 CODE」的提示 + 確認視窗），
+# push 會計入每月訊息額度，也多一次 API 往返。事件處理函式以 @collect_event_messages 標示後，
+# 處理期間送給事件使用者的訊息先暫存，結束時以一次 reply 送出（一次最多 5 則），
+# 超過 5 則或 reply token 已失效時，其餘訊息才改用 push；
+# reply 因其他原因失敗（逾時、5xx）時訊息可能已經送達，不再以 push 重送。
+# notification_disabled / timeout 隨訊息保留，一次呼叫只送出選項相同的訊息；
+# 只有 push 才有的選項（retry_key、custom_aggregation_units）不合併，照常立即送出。
+# 送給其他使用者的 push（例如通知邀請人）照常立即送出。
+# collector 放在 contextvar：以 contextvars.copy_context().run 交給背景執行緒的工作，
+# 在事件結束（collector 已送出）之後的 push 也會照常立即送出。
+
+MAX_MESSAGES_PER_CALL = 5
+_COLLECTABLE_KWARGS = {"notification_disabled", "timeout"}
+
+_collector = ContextVar("line_outbound_collector", default=None)
+
+
+class OutboundCollector:
+    """一個 webhook 事件要送給事件使用者的訊息。"""
+
+    def __init__(self, user_id, reply_token):
+        self.user_id = user_id
+        self.reply_token = reply_token
+        self.messages = []
+        self.merged_pushes = 0
+        self.closed = False
+        self._lock = threading.Lock()
+
+    def offer(self, messages, reply_token=None, to=None, **options):
+        """符合本事件（同一個 reply token 或同一位使用者）且尚未送出時收下訊息，回傳是否收下。"""
+        with self._lock:
+            if self.closed or not self.reply_token or not self.user_id:
+                return False
+            if reply_token is not None and reply_token != self.reply_token:
+                return False
+            if to is not None and to != self.user_id:
+                return False
+            options = tuple(sorted(options.items()))
+            for message in (messages if isinstance(messages, (list, tuple)) else [messages]):
+                self.messages.append((message, options))
+            if to is not None:
+                self.merged_pushes += 1
+            return True
+
+    def flush(self, api):
+        """
+        以一次 reply 送出暫存的訊息（開頭選項相同的最多 5 則）；
+        其餘訊息，或 reply token 失效時的全部訊息，依選項分組改用 push。
+        """
+        with self._lock:
+            self.closed = True
+            queued, self.messages = self.messages, []
+        if not queued:
+            return
+        options = queued[0][1]
+        count = 0
+        while count < min(len(queued), MAX_MESSAGES_PER_CALL) and queued[count][1] == options:
+            count += 1
+        pending = queued[count:]
+        try:
+            api.reply_message(self.reply_token, [m for m, _ in queued[:count]], **dict(options))
+        except LineBotApiError as e:
+            if not _is_reply_token_error(e):
+                raise
+            logging.warning(f"⚠️ reply token 已失效，改以 push 送出 {len(queued)} 則訊息")
+            pending = queued
+        finally:
+            if self.merged_pushes:
+                logging.info(f"📨 {self.user_id}：{self.merged_pushes} 次 push 併入 reply")
+            self._push(api, pending)
+
+    def _push(self, api, queued):
+        batch, batch_options = [], None
+        for message, options in queued + [(None, None)]:
+            if batch and (options != batch_options or len(batch) == MAX_MESSAGES_PER_CALL):
+                api.push_message(self.user_id, batch, **dict(batch_options))
+                batch = []
+            batch_options = options
+            if message is not None:
+                batch.append(message)
+
+
+def _is_reply_token_error(error):
+    """reply token 無效或過期時 LINE 回傳 400 "Invalid reply token"；其他錯誤時訊息可能已送達。"""
+    message = getattr(error.error, "message", "") or ""
+    return error.status_code == 400 and "reply token" in message.lower()
+
+
+class CollectingLineBotApi:
+    """
+    LineBotApi 包裝：事件處理中送給事件使用者的 reply / push 交給目前的 OutboundCollector，
+    其餘呼叫（排程推播、送給其他人的 push、取得圖片內容…）直接交給 LineBotApi。
+    """
+
+    def __init__(self, api):
+        self.api = api
+
+    def reply_message(self, reply_token, messages, **kwargs):
+        collector = _collector.get()
+        if collector and kwargs.keys() <= _COLLECTABLE_KWARGS and collector.offer(
+                messages, reply_token=reply_token, **kwargs):
+            return
+        self.api.reply_message(reply_token, messages, **kwargs)
+
+    def push_message(self, to, messages, **kwargs):
+        collector = _collector.get()
+        if collector and kwargs.keys() <= _COLLECTABLE_KWARGS and collector.offer(messages, to=to, **kwargs):
+            return
+        self.api.push_message(to, messages, **kwargs)
+
+    def __getattr__(self, name):
+        return getattr(self.api, name)
+
+
+@contextmanager
+def collect_outbound(user_id, reply_token):
+    """在 with 區塊內收集送給 user_id 的訊息，離開時以 reply_token 一次送出。"""
+    collector = OutboundCollector(user_id, reply_token)
+    token = _collector.set(collector)
+    try:
+        yield collector
+    finally:
+        _collector.reset(token)
+        try:
+            collector.flush(get_line_bot_api().api)
+        except LineBotApiError as e:
+            logging.error(f"❌ 送出事件訊息失敗：{e.status_code} {e.error.message}")
+        except requests.RequestException as e:
+            logging.error(f"❌ 送出事件訊息失敗：{e}")
+
+
+def collect_event_messages(func):
+    """webhook 事件處理函式用：以事件的使用者與 reply token 收集訊息（見 collect_outbound）。"""
+    # WebhookHandler 依參數個數決定是否多傳 destination，wrapper 與處理函式一樣只接受 event
+    @functools.wraps(func)
+    def wrapper(event):
+        user_id = getattr(event.source, "user_id", None)
+        with collect_outbound(user_id, getattr(event, "reply_token", None)):
+            return func(event)
+    return wrapper
+
+
+_line_bot_api = None
+_line_bot_api_lock = threading.Lock()
+
+
+def get_line_bot_api():
+    """
+    取得全程式共用的 LineBotApi（webhook、models 與排程皆使用同一個連線池）。
+    回傳的是 CollectingLineBotApi，webhook 事件中的訊息會依 collect_event_messages 合併。
+    """
+    global _line_bot_api
+    if _line_bot_api is None:
+        with _line_bot_api_lock:
+            if _line_bot_api is None:
+                _line_bot_api = CollectingLineBotApi(LineBotApi(
+                    CHANNEL_ACCESS_TOKEN,
+                    timeout=(LINE_API_CONNECT_TIMEOUT, LINE_API_READ_TIMEOUT),
+                    http_client=PooledRequestsHttpClient
+                ))
+    return _line_bot_api
+
+
+def log_line_api_metrics():
+    for endpoint, stat in sorted(line_api_metrics.snapshot().items()):
+        logging.info(
+            f"📊 LINE API {endpoint}：{stat['calls']} 次，錯誤 {stat['errors']}，"
+            f"平均 {stat['avg_ms']} ms，最大 {stat['max_ms']:.0f} ms"
+        )
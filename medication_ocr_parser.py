@@ -1,17 +1,20 @@
 import re
+from datetime import date
+from functools import lru_cache
 from typing import List, Dict, Any
-# 假設這裡可以引入 models.py 中的函數，例如查詢頻率對應時間的函數
-# from models import get_suggested_times_by_frequency_name # ⚠️ 需要在 models.py 中實現此函數
 import logging
 
+from frequency_resolver import resolve_frequency_times
+
 logging.basicConfig(level=logging.INFO)
 
 # 模擬 OCR 服務
 def call_ocr_service(image_data: bytes) -> str:
     """
     模擬對藥袋圖片進行 OCR 辨識的服務。
-    在實際應用中，這裡會調用真正的 OCR API (例如 Google Cloud Vision API)。
-    目前為了演示，它會返回一個預設的藥袋文字。
+    真正的 OCR 引擎請實作 ocr_engine.OcrBackend，並透過 config.OCR_BACKEND 指定；
+    辨識會在 ocr_engine 的 process pool 中執行。
+    目前為了演示，它會返回一個預設的藥袋文字（由 ocr_engine.LocalOcrBackend 使用）。
 
     Args:
         image_data (bytes): 藥袋圖片的二進制數據。
@@ -35,56 +38,125 @@ def call_ocr_service(image_data: bytes) -> str:
 def convert_frequency_to_times(frequency_text: str) -> List[str]:
     """
     將用藥頻率的文字描述轉換為具體的服藥時間列表 (HH:MM 格式)。
-    此函數應更智能地利用預設的頻率代碼和建議時間。
-    
+    頻率代碼由 frequency_resolver 依 frequency_synonym 同義詞表比對，
+    時間取自快取的 suggested_dosage_time；視需要服用 (PRN) 或無法辨識時回傳空列表。
+
     Args:
         frequency_text (str): 用藥頻率的文字描述，例如 "一日三次", "飯後早中晚", "睡前"。
 
     Returns:
         List[str]: 具體的服藥時間列表，例如 ["08:00", "14:00", "20:00"]。
     """
-    frequency_text = frequency_text.strip()
-    times = []
-
-    # ⚠️ 這裡需要從資料庫查詢 suggested_dosage_time 表，
-    # 根據 frequency_text 找到對應的 frequency_code 和其 time_slot。
-    # 假設 models.py 中有一個函數可以查詢這些資訊。
-
-    # 模擬從 suggested_dosage_time 查詢
-    # 在實際應用中，這裡會調用 models.py 中的函數，例如：
-    # suggested_times_data = get_suggested_times_by_frequency_name(frequency_text)
-    # if suggested_times_data:
-    #     for i in range(1, 5): # time_slot_1 到 time_slot_4
-    #         time_slot = suggested_times_data.get(f'time_slot_{i}')
-    #         if time_slot:
-    #             times.append(str(time_slot)) # 假設 time_slot 是 datetime.time 對象
-
-    # 臨時的硬編碼映射，最終應該從資料庫獲取
-    # 參考您的 suggested_dosage_time 表範例
-    if "一日一次" in frequency_text:
-        times = ["08:00"]
-    elif "一日二次" in frequency_text:
-        times = ["08:00", "20:00"]
-    elif "一日三次" in frequency_text or "飯後早中晚" in frequency_text:
-        times = ["08:30", "12:30", "18:30"] # 飯後時間
-    elif "一日四次" in frequency_text:
-        times = ["06:00", "12:00", "18:00", "22:00"]
-    elif "睡前" in frequency_text or "HS" in frequency_text:
-        times = ["22:00"]
-    elif "飯前" in frequency_text or "AC" in frequency_text:
-        times = ["07:30", "11:30", "17:30"]
-    elif "飯後" in frequency_text or "PC" in frequency_text:
-        times = ["08:30", "12:30", "18:30"]
-    elif "視需要服用" in frequency_text or "PRN" in frequency_text or "需要時" in frequency_text:
-        # 對於需要時服用的藥品，不設定固定提醒時間，由應用程式邏輯處理
-        return []
-    # 可以添加更多頻率的轉換邏輯
-
-    return times
+    return resolve_frequency_times(frequency_text)
+
+def parse_visit_date(visit_date_text: str):
+    """
+    將藥袋上的看診日期轉為 datetime.date。
+    支援民國年（如 "114.06.12"）與西元年（如 "2025-06-12"）；無法解析時回傳 None。
+    """
+    match = re.match(r"^\s*(\d{2,4})[./-](\d{1,2})[./-](\d{1,2})\s*$", visit_date_text or "")
+    if not match:
+        return None
+    year, month, day = (int(g) for g in match.groups())
+    if year < 1911:
+        year += 1911
+    try:
+        return date(year, month, day)
+    except ValueError:
+        return None
+
+# ------------------------------------------------------------
+# 藥袋文字解析：預先編譯的樣式與欄位別名
+# ------------------------------------------------------------
+_VISIT_DATE_PATTERN = re.compile(r"看診日期\s*:?\s*(\d{2,4}[./-]\d{1,2}[./-]\d{1,2})")
+_DAYS_SUPPLY_PATTERN = re.compile(r"發藥天數\s*:?\s*(\d+)")
+# 「欄位:值」格式的資訊行（不屬於藥品表格）：只認得這些欄位名稱，
+# 藥品列中的冒號（如「用法:」接續文字、1:1 的比例）不會被當成資訊行
+_INFO_KEYS = (
+    "看診日期", "本次發藥天數", "發藥天數", "調劑日期", "病患姓名", "姓名", "病歷號",
+    "科別", "醫師", "藥師", "領藥號", "諮詢專線", "電話", "地址",
+)
+_INFO_LINE_PATTERN = re.compile(rf"^(?:{'|'.join(_INFO_KEYS)})\s*:")
+_COLUMN_GAP_PATTERN = re.compile(r"\s{2,}|\t")
+# 單次劑量：數字（可含小數或分數）加上可省略的單位；欄位檢查與單行樣式（_compile_row_pattern）共用
+_DOSAGE_REGEX = r"\d+(?:\.\d+)?(?:/\d+)?(?:錠|顆|粒|包|膠囊|ml|mL|cc|c\.c\.|匙)?"
+_DOSAGE_PATTERN = re.compile(rf"^{_DOSAGE_REGEX}$")
+
+# 標題列的欄位名稱 → 欄位代號；未列出的欄位（如「總量」、「備註」）會被略過
+_HEADER_ALIASES = {
+    "藥品名稱": "name", "藥名": "name", "品名": "name",
+    "單次劑量": "dosage", "劑量": "dosage", "用量": "dosage", "每次用量": "dosage",
+    "用藥頻率": "frequency_text", "頻率": "frequency_text", "用法": "frequency_text", "服用方法": "frequency_text",
+    "主要用途": "purpose", "用途": "purpose", "適應症": "purpose",
+    "副作用": "side_effects", "注意事項": "side_effects",
+}
+_DEFAULT_COLUMNS = ("name", "dosage", "frequency_text", "purpose", "side_effects")
+# 可能跨行、且會吸收多餘文字的欄位
+_TEXT_COLUMNS = ("side_effects", "purpose")
+
+
+# 全形 ASCII（！到～）與全形空白 → 半形
+_HALFWIDTH_TABLE = {code: code - 0xFEE0 for code in range(0xFF01, 0xFF5F)}
+_HALFWIDTH_TABLE[0x3000] = 0x20
+_FULLWIDTH_PATTERN = re.compile("[\u3000\uff01-\uff5e]")
+
+
+@lru_cache(maxsize=32)
+def _compile_row_pattern(columns):
+    """
+    依標題欄位順序編譯單一空白分隔列的樣式：劑量欄作為定位點，
+    其前一欄（通常是藥名）可含空白，其後每欄一個字詞，最後一欄吸收剩餘文字。
+    """
+    dosage_col = columns.index("dosage")
+    head = "".join(r"(\S+)\s+" for _ in range(dosage_col - 1))
+    if dosage_col:
+        head += r"(.+?)\s+"
+    tail = ""
+    trailing = len(columns) - dosage_col - 1
+    for i in reversed(range(trailing)):
+        cell = r"(.+)" if i == trailing - 1 else r"(\S+)"
+        tail = rf"(?:\s+{cell}{tail})?"
+    return re.compile(rf"^{head}({_DOSAGE_REGEX}){tail}$")
+
+
+def _detect_header(tokens: List[str]):
+    """
+    若 tokens 為藥品表格標題列，回傳 (欄位代號 tuple, 劑量欄位置)，否則回傳 None。
+    未知欄位的代號為 None，解析時會被略過。
+    """
+    columns = tuple(_HEADER_ALIASES.get(token) for token in tokens)
+    known = {c for c in columns if c}
+    if "name" in known and "dosage" in known and len(known) >= 3:
+        return columns, columns.index("dosage")
+    return None
+
+
+def _parse_row(line: str, columns, dosage_col) -> Dict[str, str]:
+    """依標題欄位順序解析一列藥品資料；沒有可辨識的劑量欄時回傳 None。"""
+    cells = None
+    if "  " in line or "\t" in line:
+        # 欄位間以兩個以上空白或 tab 分隔時以此為準（欄位內容可含單一空白）
+        cells = _COLUMN_GAP_PATTERN.split(line)
+        if len(cells) < len(columns) - 1 or not _DOSAGE_PATTERN.match(cells[dosage_col]):
+            cells = None
+    if cells is None:
+        match = _compile_row_pattern(columns).match(line)
+        if not match:
+            return None
+        cells = match.groups()
+
+    row = dict.fromkeys(_DEFAULT_COLUMNS, "")
+    for col, cell in zip(columns, cells):
+        if col and cell:
+            row[col] = cell
+    return row if row["name"] else None
+
 
 def parse_medication_order(ocr_raw_text: str) -> List[Dict[str, Any]]:
     """
     解析 OCR 辨識出的藥袋原始文字，提取藥品資訊。
+    單次掃描所有行：先找出看診日期、發藥天數與表格標題列，再依標題欄位順序解析每一列，
+    並支援全形空白、多餘欄位與換行延續的用途/副作用文字。
 
     Args:
         ocr_raw_text (str): OCR 辨識後的原始文字。
@@ -93,80 +165,68 @@ def parse_medication_order(ocr_raw_text: str) -> List[Dict[str, Any]]:
         List[Dict[str, Any]]: 包含解析出的藥品資訊的列表，每個字典代表一種藥品。
                                 格式如：
                                 [
-                                    {
-                                        'name': '普拿疼',
-                                        'dosage': '2',
-                                        'frequency_text': '一日三次', # 原始頻率文字
-                                        'times': ['08:00', '14:00', '20:00'], # 轉換後的具體時間
-                                        'purpose': '止痛',
-                                        'side_effects': ''
-                                    },
                                     {
                                         'name': '脈優錠',
                                         'dosage': '1',
-                                        'frequency_text': '飯後早中晚',
-                                        'times': ['08:30', '12:30', '18:30'],
+                                        'frequency_text': '飯後早中晚', # 原始頻率文字
+                                        'times': ['08:30', '12:30', '18:30'], # 轉換後的具體時間
                                         'purpose': '治療高血壓',
-                                        'side_effects': '嘔吐 頭暈'
+                                        'side_effects': '嘔吐 頭暈',
+                                        'visit_date': '114.06.12', # 看診日期（藥袋原文，未轉換）
+                                        'days_supply': '3' # 本次發藥天數
                                     }
                                 ]
     """
-    lines = ocr_raw_text.split('\n')
     parsed_medications = []
-    
-    # 提取看診日期和發藥天數 (如果需要儲存這些資訊)
     consultation_date = ""
     days_supply = ""
-    for line in lines:
-        if "看診日期" in line:
-            match = re.search(r"看診日期:(\d{3}\.\d{2}\.\d{2})", line)
-            if match:
-                consultation_date = match.group(1)
-        elif "本次發藥天數" in line:
-            match = re.search(r"本次發藥天數:(\d+)日份", line)
-            if match:
-                days_supply = match.group(1)
-
-    # 找到藥品列表的起始行
-    start_parsing = False
-    for line in lines:
-        # 尋找包含關鍵詞的標題行，例如 "藥品名稱 單次劑量 用藥頻率 主要用途 副作用"
-        if "藥品名稱" in line and "單次劑量" in line and "用藥頻率" in line:
-            start_parsing = True
+    layout = None        # 標題列的 (欄位, 劑量欄位置)；尚未遇到標題列時為 None
+    last_row = None      # 上一筆藥品，用於接續換行的文字
+    times_cache = {}
+
+    if _FULLWIDTH_PATTERN.search(ocr_raw_text):
+        ocr_raw_text = ocr_raw_text.translate(_HALFWIDTH_TABLE)
+
+    for raw_line in ocr_raw_text.splitlines():
+        line = raw_line.strip()
+        if not line:
+            last_row = None
+            continue
+
+        if _INFO_LINE_PATTERN.match(line):
+            if "看診日期" in line:
+                match = _VISIT_DATE_PATTERN.search(line)
+                if match:
+                    consultation_date = match.group(1)
+            elif "發藥天數" in line:
+                match = _DAYS_SUPPLY_PATTERN.search(line)
+                if match:
+                    days_supply = match.group(1)
+            last_row = None
             continue
 
-        if start_parsing and line.strip(): # 確保不是空行
-            # 嘗試使用正則表達式解析藥品資訊
-            # 假設字段由至少一個空格分隔
-            # (\S+) 匹配非空白字符，用於藥品名稱
-            # (\d+) 匹配一個或多個數字，用於劑量
-            # (\S+) 匹配非空白字符，用於用藥頻率 (例如 "一日三次", "飯後早中晚")
-            # ([^\s]+(?: [^\s]+)*) 匹配主要用途，可以包含多個詞語，中間有空格
-            # (?:\s+(.*))? 可選地匹配副作用，從一個或多個空格開始到行尾
-            match = re.match(r"(\S+)\s+(\d+)\s+(\S+)\s+([^\s]+(?: [^\s]+)*)(?:\s+(.*))?", line.strip())
-
-            if match:
-                name = match.group(1).strip()
-                dosage = match.group(2).strip()
-                frequency_text = match.group(3).strip()
-                purpose = match.group(4).strip()
-                side_effects = match.group(5).strip() if match.group(5) else ""
-
-                # 轉換頻率文字為具體時間點
-                times = convert_frequency_to_times(frequency_text)
-
-                parsed_medications.append({
-                    'name': name,
-                    'dosage': dosage,
-                    'frequency_text': frequency_text,
-                    'times': times,
-                    'purpose': purpose,
-                    'side_effects': side_effects
-                })
+        if layout is None:
+            layout = _detect_header(line.split())
+            continue
+
+        row = _parse_row(line, *layout)
+        if row is None:
+            if last_row is not None:
+                # 換行延續：接到上一筆最後一個有內容的文字欄位
+                target = next((c for c in _TEXT_COLUMNS if last_row[c]), "purpose")
+                last_row[target] = f"{last_row[target]} {line}".strip()
             else:
-                logging.warning(f"WARN: 無法解析藥品信息行: {line.strip()}")
-                # 如果無法解析，可以選擇跳過或記錄錯誤
-                pass
+                logging.warning(f"WARN: 無法解析藥品信息行: {line}")
+            continue
 
-    return parsed_medications
+        frequency_text = row["frequency_text"]
+        if frequency_text not in times_cache:
+            times_cache[frequency_text] = convert_frequency_to_times(frequency_text)
+        row["times"] = list(times_cache[frequency_text])
+        parsed_medications.append(row)
+        last_row = row
 
+    for med in parsed_medications:
+        med["visit_date"] = consultation_date
+        med["days_supply"] = days_supply
+    return parsed_medications
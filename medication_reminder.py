@@ -1,8 +1,10 @@
 from datetime import datetime, timedelta
+import json
 import re
 from urllib.parse import quote, parse_qs
 
-from database import get_conn
+import repository
+from database import get_conn, read_only
 from linebot.models import (
     TextSendMessage, QuickReply, QuickReplyButton,
     DatetimePickerAction, MessageAction, PostbackAction
@@ -13,10 +15,10 @@ from models import (
     get_medication_reminders_for_user,get_medicine_id_by_name,
     add_medication_record,get_frequency_name,get_frequency_code,
     add_medication_reminder_full,get_all_frequency_options,
-    get_reminder_times_for_user, clear_single_time_slot
+    get_reminder_times_for_user, clear_single_time_slot, delete_medication_reminder_time,
+    get_family_members, ensure_self_member
 )
 import logging # For logging
-from collections import defaultdict
 
 logging.basicConfig(level=logging.INFO)
 
@@ -56,91 +58,54 @@ def create_frequency_quickreply():
 # 執行用藥提醒
 # ------------------------------------------------------------
 
+def create_dose_response_quickreply(patient_id, scheduled_date, slot_time):
+    """提醒訊息下方的「已服用 / 略過」按鈕；回覆寫入 dose_log（見 models.record_dose_response）。"""
+    data = (f"action=dose_log&patient_id={patient_id}"
+            f"&date={scheduled_date:%Y%m%d}&time={slot_time.replace(':', '')}")
+    return QuickReply(items=[
+        QuickReplyButton(action=PostbackAction(label="✅ 已服用", data=f"{data}&status=taken", display_text="已服用")),
+        QuickReplyButton(action=PostbackAction(label="⏭️ 略過", data=f"{data}&status=skipped", display_text="略過這次")),
+    ])
+
+
+@read_only
 def run_reminders(line_bot_api):
     logging.info(f"正在執行提醒任務，當前時間: {datetime.now().strftime('%H:%M')}")
-    conn = get_conn()
-    if not conn:
-        logging.error("無法連接到資料庫，跳過提醒任務。")
-        return
+    now = datetime.now().replace(second=0, microsecond=0)
+    slot = now.time()
 
     try:
-        cursor = conn.cursor(dictionary=True)
-        current_time_str = datetime.now().strftime('%H:%M')
-
-        query = """
-            SELECT
-                rt.recorder_id AS recorder_id,
-                rt.member,
-                p.linked_user_id,
-                fc.frequency_name,
-                mr.dose_quantity,
-                COALESCE(di.drug_name_zh, mr.drug_name_zh) AS medicine_name
-            FROM reminder_time rt
-            JOIN patients p ON rt.recorder_id = p.recorder_id AND rt.member = p.member
-            JOIN frequency_code fc ON rt.frequency_name = fc.frequency_name
-            JOIN medication_record mr ON rt.recorder_id = mr.recorder_id
-                              AND rt.member = mr.member
-                              AND mr.frequency_count_code = fc.frequency_code
-            LEFT JOIN drug_info di ON mr.drug_name_zh = di.drug_name_zh
-            WHERE DATE_FORMAT(rt.time_slot_1, '%H:%i') = %s
-            OR DATE_FORMAT(rt.time_slot_2, '%H:%i') = %s
-            OR DATE_FORMAT(rt.time_slot_3, '%H:%i') = %s
-            OR DATE_FORMAT(rt.time_slot_4, '%H:%i') = %s
-        """
-
-        cursor.execute(query, (current_time_str, current_time_str, current_time_str, current_time_str))
-        reminders = cursor.fetchall()
-
-        # ✅ 將提醒依照使用者分組並合併同藥品
-        grouped_by_user = defaultdict(lambda: {"member": "", "linked_user_id": "", "medicines": {}})
+        # 每位收件者一列，用藥者與藥品已在資料庫端彙總（見 repository 的 reminder.due_payloads）；
+        # 推播前就歸還連線，LINE API 的延遲不會佔住資料庫連線
+        due = repository.fetch_all("reminder.due_payloads", (slot, slot, slot, slot))
+    except Exception as e:
+        logging.error(f"❌ 提醒任務錯誤：{e}")
+        return
 
-        for r in reminders:
-            key = r["recorder_id"]
-            medicine = r["medicine_name"] or "未命名藥品"
-            grouped = grouped_by_user[key]
-            grouped["member"] = r["member"]
-            grouped["linked_user_id"] = r["linked_user_id"]
-
-            # 限制藥品名稱只出現一次
-            if medicine not in grouped["medicines"]:
-                grouped["medicines"][medicine] = {
-                    "dose_quantity": r["dose_quantity"] or "未提供",
-                    "frequency_name": r["frequency_name"] or "未知頻率"
-                }
-
-        # ✅ 建立與推播訊息
-        display_time = current_time_str
-        for recorder_id, info in grouped_by_user.items():
-            member = info["member"]
-            linked_user_id = info["linked_user_id"]
+    # ✅ 每位用藥者一則訊息（服藥回覆才能對應到人），記錄者與綁定的用藥者各自收到
+    display_time = now.strftime('%H:%M')
+    for row in due:
+        recipient_id = row["recipient_id"]
+        for entry in json.loads(row["members"]):
             medicine_lines = [
-                f"- {name}（{med['dose_quantity']} 顆）"
-                for name, med in info["medicines"].items()
+                f"- {med['medicine_name']}（{med['dose_quantity'] or '未提供'} 顆）"
+                for med in sorted(entry["medicines"], key=lambda med: med["medicine_name"])
             ]
-
             message_text = (
                 f"🔔 用藥時間到囉！\n"
-                f"👤 用藥者：{member}\n"
+                f"👤 用藥者：{entry['member']}\n"
                 f"💊 需要服用的藥物如下：\n" +
                 "\n".join(medicine_lines) +
-                f"\n🕒 時間：{display_time}\n請記得按時服用喔！"
+                f"\n🕒 時間：{display_time}\n請記得按時服用喔！服用後請點選下方按鈕記錄。"
             )
+            quick_reply = create_dose_response_quickreply(entry["patient_id"], now.date(), display_time)
 
             try:
-                line_bot_api.push_message(recorder_id, TextSendMessage(text=message_text))
-                logging.info(f"📤 已通知照顧者 {recorder_id}")
-
-                if linked_user_id and linked_user_id != recorder_id:
-                    line_bot_api.push_message(linked_user_id, TextSendMessage(text=message_text))
-                    logging.info(f"📤 也通知被照顧者 {linked_user_id}")
+                line_bot_api.push_message(recipient_id, TextSendMessage(text=message_text, quick_reply=quick_reply))
+                logging.info(f"📤 已通知 {recipient_id}（用藥者：{entry['member']}）")
             except Exception as e:
                 logging.error(f"❌ 推播提醒失敗：{e}")
 
-    except Exception as e:
-        logging.error(f"❌ 提醒任務錯誤：{e}")
-    finally:
-        conn.close()
-
 
 
 
@@ -148,51 +113,36 @@ def run_reminders(line_bot_api):
 # 用藥者管理相關功能
 # ------------------------------------------------------------
 
+@read_only
 def create_patient_selection_message(line_id: str, context: str = None):
-    conn = get_conn()
-    if not conn:
-        return TextSendMessage(text="抱歉，無法連線到使用者資料庫。")
     items = []
     try:
-        cursor = conn.cursor(dictionary=True)
-        cursor.execute("SELECT recorder_id FROM users WHERE recorder_id = %s", (line_id,))
-        user = cursor.fetchone()
-        if not user:
-            cursor.execute("INSERT INTO users (recorder_id, user_name) VALUES (%s, %s)", (line_id, "新用戶"))
-            conn.commit()
-            current_recorder_id = line_id
-            cursor.execute("INSERT INTO patients (recorder_id, member) VALUES (%s, %s)", (current_recorder_id, "本人"))
-            conn.commit()
-            existing_patients = [{'member': '本人'}]
-        else:
-            current_recorder_id = user['recorder_id']
-            cursor.execute("SELECT member FROM patients WHERE recorder_id = %s", (current_recorder_id,))
-            existing_patients = cursor.fetchall()
-            if not existing_patients:
-                cursor.execute("INSERT INTO patients (recorder_id, member) VALUES (%s, %s)", (current_recorder_id, "本人"))
-                conn.commit()
-                existing_patients = [{'member': '本人'}]
-
-        for patient in existing_patients:
-            postback_data = f"action=select_patient_for_reminder&member={quote(patient['member'])}"
-            display_text_label = f"選擇 {patient['member']}"
+        # 名單來自 models 的用藥者快取；「本人」在加入好友時建立，舊使用者缺少時才補建一次
+        existing_patients = get_family_members(line_id)
+        if not existing_patients:
+            ensure_self_member(line_id)
+            existing_patients = ['本人']
+
+        for member in existing_patients:
+            postback_data = f"action=select_patient_for_reminder&member={quote(member)}"
+            display_text_label = f"選擇 {member}"
 
             if context:
                 postback_data += f"&context={context}"
 
             if context == "add_reminder":
-                display_text_label = f"為「{patient['member']}」新增提醒"
+                display_text_label = f"為「{member}」新增提醒"
             elif context == "query_reminder":
-                display_text_label = f"查詢「{patient['member']}」的提醒"
+                display_text_label = f"查詢「{member}」的提醒"
             elif context == "manage_reminders":
-                display_text_label = f"管理「{patient['member']}」的提醒"
+                display_text_label = f"管理「{member}」的提醒"
             elif context == "edit_time":
-                display_text_label = f"設定「{patient['member']}」的提醒時間"
+                display_text_label = f"設定「{member}」的提醒時間"
 
             items.append(
                 QuickReplyButton(
                     action=PostbackAction(
-                        label=patient['member'],
+                        label=member,
                         data=postback_data,
                         display_text=display_text_label
                     )
@@ -215,9 +165,6 @@ def create_patient_selection_message(line_id: str, context: str = None):
         import traceback
         traceback.print_exc()
         return TextSendMessage(text="抱歉，在讀取用藥者資訊時發生錯誤。")
-    finally:
-        if conn and conn.is_connected():
-            conn.close()
 
     prompt = {
         "add_reminder": "請問這份藥單是給誰的？",
@@ -247,6 +194,7 @@ def create_edit_time_action_menu(member):
         ])
     )
 
+@read_only
 def create_medication_management_menu(line_id: str):
     items = [
         QuickReplyButton(
@@ -265,117 +213,54 @@ def create_medication_management_menu(line_id: str):
         )
     ]
 
-    conn = get_conn()
-    if conn:
-        try:
-            cursor = conn.cursor(dictionary=True)
-            cursor.execute("SELECT recorder_id FROM users WHERE recorder_id = %s", (line_id,))
-            user = cursor.fetchone()
-            if user:
-                recorder_id_for_query = user['recorder_id']
-                cursor.execute("SELECT count(*) as count FROM patients WHERE recorder_id = %s", (recorder_id_for_query,)) # 修改點
-                patient_count = cursor.fetchone()['count']
-                if patient_count < 4:
-                     items.append(
-                        QuickReplyButton(
-                            action=PostbackAction(
-                                label="⊕ 新增家人",
-                                data="action=add_new_patient",
-                                display_text="新增家人"
-                            )
-                        )
-                    )
-        except Exception as e:
-            logging.error(f"Error checking patient count for management menu: {e}")
-        finally:
-            if conn.is_connected():
-                conn.close()
+    if len(get_family_members(line_id)) < 4:
+        items.append(
+            QuickReplyButton(
+                action=PostbackAction(
+                    label="⊕ 新增家人",
+                    data="action=add_new_patient",
+                    display_text="新增家人"
+                )
+            )
+        )
 
     return TextSendMessage(text="請問您要進行哪種用藥管理操作？", quick_reply=QuickReply(items=items))
 
 
+@read_only
 def create_patient_edit_message(line_id: str):
-    conn = get_conn()
-    if not conn:
-        return TextSendMessage(text="抱歉，無法連接到使用者資料庫。")
-    items = []
-    try:
-        cursor = conn.cursor(dictionary=True)
-        cursor.execute("SELECT recorder_id FROM users WHERE recorder_id = %s", (line_id,))
-        user = cursor.fetchone()
-        if not user:
-            return TextSendMessage(text="找不到您的使用者資料。")
-        recorder_id_for_query = user['recorder_id']
-        cursor.execute("SELECT member FROM patients WHERE recorder_id = %s AND member != '本人' ORDER BY member", (recorder_id_for_query,))
-        editable_patients = cursor.fetchall()
-        if not editable_patients:
-            return TextSendMessage(text="您目前沒有可供修改的家人名單喔！")
-        for patient in editable_patients:
-            items.append(
-                QuickReplyButton(
-                    action=PostbackAction(
-                        label=f"修改「{patient['member']}」",
-                        data=f"action=edit_patient_start&member_to_edit={quote(patient['member'])}",
-                        display_text=f"我想修改「{patient['member']}」的名稱"
-                    )
-                )
+    editable_patients = sorted(member for member in get_family_members(line_id) if member != '本人')
+    if not editable_patients:
+        return TextSendMessage(text="您目前沒有可供修改的家人名單喔！")
+    items = [
+        QuickReplyButton(
+            action=PostbackAction(
+                label=f"修改「{member}」",
+                data=f"action=edit_patient_start&member_to_edit={quote(member)}",
+                display_text=f"我想修改「{member}」的名稱"
             )
-    except Exception as e:
-        logging.error(f"Error in create_patient_edit_message: {e}")
-        return TextSendMessage(text="抱歉，在讀取家人名單時發生錯誤。")
-    finally:
-        if conn and conn.is_connected():
-            conn.close()
+        )
+        for member in editable_patients
+    ]
     return TextSendMessage(text="請問您想修改哪一位家人的名稱？", quick_reply=QuickReply(items=items))
 
 
+@read_only
 def get_patient_id_by_member_name(line_id: str, member_name: str):
-    conn = get_conn()
-    if not conn:
-        return None
-    try:
-        cursor = conn.cursor()
-        # Change: Removed patient_id selection. We only need to confirm existence.
-        cursor.execute("SELECT recorder_id FROM patients WHERE recorder_id = %s AND member = %s", (line_id, member_name))
-        patient_record = cursor.fetchone()
-        # Return True if patient exists, False otherwise
-        return True if patient_record else False
-    except Exception as e:
-        logging.error(f"Error in get_patient_id_by_member_name: {e}")
-        return None
-    finally:
-        if conn and conn.is_connected():
-            conn.close()
+    # 只確認用藥者是否存在
+    return member_name in get_family_members(line_id)
 
 
+@read_only
 def _display_medication_reminders(reply_token, line_bot_api, line_user_id, member):
-    from database import get_conn
     from linebot.models import TextSendMessage, QuickReply, QuickReplyButton, PostbackAction
     import logging
     from urllib.parse import quote
     from models import clear_temp_state
 
-    conn = get_conn()
-    if not conn:
-        line_bot_api.reply_message(reply_token, TextSendMessage(text="❌ 資料庫連線失敗，請稍後再試。"))
-        return
-
     try:
-        cursor = conn.cursor(dictionary=True)
-        cursor.execute("""
-            SELECT DISTINCT rt.frequency_name,
-                   rt.time_slot_1, rt.time_slot_2, rt.time_slot_3, rt.time_slot_4,
-                   mr.drug_name_zh AS medicine_name
-            FROM reminder_time rt
-            LEFT JOIN frequency_code fc ON rt.frequency_name = fc.frequency_name
-            LEFT JOIN medication_record mr
-              ON rt.recorder_id = mr.recorder_id
-             AND rt.member = mr.member
-             AND mr.frequency_count_code = fc.frequency_code
-            WHERE rt.recorder_id = %s AND rt.member = %s
-        """, (line_user_id, member))
-
-        reminders = cursor.fetchall()
+        # 每個提醒一筆，同頻率的藥品已在資料庫端彙總（見 repository 的 reminder.list_for_member）
+        reminders = get_medication_reminders_for_user(line_user_id, member)
         if not reminders:
             line_bot_api.reply_message(reply_token, TextSendMessage(text=f"「{member}」目前沒有設定任何用藥提醒。"))
             return
@@ -384,8 +269,8 @@ def _display_medication_reminders(reply_token, line_bot_api, line_user_id, membe
         quick_reply_buttons = []
 
         for r in reminders:
-            frequency_name = r.get('frequency_name', '未知頻率')
-            medicine_name = r.get('medicine_name', '未命名藥品')
+            frequency_name = r.get('frequency_name') or '未知頻率'
+            medicine_names = '、'.join(m['medicine_name'] for m in r['medicines']) or '未命名藥品'
 
             times = []
             for i in range(1, 5):
@@ -400,7 +285,7 @@ def _display_medication_reminders(reply_token, line_bot_api, line_user_id, membe
 
             time_str = '、'.join(times) if times else '未設定'
 
-            reminder_messages.append(f"藥品：{medicine_name}\n頻率：{frequency_name}\n時間：{time_str}")
+            reminder_messages.append(f"藥品：{medicine_names}\n頻率：{frequency_name}\n時間：{time_str}")
 
             quick_reply_buttons.append(
                 QuickReplyButton(
@@ -425,10 +310,6 @@ def _display_medication_reminders(reply_token, line_bot_api, line_user_id, membe
         traceback.print_exc()
         line_bot_api.reply_message(reply_token, TextSendMessage(text="⚠️ 查詢提醒失敗，請稍後再試。"))
 
-    finally:
-        if conn and conn.is_connected():
-            conn.close()
-
 
 
 
@@ -788,7 +669,6 @@ def handle_postback(event, line_bot_api, user_states):
             return
 
         try:
-            from models import delete_medication_reminder_time
             success = delete_medication_reminder_time(line_user_id, member, frequency_name)
 
             if success:
@@ -993,20 +873,25 @@ def handle_postback(event, line_bot_api, user_states):
             if not patient:
                 line_bot_api.reply_message(reply_token, TextSendMessage(text=f"找不到「{member}」的用藥者資料。"))
                 return
-            patient_id = patient['patient_id']
 
-            reminders = get_medication_reminders_for_user(patient_id)
+            reminders = get_medication_reminders_for_user(line_user_id, member)
             if not reminders:
                 line_bot_api.reply_message(reply_token, TextSendMessage(text=f"「{member}」目前沒有可刪除的用藥提醒。"))
                 return
 
+            # 暫存狀態以 JSON 儲存，只保留刪除時需要的頻率與藥名
+            reminders_list = [
+                {"frequency_name": r["frequency_name"],
+                 "medicine_names": "、".join(m["medicine_name"] for m in r["medicines"]) or "未命名藥品"}
+                for r in reminders
+            ]
             items = []
-            set_temp_state(line_user_id, {"state": "AWAITING_REMINDER_TO_DELETE", "member": member, "reminders_list": reminders})
-            for i, r in enumerate(reminders):
+            set_temp_state(line_user_id, {"state": "AWAITING_REMINDER_TO_DELETE", "member": member, "reminders_list": reminders_list})
+            for i, r in enumerate(reminders_list):
                 items.append(
                     QuickReplyButton(
                         action=PostbackAction(
-                            label=f"刪除 {r['medicine_name']} ({r['reminder_time']})",
+                            label=f"刪除 {r['frequency_name']}"[:20],
                             data=f"action=confirm_delete_reminder&reminder_index={i}"
                         )
                     )
@@ -1031,8 +916,8 @@ def handle_postback(event, line_bot_api, user_states):
         if reminders_list and 0 <= reminder_index < len(reminders_list):
             reminder_to_delete = reminders_list[reminder_index]
             try:
-                delete_medication_reminder_time(reminder_to_delete['reminder_time_id'])
-                line_bot_api.reply_message(reply_token, TextSendMessage(text=f"已成功刪除「{member}」的用藥提醒：{reminder_to_delete['medicine_name']} ({reminder_to_delete['reminder_time']})。"))
+                delete_medication_reminder_time(line_user_id, member, reminder_to_delete['frequency_name'])
+                line_bot_api.reply_message(reply_token, TextSendMessage(text=f"已成功刪除「{member}」的用藥提醒：{reminder_to_delete['medicine_names']}（{reminder_to_delete['frequency_name']}）。"))
             except Exception as e:
                 logging.error(f"Error deleting reminder: {e}")
                 line_bot_api.reply_message(reply_token, TextSendMessage(text="刪除提醒失敗，請稍後再試。"))
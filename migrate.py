@@ -0,0 +1,218 @@
+"""
+資料庫 schema 版本管理。
+
+    python migrate.py status                 列出每個版本與是否已套用
+    python migrate.py up [--to N] [--fake]   套用尚未執行的版本（--fake 只記錄版本，不執行 SQL）
+    python migrate.py down [--to N | --steps K]  依序回復版本，預設回復最後一個
+
+migrations/ 下每個版本有一對檔案：NNNN_名稱.up.sql 與 NNNN_名稱.down.sql。
+DB_BACKEND = "sqlite" 時改用同版本的 NNNN_名稱.sqlite.up.sql / .sqlite.down.sql（每個版本都必須提供）。
+版本可另外提供 NNNN_名稱.check.sql（兩種資料庫共用）：套用前逐一執行其中的查詢，
+任一查詢有結果（例如加唯一鍵前已有重複資料）時列出結果並停止，不執行該版本。
+已套用的版本記錄在 schema_migrations 資料表。
+MySQL 的 DDL 會自動 commit，版本中途失敗時前面的語句不會回復，修正後需手動處理再重新執行。
+"""
+import argparse
+import logging
+import os
+import re
+import sys
+
+from config import DB_BACKEND
+from database import get_conn
+
+logging.basicConfig(level=logging.INFO)
+
+MIGRATIONS_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), "migrations")
+_FILENAME_PATTERN = re.compile(r"^(\d{4})_(\w+?)(?:\.(sqlite))?\.(up|down)\.sql$")
+
+
+def discover_migrations(migrations_dir=MIGRATIONS_DIR, dialect=None):
+    """回傳依版本排序的 [(version, name, up_path, down_path)]；dialect 預設依 DB_BACKEND。"""
+    dialect = dialect or DB_BACKEND
+    found = {}
+    for filename in os.listdir(migrations_dir):
+        match = _FILENAME_PATTERN.match(filename)
+        if not match or (match.group(3) or "mysql") != dialect:
+            continue
+        version, name, direction = int(match.group(1)), match.group(2), match.group(4)
+        entry = found.setdefault(version, {"name": name})
+        if entry["name"] != name:
+            raise ValueError(f"版本 {version:04d} 的 up/down 檔名不一致：{entry['name']} / {name}")
+        entry[direction] = os.path.join(migrations_dir, filename)
+
+    migrations = []
+    for version in sorted(found):
+        entry = found[version]
+        if "up" not in entry or "down" not in entry:
+            raise ValueError(f"版本 {version:04d}_{entry['name']} 缺少 {dialect} 的 up 或 down 檔案")
+        migrations.append((version, entry["name"], entry["up"], entry["down"]))
+    return migrations
+
+
+class MigrationCheckFailed(Exception):
+    """版本的 .check.sql 查到資料，不能套用。problems 為 [(查詢, 結果列)]。"""
+
+    def __init__(self, version, name, problems):
+        self.version = version
+        self.name = name
+        self.problems = problems
+        super().__init__(f"{version:04d}_{name} 套用前檢查未通過（{len(problems)} 個查詢有結果）")
+
+
+def check_path(up_path):
+    """版本的套用前檢查檔（NNNN_名稱.check.sql），不存在時回傳 None。"""
+    directory, filename = os.path.split(up_path)
+    match = _FILENAME_PATTERN.match(filename)
+    path = os.path.join(directory, f"{match.group(1)}_{match.group(2)}.check.sql")
+    return path if os.path.exists(path) else None
+
+
+def split_statements(sql_text):
+    """去掉 -- 註解後以行尾的分號切成個別語句。"""
+    lines = [line for line in sql_text.splitlines() if not line.strip().startswith("--")]
+    statements = re.split(r";\s*$", "\n".join(lines), flags=re.MULTILINE)
+    return [statement.strip() for statement in statements if statement.strip()]
+
+
+def _ensure_migrations_table(cursor):
+    cursor.execute("""
+        CREATE TABLE IF NOT EXISTS schema_migrations (
+            version INT NOT NULL PRIMARY KEY,
+            name VARCHAR(100) NOT NULL,
+            applied_at TIMESTAMP NOT NULL DEFAULT CURRENT_TIMESTAMP
+        )
+    """)
+
+
+def applied_versions(cursor):
+    _ensure_migrations_table(cursor)
+    cursor.execute("SELECT version FROM schema_migrations")
+    return {row[0] for row in cursor.fetchall()}
+
+
+def _run_file(cursor, path):
+    with open(path, encoding="utf-8") as f:
+        for statement in split_statements(f.read()):
+            cursor.execute(statement)
+
+
+def _run_checks(cursor, version, name, up_path):
+    """執行版本的套用前檢查，有結果時拋出 MigrationCheckFailed。"""
+    path = check_path(up_path)
+    if path is None:
+        return
+    with open(path, encoding="utf-8") as f:
+        statements = split_statements(f.read())
+    problems = []
+    for statement in statements:
+        cursor.execute(statement)
+        rows = cursor.fetchall()
+        if rows:
+            problems.append((statement, rows))
+    if problems:
+        raise MigrationCheckFailed(version, name, problems)
+
+
+def migrate_up(target=None, fake=False, connect=get_conn, dialect=None):
+    """
+    套用所有（或到 target 為止）尚未套用的版本，回傳套用的版本列表。
+    connect 可換成連到其他資料庫的函式（例如 tools/query_plan_audit.py 的測試資料庫），
+    dialect 與 connect 的資料庫不同於 DB_BACKEND 時需一併指定。
+    版本的 .check.sql 查到資料時拋出 MigrationCheckFailed，該版本與之後的版本都不套用。
+    """
+    conn = connect()
+    cursor = conn.cursor(buffered=True)
+    done = []
+    try:
+        applied = applied_versions(cursor)
+        for version, name, up_path, _ in discover_migrations(dialect=dialect):
+            if version in applied or (target is not None and version > target):
+                continue
+            if not fake:
+                _run_checks(cursor, version, name, up_path)
+            logging.info(f"⬆️ {version:04d}_{name}{'（僅記錄）' if fake else ''}")
+            if not fake:
+                _run_file(cursor, up_path)
+            cursor.execute("INSERT INTO schema_migrations (version, name) VALUES (%s, %s)", (version, name))
+            conn.commit()
+            done.append(version)
+        return done
+    finally:
+        cursor.close()
+        conn.close()
+
+
+def migrate_down(target=None, steps=1):
+    """
+    回復版本：指定 target 時回復所有大於 target 的版本，否則回復最後 steps 個。
+    回傳回復的版本列表。
+    """
+    conn = get_conn()
+    cursor = conn.cursor(buffered=True)
+    done = []
+    try:
+        applied = applied_versions(cursor)
+        candidates = [m for m in reversed(discover_migrations()) if m[0] in applied]
+        if target is not None:
+            candidates = [m for m in candidates if m[0] > target]
+        else:
+            candidates = candidates[:steps]
+        for version, name, _, down_path in candidates:
+            logging.info(f"⬇️ {version:04d}_{name}")
+            _run_file(cursor, down_path)
+            cursor.execute("DELETE FROM schema_migrations WHERE version = %s", (version,))
+            conn.commit()
+            done.append(version)
+        return done
+    finally:
+        cursor.close()
+        conn.close()
+
+
+def status():
+    conn = get_conn()
+    cursor = conn.cursor(buffered=True)
+    try:
+        applied = applied_versions(cursor)
+        conn.commit()
+    finally:
+        cursor.close()
+        conn.close()
+    return [(version, name, version in applied) for version, name, _, _ in discover_migrations()]
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    subparsers = parser.add_subparsers(dest="command", required=True)
+    subparsers.add_parser("status")
+    up = subparsers.add_parser("up")
+    up.add_argument("--to", type=int, default=None)
+    up.add_argument("--fake", action="store_true")
+    down = subparsers.add_parser("down")
+    down.add_argument("--to", type=int, default=None)
+    down.add_argument("--steps", type=int, default=1)
+    args = parser.parse_args(argv)
+
+    if args.command == "status":
+        for version, name, is_applied in status():
+            print(f"{'✅' if is_applied else '⬜'} {version:04d}_{name}")
+    elif args.command == "up":
+        try:
+            done = migrate_up(target=args.to, fake=args.fake)
+        except MigrationCheckFailed as e:
+            print(f"❌ {e}")
+            for statement, rows in e.problems:
+                print(f"\n{statement}")
+                for row in rows:
+                    print(f"  {row}")
+            return 1
+        print(f"已套用 {len(done)} 個版本" if done else "沒有需要套用的版本")
+    else:
+        done = migrate_down(target=args.to, steps=args.steps)
+        print(f"已回復 {len(done)} 個版本" if done else "沒有需要回復的版本")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
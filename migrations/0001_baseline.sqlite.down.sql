@@ -0,0 +1,12 @@
+-- ⚠️ 會刪除所有資料，僅供開發環境重建使用
+DROP TABLE IF EXISTS user_temp_state;
+DROP TABLE IF EXISTS reminder_time;
+DROP TABLE IF EXISTS medication_record;
+DROP TABLE IF EXISTS medication_main;
+DROP TABLE IF EXISTS drug_info;
+DROP TABLE IF EXISTS suggested_dosage_time;
+DROP TABLE IF EXISTS frequency_code;
+DROP TABLE IF EXISTS invitation_recipients;
+DROP TABLE IF EXISTS invite_codes;
+DROP TABLE IF EXISTS patients;
+DROP TABLE IF EXISTS users;
@@ -0,0 +1,112 @@
+-- 基準 schema（SQLite 版）：欄位與 0001_baseline.up.sql 相同。
+-- 自動編號欄位使用 INTEGER PRIMARY KEY（即 rowid）；ON UPDATE CURRENT_TIMESTAMP 以觸發器代替。
+-- TIME 欄位一律存成 HH:MM:SS，比較與排程比對才會和 MySQL 一致（寫入 '08:00' 時由觸發器正規化）。
+
+CREATE TABLE IF NOT EXISTS users (
+    recorder_id VARCHAR(64) NOT NULL PRIMARY KEY,
+    user_name VARCHAR(100) NOT NULL DEFAULT '新用戶',
+    created_at TIMESTAMP NOT NULL DEFAULT (datetime('now', 'localtime'))
+);
+
+CREATE TABLE IF NOT EXISTS patients (
+    patient_id INTEGER PRIMARY KEY AUTOINCREMENT,
+    recorder_id VARCHAR(64) NOT NULL,
+    member VARCHAR(100) NOT NULL,
+    linked_user_id VARCHAR(64) NULL,
+    created_at TIMESTAMP NOT NULL DEFAULT (datetime('now', 'localtime'))
+);
+
+CREATE TABLE IF NOT EXISTS invite_codes (
+    id INTEGER PRIMARY KEY AUTOINCREMENT,
+    code VARCHAR(16) NOT NULL,
+    inviter_recorder_id VARCHAR(64) NOT NULL,
+    expires_at DATETIME NOT NULL,
+    used BOOLEAN NOT NULL DEFAULT FALSE,
+    bound_at DATETIME NULL,
+    recipient_line_id VARCHAR(64) NULL,
+    created_at TIMESTAMP NOT NULL DEFAULT (datetime('now', 'localtime'))
+);
+
+CREATE TABLE IF NOT EXISTS invitation_recipients (
+    id INTEGER PRIMARY KEY AUTOINCREMENT,
+    recorder_id VARCHAR(64) NOT NULL,
+    recipient_line_id VARCHAR(64) NOT NULL,
+    recipient_name VARCHAR(100) NULL,
+    relation_type VARCHAR(32) NULL,
+    created_at TIMESTAMP NOT NULL DEFAULT (datetime('now', 'localtime'))
+);
+
+CREATE TABLE IF NOT EXISTS frequency_code (
+    frequency_code VARCHAR(16) NOT NULL PRIMARY KEY,
+    frequency_name VARCHAR(64) NOT NULL,
+    times_per_day INT NULL
+);
+
+CREATE TABLE IF NOT EXISTS suggested_dosage_time (
+    frequency_code VARCHAR(16) NOT NULL PRIMARY KEY,
+    time_slot_1 TIME NULL,
+    time_slot_2 TIME NULL,
+    time_slot_3 TIME NULL,
+    time_slot_4 TIME NULL
+);
+
+CREATE TABLE IF NOT EXISTS drug_info (
+    drug_id INTEGER PRIMARY KEY AUTOINCREMENT,
+    drug_name_zh VARCHAR(200) NULL,
+    drug_name_en VARCHAR(200) NULL
+);
+
+CREATE TABLE IF NOT EXISTS medication_main (
+    mm_id INTEGER PRIMARY KEY AUTOINCREMENT,
+    recorder_id VARCHAR(64) NOT NULL,
+    member VARCHAR(100) NOT NULL,
+    clinic_name VARCHAR(100) NULL,
+    visit_date DATE NULL,
+    doctor_name VARCHAR(100) NULL,
+    created_at TIMESTAMP NOT NULL DEFAULT (datetime('now', 'localtime'))
+);
+
+CREATE TABLE IF NOT EXISTS medication_record (
+    mr_id INTEGER PRIMARY KEY AUTOINCREMENT,
+    mm_id INT NULL,
+    recorder_id VARCHAR(64) NOT NULL,
+    member VARCHAR(100) NOT NULL,
+    drug_name_zh VARCHAR(200) NULL,
+    frequency_count_code VARCHAR(16) NULL,
+    frequency_name VARCHAR(64) NULL,
+    source_detail VARCHAR(64) NULL,
+    dose_quantity VARCHAR(32) NULL,
+    dosage_unit VARCHAR(16) NULL,
+    days INT NULL,
+    created_at TIMESTAMP NOT NULL DEFAULT (datetime('now', 'localtime'))
+);
+
+CREATE TABLE IF NOT EXISTS reminder_time (
+    reminder_time_id INTEGER PRIMARY KEY AUTOINCREMENT,
+    recorder_id VARCHAR(64) NOT NULL,
+    member VARCHAR(100) NOT NULL,
+    frequency_name VARCHAR(64) NOT NULL,
+    time_slot_1 TIME NULL,
+    time_slot_2 TIME NULL,
+    time_slot_3 TIME NULL,
+    time_slot_4 TIME NULL,
+    total_doses_per_day INT NULL,
+    created_at TIMESTAMP NOT NULL DEFAULT (datetime('now', 'localtime')),
+    updated_at TIMESTAMP NOT NULL DEFAULT (datetime('now', 'localtime'))
+);
+
+CREATE TABLE IF NOT EXISTS user_temp_state (
+    recorder_id VARCHAR(64) NOT NULL PRIMARY KEY,
+    state_data JSON NULL,
+    updated_at TIMESTAMP NOT NULL DEFAULT (datetime('now', 'localtime'))
+);
+
+-- 觸發器內的 UPDATE 不會再觸發觸發器（recursive_triggers 預設關閉）
+CREATE TRIGGER IF NOT EXISTS trg_reminder_time_times_insert AFTER INSERT ON reminder_time
+BEGIN UPDATE reminder_time SET time_slot_1 = time(NEW.time_slot_1), time_slot_2 = time(NEW.time_slot_2), time_slot_3 = time(NEW.time_slot_3), time_slot_4 = time(NEW.time_slot_4) WHERE reminder_time_id = NEW.reminder_time_id; END;
+
+CREATE TRIGGER IF NOT EXISTS trg_reminder_time_updated AFTER UPDATE ON reminder_time
+BEGIN UPDATE reminder_time SET time_slot_1 = time(NEW.time_slot_1), time_slot_2 = time(NEW.time_slot_2), time_slot_3 = time(NEW.time_slot_3), time_slot_4 = time(NEW.time_slot_4), updated_at = datetime('now', 'localtime') WHERE reminder_time_id = NEW.reminder_time_id; END;
+
+CREATE TRIGGER IF NOT EXISTS trg_user_temp_state_updated AFTER UPDATE ON user_temp_state
+BEGIN UPDATE user_temp_state SET updated_at = datetime('now', 'localtime') WHERE recorder_id = NEW.recorder_id; END;
@@ -0,0 +1,101 @@
+-- 基準 schema：依程式中使用到的欄位整理，已存在的資料表不會被修改。
+-- 既有資料庫若已有這些資料表，可用 `python migrate.py up --fake --to 1` 只記錄版本。
+
+CREATE TABLE IF NOT EXISTS users (
+    recorder_id VARCHAR(64) NOT NULL PRIMARY KEY,
+    user_name VARCHAR(100) NOT NULL DEFAULT '新用戶',
+    created_at TIMESTAMP NOT NULL DEFAULT CURRENT_TIMESTAMP
+) DEFAULT CHARSET = utf8mb4;
+
+CREATE TABLE IF NOT EXISTS patients (
+    patient_id INT NOT NULL AUTO_INCREMENT PRIMARY KEY,
+    recorder_id VARCHAR(64) NOT NULL,
+    member VARCHAR(100) NOT NULL,
+    linked_user_id VARCHAR(64) NULL,
+    created_at TIMESTAMP NOT NULL DEFAULT CURRENT_TIMESTAMP
+) DEFAULT CHARSET = utf8mb4;
+
+CREATE TABLE IF NOT EXISTS invite_codes (
+    id INT NOT NULL AUTO_INCREMENT PRIMARY KEY,
+    code VARCHAR(16) NOT NULL,
+    inviter_recorder_id VARCHAR(64) NOT NULL,
+    expires_at DATETIME NOT NULL,
+    used BOOLEAN NOT NULL DEFAULT FALSE,
+    bound_at DATETIME NULL,
+    recipient_line_id VARCHAR(64) NULL,
+    created_at TIMESTAMP NOT NULL DEFAULT CURRENT_TIMESTAMP
+) DEFAULT CHARSET = utf8mb4;
+
+CREATE TABLE IF NOT EXISTS invitation_recipients (
+    id INT NOT NULL AUTO_INCREMENT PRIMARY KEY,
+    recorder_id VARCHAR(64) NOT NULL,
+    recipient_line_id VARCHAR(64) NOT NULL,
+    recipient_name VARCHAR(100) NULL,
+    relation_type VARCHAR(32) NULL,
+    created_at TIMESTAMP NOT NULL DEFAULT CURRENT_TIMESTAMP
+) DEFAULT CHARSET = utf8mb4;
+
+CREATE TABLE IF NOT EXISTS frequency_code (
+    frequency_code VARCHAR(16) NOT NULL PRIMARY KEY,
+    frequency_name VARCHAR(64) NOT NULL,
+    times_per_day INT NULL
+) DEFAULT CHARSET = utf8mb4;
+
+CREATE TABLE IF NOT EXISTS suggested_dosage_time (
+    frequency_code VARCHAR(16) NOT NULL PRIMARY KEY,
+    time_slot_1 TIME NULL,
+    time_slot_2 TIME NULL,
+    time_slot_3 TIME NULL,
+    time_slot_4 TIME NULL
+) DEFAULT CHARSET = utf8mb4;
+
+CREATE TABLE IF NOT EXISTS drug_info (
+    drug_id INT NOT NULL AUTO_INCREMENT PRIMARY KEY,
+    drug_name_zh VARCHAR(200) NULL,
+    drug_name_en VARCHAR(200) NULL
+) DEFAULT CHARSET = utf8mb4;
+
+CREATE TABLE IF NOT EXISTS medication_main (
+    mm_id INT NOT NULL AUTO_INCREMENT PRIMARY KEY,
+    recorder_id VARCHAR(64) NOT NULL,
+    member VARCHAR(100) NOT NULL,
+    clinic_name VARCHAR(100) NULL,
+    visit_date DATE NULL,
+    doctor_name VARCHAR(100) NULL,
+    created_at TIMESTAMP NOT NULL DEFAULT CURRENT_TIMESTAMP
+) DEFAULT CHARSET = utf8mb4;
+
+CREATE TABLE IF NOT EXISTS medication_record (
+    mr_id INT NOT NULL AUTO_INCREMENT PRIMARY KEY,
+    mm_id INT NULL,
+    recorder_id VARCHAR(64) NOT NULL,
+    member VARCHAR(100) NOT NULL,
+    drug_name_zh VARCHAR(200) NULL,
+    frequency_count_code VARCHAR(16) NULL,
+    frequency_name VARCHAR(64) NULL,
+    source_detail VARCHAR(64) NULL,
+    dose_quantity VARCHAR(32) NULL,
+    dosage_unit VARCHAR(16) NULL,
+    days INT NULL,
+    created_at TIMESTAMP NOT NULL DEFAULT CURRENT_TIMESTAMP
+) DEFAULT CHARSET = utf8mb4;
+
+CREATE TABLE IF NOT EXISTS reminder_time (
+    reminder_time_id INT NOT NULL AUTO_INCREMENT PRIMARY KEY,
+    recorder_id VARCHAR(64) NOT NULL,
+    member VARCHAR(100) NOT NULL,
+    frequency_name VARCHAR(64) NOT NULL,
+    time_slot_1 TIME NULL,
+    time_slot_2 TIME NULL,
+    time_slot_3 TIME NULL,
+    time_slot_4 TIME NULL,
+    total_doses_per_day INT NULL,
+    created_at TIMESTAMP NOT NULL DEFAULT CURRENT_TIMESTAMP,
+    updated_at TIMESTAMP NOT NULL DEFAULT CURRENT_TIMESTAMP ON UPDATE CURRENT_TIMESTAMP
+) DEFAULT CHARSET = utf8mb4;
+
+CREATE TABLE IF NOT EXISTS user_temp_state (
+    recorder_id VARCHAR(64) NOT NULL PRIMARY KEY,
+    state_data JSON NULL,
+    updated_at TIMESTAMP NOT NULL DEFAULT CURRENT_TIMESTAMP ON UPDATE CURRENT_TIMESTAMP
+) DEFAULT CHARSET = utf8mb4;
@@ -0,0 +1 @@
+DROP TABLE IF EXISTS frequency_synonym;
@@ -0,0 +1,19 @@
+-- 用藥頻率同義詞：OCR / 使用者輸入的頻率文字 → frequency_code
+-- 同一段文字命中多個片語時，priority 數字小者優先
+CREATE TABLE IF NOT EXISTS frequency_synonym (
+    phrase VARCHAR(64) NOT NULL PRIMARY KEY,
+    frequency_code VARCHAR(16) NOT NULL,
+    priority INT NOT NULL DEFAULT 100
+);
+
+CREATE INDEX IF NOT EXISTS idx_frequency_synonym_code ON frequency_synonym (frequency_code);
+
+INSERT OR IGNORE INTO frequency_synonym (phrase, frequency_code, priority) VALUES
+    ('一日一次', 'QD', 10), ('每日一次', 'QD', 10), ('QD', 'QD', 10),
+    ('一日二次', 'BID', 20), ('一日兩次', 'BID', 20), ('每日兩次', 'BID', 20), ('BID', 'BID', 20),
+    ('一日三次', 'TID', 30), ('每日三次', 'TID', 30), ('飯後早中晚', 'TID', 30), ('TID', 'TID', 30),
+    ('一日四次', 'QID', 40), ('每日四次', 'QID', 40), ('QID', 'QID', 40),
+    ('睡前', 'HS', 50), ('HS', 'HS', 50),
+    ('飯前', 'AC', 60), ('AC', 'AC', 60),
+    ('飯後', 'PC', 70), ('PC', 'PC', 70),
+    ('視需要服用', 'PRN', 80), ('需要時', 'PRN', 80), ('PRN', 'PRN', 80);
@@ -0,0 +1,17 @@
+-- 0003 套用前的檢查（MySQL 與 SQLite 共用）：每個查詢列出違反新唯一鍵的重複資料，
+-- 任一查詢有結果時 migrate.py 不會套用此版本。請先人工整理（合併或刪除重複列）後再重新執行。
+
+SELECT 'reminder_time' AS table_name, recorder_id, member, frequency_name, COUNT(*) AS copies
+FROM reminder_time GROUP BY recorder_id, member, frequency_name HAVING COUNT(*) > 1;
+
+SELECT 'patients' AS table_name, recorder_id, member, COUNT(*) AS copies
+FROM patients GROUP BY recorder_id, member HAVING COUNT(*) > 1;
+
+SELECT 'frequency_code' AS table_name, frequency_name, COUNT(*) AS copies
+FROM frequency_code GROUP BY frequency_name HAVING COUNT(*) > 1;
+
+SELECT 'medication_main' AS table_name, recorder_id, member, visit_date, COUNT(*) AS copies
+FROM medication_main GROUP BY recorder_id, member, visit_date HAVING COUNT(*) > 1;
+
+SELECT 'invitation_recipients' AS table_name, recorder_id, recipient_line_id, COUNT(*) AS copies
+FROM invitation_recipients GROUP BY recorder_id, recipient_line_id HAVING COUNT(*) > 1;
@@ -0,0 +1,12 @@
+ALTER TABLE user_temp_state DROP KEY idx_user_temp_state_updated;
+ALTER TABLE drug_info DROP KEY idx_drug_info_name;
+ALTER TABLE invite_codes DROP KEY idx_invite_codes_code, DROP KEY idx_invite_codes_expires;
+ALTER TABLE invitation_recipients DROP KEY uq_invitation_recipients_pair, DROP KEY idx_invitation_recipients_reverse;
+ALTER TABLE medication_record
+    DROP KEY idx_medication_record_member_freq,
+    DROP KEY idx_medication_record_mm,
+    DROP KEY idx_medication_record_created;
+ALTER TABLE medication_main DROP KEY uq_medication_main_visit;
+ALTER TABLE frequency_code DROP KEY uq_frequency_code_name;
+ALTER TABLE patients DROP KEY uq_patients_member, DROP KEY idx_patients_linked_user;
+ALTER TABLE reminder_time DROP KEY uq_reminder_time_frequency, DROP KEY idx_reminder_time_frequency_name;
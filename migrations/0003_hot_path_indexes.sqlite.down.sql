@@ -0,0 +1,15 @@
+DROP INDEX IF EXISTS idx_user_temp_state_updated;
+DROP INDEX IF EXISTS idx_drug_info_name;
+DROP INDEX IF EXISTS idx_invite_codes_code;
+DROP INDEX IF EXISTS idx_invite_codes_expires;
+DROP INDEX IF EXISTS uq_invitation_recipients_pair;
+DROP INDEX IF EXISTS idx_invitation_recipients_reverse;
+DROP INDEX IF EXISTS idx_medication_record_member_freq;
+DROP INDEX IF EXISTS idx_medication_record_mm;
+DROP INDEX IF EXISTS idx_medication_record_created;
+DROP INDEX IF EXISTS uq_medication_main_visit;
+DROP INDEX IF EXISTS uq_frequency_code_name;
+DROP INDEX IF EXISTS uq_patients_member;
+DROP INDEX IF EXISTS idx_patients_linked_user;
+DROP INDEX IF EXISTS uq_reminder_time_frequency;
+DROP INDEX IF EXISTS idx_reminder_time_frequency_name;
@@ -0,0 +1,26 @@
+-- 熱門查詢與單一語句寫入所需的複合索引與唯一鍵（SQLite 版，索引名稱與 MySQL 相同）。
+-- 各索引的用途見 0003_hot_path_indexes.up.sql；套用前的重複資料檢查見 0003_hot_path_indexes.check.sql。
+
+CREATE UNIQUE INDEX IF NOT EXISTS uq_reminder_time_frequency ON reminder_time (recorder_id, member, frequency_name);
+CREATE INDEX IF NOT EXISTS idx_reminder_time_frequency_name ON reminder_time (frequency_name);
+
+CREATE UNIQUE INDEX IF NOT EXISTS uq_patients_member ON patients (recorder_id, member);
+CREATE INDEX IF NOT EXISTS idx_patients_linked_user ON patients (linked_user_id);
+
+CREATE UNIQUE INDEX IF NOT EXISTS uq_frequency_code_name ON frequency_code (frequency_name);
+
+CREATE UNIQUE INDEX IF NOT EXISTS uq_medication_main_visit ON medication_main (recorder_id, member, visit_date);
+
+CREATE INDEX IF NOT EXISTS idx_medication_record_member_freq ON medication_record (recorder_id, member, frequency_count_code);
+CREATE INDEX IF NOT EXISTS idx_medication_record_mm ON medication_record (mm_id, drug_name_zh);
+CREATE INDEX IF NOT EXISTS idx_medication_record_created ON medication_record (created_at);
+
+CREATE UNIQUE INDEX IF NOT EXISTS uq_invitation_recipients_pair ON invitation_recipients (recorder_id, recipient_line_id);
+CREATE INDEX IF NOT EXISTS idx_invitation_recipients_reverse ON invitation_recipients (recipient_line_id, recorder_id);
+
+CREATE INDEX IF NOT EXISTS idx_invite_codes_code ON invite_codes (code);
+CREATE INDEX IF NOT EXISTS idx_invite_codes_expires ON invite_codes (expires_at);
+
+CREATE INDEX IF NOT EXISTS idx_drug_info_name ON drug_info (drug_name_zh);
+
+CREATE INDEX IF NOT EXISTS idx_user_temp_state_updated ON user_temp_state (updated_at);
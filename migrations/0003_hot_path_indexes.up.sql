@@ -0,0 +1,47 @@
+-- 熱門查詢與單一語句寫入所需的複合索引與唯一鍵。
+-- 加唯一鍵前若已有重複資料會失敗：migrate.py 會先執行 0003_hot_path_indexes.check.sql，
+-- 有重複資料時列出重複的鍵並停止，不會只套用一部分。
+
+-- reminder_time：(recorder_id, member, frequency_name) 為 upsert 的唯一鍵，也涵蓋依用藥者列出提醒的查詢；
+-- 排程比對時間時以 frequency_name 連接 frequency_code
+ALTER TABLE reminder_time
+    ADD UNIQUE KEY uq_reminder_time_frequency (recorder_id, member, frequency_name),
+    ADD KEY idx_reminder_time_frequency_name (frequency_name);
+
+-- patients：每位記錄者的成員名稱不重複；被綁定的家人以 linked_user_id 反查
+ALTER TABLE patients
+    ADD UNIQUE KEY uq_patients_member (recorder_id, member),
+    ADD KEY idx_patients_linked_user (linked_user_id);
+
+-- frequency_code：reminder_time 以中文名稱連接
+ALTER TABLE frequency_code
+    ADD UNIQUE KEY uq_frequency_code_name (frequency_name);
+
+-- medication_main：每位用藥者每個看診日期一張藥單
+ALTER TABLE medication_main
+    ADD UNIQUE KEY uq_medication_main_visit (recorder_id, member, visit_date);
+
+-- medication_record：提醒與 reminder_time 以 (recorder_id, member, frequency_count_code) 連接；
+-- mm_id 供去重與孤兒藥單清理，created_at 供 housekeeping 依時間批次刪除
+ALTER TABLE medication_record
+    ADD KEY idx_medication_record_member_freq (recorder_id, member, frequency_count_code),
+    ADD KEY idx_medication_record_mm (mm_id, drug_name_zh),
+    ADD KEY idx_medication_record_created (created_at);
+
+-- invitation_recipients：家庭關係兩個方向都會查（邀請人 → 被邀請人、被邀請人 → 邀請人）
+ALTER TABLE invitation_recipients
+    ADD UNIQUE KEY uq_invitation_recipients_pair (recorder_id, recipient_line_id),
+    ADD KEY idx_invitation_recipients_reverse (recipient_line_id, recorder_id);
+
+-- invite_codes：以邀請碼認領；housekeeping 依到期時間清除
+ALTER TABLE invite_codes
+    ADD KEY idx_invite_codes_code (code),
+    ADD KEY idx_invite_codes_expires (expires_at);
+
+-- drug_info：以中文藥名查詢 drug_id 與 LEFT JOIN
+ALTER TABLE drug_info
+    ADD KEY idx_drug_info_name (drug_name_zh);
+
+-- user_temp_state：housekeeping 依更新時間清除過期暫存狀態
+ALTER TABLE user_temp_state
+    ADD KEY idx_user_temp_state_updated (updated_at);
@@ -0,0 +1,2 @@
+DROP TABLE IF EXISTS dose_daily_rollup;
+DROP TABLE IF EXISTS dose_log;
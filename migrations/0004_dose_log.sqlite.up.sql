@@ -0,0 +1,30 @@
+-- 服藥紀錄（SQLite 版）：欄位與索引同 0004_dose_log.up.sql，SQLite 沒有分區，
+-- 超過保留期限的紀錄由 housekeeping 分批刪除。
+CREATE TABLE IF NOT EXISTS dose_log (
+    dose_log_id INTEGER PRIMARY KEY AUTOINCREMENT,
+    recorder_id VARCHAR(64) NOT NULL,
+    member VARCHAR(100) NOT NULL,
+    drug_name_zh VARCHAR(200) NOT NULL,
+    scheduled_date DATE NOT NULL,
+    slot_time TIME NOT NULL,
+    status VARCHAR(8) NOT NULL CHECK (status IN ('taken', 'skipped')),
+    responder_id VARCHAR(64) NOT NULL,
+    response_token CHAR(32) NOT NULL,
+    responded_at TIMESTAMP NOT NULL DEFAULT (datetime('now', 'localtime'))
+);
+
+CREATE UNIQUE INDEX IF NOT EXISTS uq_dose_log_slot ON dose_log (recorder_id, member, scheduled_date, slot_time, drug_name_zh);
+
+CREATE TABLE IF NOT EXISTS dose_daily_rollup (
+    recorder_id VARCHAR(64) NOT NULL,
+    member VARCHAR(100) NOT NULL,
+    dose_date DATE NOT NULL,
+    drug_name_zh VARCHAR(200) NOT NULL,
+    taken_count INT NOT NULL DEFAULT 0,
+    skipped_count INT NOT NULL DEFAULT 0,
+    updated_at TIMESTAMP NOT NULL DEFAULT (datetime('now', 'localtime')),
+    PRIMARY KEY (recorder_id, member, dose_date, drug_name_zh)
+);
+
+CREATE TRIGGER IF NOT EXISTS trg_dose_daily_rollup_updated AFTER UPDATE ON dose_daily_rollup
+BEGIN UPDATE dose_daily_rollup SET updated_at = datetime('now', 'localtime') WHERE recorder_id = NEW.recorder_id AND member = NEW.member AND dose_date = NEW.dose_date AND drug_name_zh = NEW.drug_name_zh; END;
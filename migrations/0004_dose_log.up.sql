@@ -0,0 +1,34 @@
+-- 服藥紀錄：提醒推播的「已服用 / 略過」回覆，只新增不修改。
+-- 依 scheduled_date 按月分區（RANGE COLUMNS），分區由 housekeeping 預先建立與依保留期限整個刪除；
+-- 建立時只有 p_future；第一次 housekeeping 依當時的月份切出 p_history（本月之前）與本月起的每月分區，
+-- 邊界不寫死在這裡，何時建立資料庫都一樣。
+-- 分區表的唯一鍵必須包含分區欄位：同一時段同一藥品只記第一次回覆（INSERT IGNORE）。
+CREATE TABLE IF NOT EXISTS dose_log (
+    dose_log_id BIGINT NOT NULL AUTO_INCREMENT,
+    recorder_id VARCHAR(64) NOT NULL,
+    member VARCHAR(100) NOT NULL,
+    drug_name_zh VARCHAR(200) NOT NULL,
+    scheduled_date DATE NOT NULL,
+    slot_time TIME NOT NULL,
+    status ENUM('taken', 'skipped') NOT NULL,
+    responder_id VARCHAR(64) NOT NULL,
+    response_token CHAR(32) NOT NULL,
+    responded_at TIMESTAMP NOT NULL DEFAULT CURRENT_TIMESTAMP,
+    PRIMARY KEY (dose_log_id, scheduled_date),
+    UNIQUE KEY uq_dose_log_slot (recorder_id, member, scheduled_date, slot_time, drug_name_zh)
+) DEFAULT CHARSET = utf8mb4
+PARTITION BY RANGE COLUMNS (scheduled_date) (
+    PARTITION p_future VALUES LESS THAN (MAXVALUE)
+);
+
+-- 每位用藥者每天每個藥品的回覆次數，寫入紀錄時在同一交易內累加；服藥統計只查這張表
+CREATE TABLE IF NOT EXISTS dose_daily_rollup (
+    recorder_id VARCHAR(64) NOT NULL,
+    member VARCHAR(100) NOT NULL,
+    dose_date DATE NOT NULL,
+    drug_name_zh VARCHAR(200) NOT NULL,
+    taken_count INT NOT NULL DEFAULT 0,
+    skipped_count INT NOT NULL DEFAULT 0,
+    updated_at TIMESTAMP NOT NULL DEFAULT CURRENT_TIMESTAMP ON UPDATE CURRENT_TIMESTAMP,
+    PRIMARY KEY (recorder_id, member, dose_date, drug_name_zh)
+) DEFAULT CHARSET = utf8mb4;
@@ -0,0 +1,14 @@
+-- 封存的記錄先搬回 medication_record，再移除欄位與索引
+INSERT IGNORE INTO medication_record (
+    mr_id, mm_id, recorder_id, member, drug_name_zh, frequency_count_code, frequency_name,
+    source_detail, dose_quantity, dosage_unit, days, created_at
+)
+SELECT mr_id, mm_id, recorder_id, member, drug_name_zh, frequency_count_code, frequency_name,
+       source_detail, dose_quantity, dosage_unit, days, created_at
+FROM medication_record_archive;
+DROP TABLE IF EXISTS medication_record_archive;
+ALTER TABLE medication_record
+    DROP KEY idx_medication_record_course_end,
+    DROP KEY idx_medication_record_member_freq,
+    ADD KEY idx_medication_record_member_freq (recorder_id, member, frequency_count_code),
+    DROP COLUMN course_end_date;
@@ -0,0 +1,12 @@
+INSERT OR IGNORE INTO medication_record (
+    mr_id, mm_id, recorder_id, member, drug_name_zh, frequency_count_code, frequency_name,
+    source_detail, dose_quantity, dosage_unit, days, created_at
+)
+SELECT mr_id, mm_id, recorder_id, member, drug_name_zh, frequency_count_code, frequency_name,
+       source_detail, dose_quantity, dosage_unit, days, created_at
+FROM medication_record_archive;
+DROP TABLE IF EXISTS medication_record_archive;
+DROP INDEX IF EXISTS idx_medication_record_course_end;
+DROP INDEX IF EXISTS idx_medication_record_member_freq;
+ALTER TABLE medication_record DROP COLUMN course_end_date;
+CREATE INDEX IF NOT EXISTS idx_medication_record_member_freq ON medication_record (recorder_id, member, frequency_count_code);
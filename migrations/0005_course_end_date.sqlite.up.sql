@@ -0,0 +1,32 @@
+-- 療程結束日（SQLite 版）：欄位、索引與封存資料表同 0005_course_end_date.up.sql。
+ALTER TABLE medication_record ADD COLUMN course_end_date DATE NOT NULL DEFAULT '9999-12-31';
+
+DROP INDEX IF EXISTS idx_medication_record_member_freq;
+CREATE INDEX IF NOT EXISTS idx_medication_record_member_freq ON medication_record (recorder_id, member, frequency_count_code, course_end_date);
+CREATE INDEX IF NOT EXISTS idx_medication_record_course_end ON medication_record (course_end_date);
+
+UPDATE medication_record
+SET course_end_date = date(
+    COALESCE((SELECT mm.visit_date FROM medication_main mm WHERE mm.mm_id = medication_record.mm_id), created_at),
+    '+' || (days - 1) || ' days'
+)
+WHERE days > 0;
+
+CREATE TABLE IF NOT EXISTS medication_record_archive (
+    mr_id INTEGER NOT NULL PRIMARY KEY,
+    mm_id INT NULL,
+    recorder_id VARCHAR(64) NOT NULL,
+    member VARCHAR(100) NOT NULL,
+    drug_name_zh VARCHAR(200) NULL,
+    frequency_count_code VARCHAR(16) NULL,
+    frequency_name VARCHAR(64) NULL,
+    source_detail VARCHAR(64) NULL,
+    dose_quantity VARCHAR(32) NULL,
+    dosage_unit VARCHAR(16) NULL,
+    days INT NULL,
+    course_end_date DATE NOT NULL,
+    created_at TIMESTAMP NOT NULL DEFAULT (datetime('now', 'localtime')),
+    archived_at TIMESTAMP NOT NULL DEFAULT (datetime('now', 'localtime'))
+);
+
+CREATE INDEX IF NOT EXISTS idx_medication_record_archive_member ON medication_record_archive (recorder_id, member, course_end_date);
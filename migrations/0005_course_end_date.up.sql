@@ -0,0 +1,33 @@
+-- 療程結束日：看診日期起算給藥天數（含看診當天），即 visit_date + days - 1。
+-- 沒有天數的藥品視為長期用藥，記為 9999-12-31；不用 NULL，提醒排程的 course_end_date >= CURDATE()
+-- 才能接在 (recorder_id, member, frequency_count_code) 之後以索引範圍過濾，已結束的療程不必回表。
+ALTER TABLE medication_record
+    ADD COLUMN course_end_date DATE NOT NULL DEFAULT '9999-12-31' AFTER days,
+    DROP KEY idx_medication_record_member_freq,
+    ADD KEY idx_medication_record_member_freq (recorder_id, member, frequency_count_code, course_end_date),
+    ADD KEY idx_medication_record_course_end (course_end_date);
+
+-- 既有資料：有藥單者以看診日期起算，沒有藥單或看診日期者以建立日期起算
+UPDATE medication_record mr
+LEFT JOIN medication_main mm ON mm.mm_id = mr.mm_id
+SET mr.course_end_date = COALESCE(mm.visit_date, DATE(mr.created_at)) + INTERVAL (mr.days - 1) DAY
+WHERE mr.days > 0;
+
+-- 已結束的療程由 housekeeping 從 medication_record 搬到這裡，保留用藥歷史但不再參與提醒查詢
+CREATE TABLE IF NOT EXISTS medication_record_archive (
+    mr_id INT NOT NULL PRIMARY KEY,
+    mm_id INT NULL,
+    recorder_id VARCHAR(64) NOT NULL,
+    member VARCHAR(100) NOT NULL,
+    drug_name_zh VARCHAR(200) NULL,
+    frequency_count_code VARCHAR(16) NULL,
+    frequency_name VARCHAR(64) NULL,
+    source_detail VARCHAR(64) NULL,
+    dose_quantity VARCHAR(32) NULL,
+    dosage_unit VARCHAR(16) NULL,
+    days INT NULL,
+    course_end_date DATE NOT NULL,
+    created_at TIMESTAMP NOT NULL DEFAULT CURRENT_TIMESTAMP,
+    archived_at TIMESTAMP NOT NULL DEFAULT CURRENT_TIMESTAMP,
+    KEY idx_medication_record_archive_member (recorder_id, member, course_end_date)
+) DEFAULT CHARSET = utf8mb4;
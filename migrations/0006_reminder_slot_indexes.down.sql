@@ -0,0 +1,5 @@
+ALTER TABLE reminder_time
+    DROP KEY idx_reminder_time_slot_1,
+    DROP KEY idx_reminder_time_slot_2,
+    DROP KEY idx_reminder_time_slot_3,
+    DROP KEY idx_reminder_time_slot_4;
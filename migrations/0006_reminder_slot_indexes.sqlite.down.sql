@@ -0,0 +1,4 @@
+DROP INDEX IF EXISTS idx_reminder_time_slot_1;
+DROP INDEX IF EXISTS idx_reminder_time_slot_2;
+DROP INDEX IF EXISTS idx_reminder_time_slot_3;
+DROP INDEX IF EXISTS idx_reminder_time_slot_4;
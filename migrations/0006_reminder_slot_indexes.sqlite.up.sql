@@ -0,0 +1,5 @@
+-- 提醒時段索引（SQLite 版，用途見 0006_reminder_slot_indexes.up.sql；SQLite 以 multi-index OR 使用）。
+CREATE INDEX IF NOT EXISTS idx_reminder_time_slot_1 ON reminder_time (time_slot_1);
+CREATE INDEX IF NOT EXISTS idx_reminder_time_slot_2 ON reminder_time (time_slot_2);
+CREATE INDEX IF NOT EXISTS idx_reminder_time_slot_3 ON reminder_time (time_slot_3);
+CREATE INDEX IF NOT EXISTS idx_reminder_time_slot_4 ON reminder_time (time_slot_4);
@@ -0,0 +1,7 @@
+-- 提醒排程每分鐘以 time_slot_1 = ? OR ... OR time_slot_4 = ? 找出到期的提醒，
+-- 每個時段欄位各一個索引，MySQL 以 index_merge（union）只讀取到期的列，不必掃描整張 reminder_time。
+ALTER TABLE reminder_time
+    ADD KEY idx_reminder_time_slot_1 (time_slot_1),
+    ADD KEY idx_reminder_time_slot_2 (time_slot_2),
+    ADD KEY idx_reminder_time_slot_3 (time_slot_3),
+    ADD KEY idx_reminder_time_slot_4 (time_slot_4);
@@ -0,0 +1 @@
+-- 刪除的空提醒沒有任何時段，不需要還原。
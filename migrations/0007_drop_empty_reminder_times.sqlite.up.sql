@@ -0,0 +1,4 @@
+-- 刪除時段全空的提醒（SQLite 版，用途見 0007_drop_empty_reminder_times.up.sql）。
+DELETE FROM reminder_time
+WHERE time_slot_1 IS NULL AND time_slot_2 IS NULL
+  AND time_slot_3 IS NULL AND time_slot_4 IS NULL;
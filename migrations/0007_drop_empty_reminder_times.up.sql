@@ -0,0 +1,5 @@
+-- 清除時段後沒有剩下任何時段的提醒，現在於同一交易中刪除（repository 的 reminder.delete_if_empty）；
+-- 這裡刪除之前留下、尚未被 housekeeping 清掉的空提醒。
+DELETE FROM reminder_time
+WHERE time_slot_1 IS NULL AND time_slot_2 IS NULL
+  AND time_slot_3 IS NULL AND time_slot_4 IS NULL;
@@ -0,0 +1,2 @@
+ALTER TABLE medication_record_archive
+    DROP KEY idx_medication_record_archive_mm;
@@ -0,0 +1 @@
+DROP INDEX IF EXISTS idx_medication_record_archive_mm;
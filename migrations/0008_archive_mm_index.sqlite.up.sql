@@ -0,0 +1,2 @@
+-- 封存藥品記錄的 mm_id 索引（SQLite 版，用途見 0008_archive_mm_index.up.sql）。
+CREATE INDEX IF NOT EXISTS idx_medication_record_archive_mm ON medication_record_archive (mm_id);
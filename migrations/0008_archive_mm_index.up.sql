@@ -0,0 +1,4 @@
+-- housekeeping 的 orphan_medication_mains 以 NOT EXISTS 確認封存的藥品記錄是否仍指向看診資料，
+-- 以 mm_id 索引查詢，不必掃描整張 medication_record_archive。
+ALTER TABLE medication_record_archive
+    ADD KEY idx_medication_record_archive_mm (mm_id);
@@ -0,0 +1 @@
+-- 頻率代碼可能在套用前就已存在並被藥品記錄引用，回復時不刪除。
@@ -0,0 +1,16 @@
+-- 頻率代碼與建議服藥時間的內建資料，與 0002 的 frequency_synonym 一樣只定義在 migrations：
+-- frequency_resolver 在資料庫無法連線時、以及 tools/query_plan_audit.py 的測試資料庫都從這裡取得。
+-- 既有資料庫已有的代碼不覆蓋（INSERT IGNORE）。
+INSERT IGNORE INTO frequency_code (frequency_code, frequency_name, times_per_day) VALUES
+    ('QD', '一日一次', 1), ('BID', '一日二次', 2), ('TID', '一日三次', 3), ('QID', '一日四次', 4),
+    ('HS', '睡前', 1), ('AC', '飯前', 3), ('PC', '飯後', 3), ('PRN', '需要時', 0);
+
+INSERT IGNORE INTO suggested_dosage_time (frequency_code, time_slot_1, time_slot_2, time_slot_3, time_slot_4) VALUES
+    ('QD', '08:00:00', NULL, NULL, NULL),
+    ('BID', '08:00:00', '20:00:00', NULL, NULL),
+    ('TID', '08:30:00', '12:30:00', '18:30:00', NULL),
+    ('QID', '06:00:00', '12:00:00', '18:00:00', '22:00:00'),
+    ('HS', '22:00:00', NULL, NULL, NULL),
+    ('AC', '07:30:00', '11:30:00', '17:30:00', NULL),
+    ('PC', '08:30:00', '12:30:00', '18:30:00', NULL),
+    ('PRN', NULL, NULL, NULL, NULL);
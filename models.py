@@ -1,350 +1,325 @@
-from database import get_conn
+import repository
+from database import read_only, read_write
 import random
 import string
-from datetime import datetime, timedelta
+from datetime import date, datetime, timedelta
 import logging
 import json
 import re
+import threading
+import uuid
+import requests
 from linebot.models import TextSendMessage
 from urllib.parse import quote
-from config import CHANNEL_ACCESS_TOKEN
-from linebot import LineBotApi
+from linebot.exceptions import LineBotApiError
+from line_client import get_line_bot_api
+from concurrent.futures import ThreadPoolExecutor
+from known_users import known_users
+from frequency_resolver import get_frequency_resolver
+from medication_ocr_parser import parse_visit_date
 
 logging.basicConfig(level=logging.INFO)
 
+DEFAULT_USER_NAME = "新用戶"
+
+# 新使用者暱稱回填在背景執行，避免 LINE API 延遲拖慢 webhook
+_profile_executor = ThreadPoolExecutor(max_workers=2, thread_name_prefix="profile-fetch")
+
 # ========================\
 # 👤 使用者管理
 # ========================\
 
+@read_only
 def get_user_by_recorder_id(recorder_id):
     """
     根據 recorder_id（即 Line User ID）從 users 表中獲取使用者資訊。
     """
-    conn = get_conn()
-    cursor = conn.cursor(dictionary=True, buffered=True)
     try:
-        cursor.execute("SELECT * FROM users WHERE recorder_id = %s", (recorder_id,))
-        return cursor.fetchone()
+        return repository.fetch_one("users.get", (recorder_id,))
     except Exception as e:
         print(f"ERROR: Failed to get user by recorder_id {recorder_id}: {e}")
         return None
-    finally:
-        cursor.close()
-        conn.close()
 
+@read_write
 def create_user_if_not_exists(recorder_id):
     """
-    如果使用者不存在，則從 LINE API 嘗試取得使用者暱稱，並建立 users 資料。
+    確認使用者存在；若不存在則以預設暱稱建立 users 資料。
+    已確認存在的使用者記錄在記憶體中，之後的呼叫不再查詢資料庫。
+    新使用者的 LINE 暱稱改由背景執行緒取得後回填，不阻塞回覆。
     """
-    from linebot.exceptions import LineBotApiError
-    from config import CHANNEL_ACCESS_TOKEN
-    from linebot import LineBotApi
+    if recorder_id in known_users:
+        return
 
-    conn = get_conn()
-    cursor = conn.cursor()
+    created = False
     try:
-        cursor.execute("SELECT recorder_id FROM users WHERE recorder_id=%s", (recorder_id,))
-        if not cursor.fetchone():
-            user_name = "新用戶"
-            try:
-                line_bot_api = LineBotApi(CHANNEL_ACCESS_TOKEN)
-                profile = line_bot_api.get_profile(recorder_id)
-                user_name = profile.display_name
-                print(f"✅ 取得使用者暱稱：{user_name}")
-            except LineBotApiError as e:
-                print(f"⚠️ 無法取得使用者暱稱，使用預設名稱：{e}")
-
-            cursor.execute("INSERT INTO users (recorder_id, user_name) VALUES (%s, %s)", (recorder_id, user_name))
-            conn.commit()
-            print(f"✅ 已建立使用者資料：{recorder_id}（{user_name}）")
-        else:
-            print(f"🔁 使用者已存在：{recorder_id}")
+        with repository.session(readonly=False) as db:
+            created = db.execute("users.insert_default", (recorder_id, DEFAULT_USER_NAME)) == 1
+            if created:
+                # 新使用者一次建立「本人」，選單不必再於顯示時補建
+                db.execute("patients.insert_self", (recorder_id,))
+            db.commit()
+        known_users.add(recorder_id)
     except Exception as e:
         print(f"❌ 建立使用者資料失敗：{e}")
-    finally:
-        cursor.close()
-        conn.close()
 
+    if created:
+        _invalidate_member_cache(recorder_id)
+        print(f"✅ 已建立使用者資料：{recorder_id}（{DEFAULT_USER_NAME}），稍後回填暱稱")
+        _profile_executor.submit(_fill_user_profile, recorder_id)
 
-# ========================\
-# 🧑‍🤝‍🧑 家庭成員管理
-# ========================\
 
-def get_all_family_user_ids(recorder_id):
+@read_write
+def _fill_user_profile(recorder_id):
     """
-    獲取指定 recorder_id 家庭中所有成員的 Line User ID (即 recorder_id)。
-    這包括 recorder_id 本身以及所有被邀請的家庭成員的 recorder_id。
+    背景工作：從 LINE API 取得使用者暱稱並回填，僅覆寫仍為預設名稱的資料。
     """
-    conn = get_conn()
-    cursor = conn.cursor(dictionary=True, buffered=True)
-    all_line_ids = set()
     try:
-        all_line_ids.add(recorder_id)
-
-        cursor.execute(
-            "SELECT recipient_line_id FROM invitation_recipients WHERE inviter_recorder_id = %s",
-            (recorder_id,)
-        )
-        for row in cursor.fetchall():
-            all_line_ids.add(row['recipient_line_id'])
-
-        cursor.execute(
-            "SELECT inviter_recorder_id FROM invitation_recipients WHERE recipient_line_id = %s",
-            (recorder_id,)
-        )
-        for row in cursor.fetchall():
-            all_line_ids.add(row['inviter_recorder_id'])
-            sub_cursor = conn.cursor(dictionary=True)
-            sub_cursor.execute(
-                "SELECT recipient_line_id FROM invitation_recipients WHERE inviter_recorder_id = %s",
-                (row['inviter_recorder_id'],)
-            )
-            for sub_row in sub_cursor.fetchall():
-                all_line_ids.add(sub_row['recipient_line_id'])
-            sub_cursor.close()
-        
-        return list(all_line_ids)
+        profile = get_line_bot_api().get_profile(recorder_id)
+    except (LineBotApiError, requests.RequestException) as e:
+        # API 錯誤、逾時或連線失敗都只是暱稱取不到，保留預設名稱
+        print(f"⚠️ 無法取得使用者暱稱，保留預設名稱：{e}")
+        return
+
+    try:
+        repository.execute("users.fill_name", (profile.display_name, recorder_id, DEFAULT_USER_NAME))
+        _invalidate_family_cache(recorder_id)
+        print(f"✅ 取得使用者暱稱：{profile.display_name}")
     except Exception as e:
-        print(f"ERROR: Failed to get all family user IDs for {recorder_id}: {e}")
-        return [recorder_id]
-    finally:
-        cursor.close()
-        conn.close()
+        print(f"❌ 回填使用者暱稱失敗：{e}")
+
+
+# ========================\
+# 🧑‍🤝‍🧑 家庭成員管理
+# ========================\
+
+# 家人綁定快取：line_user_id -> list(直接綁定對象，get_family_bindings 的結果)，
+# bind_family / unbind_family 時讓雙方失效。
+# 每次失效都遞增 _family_generation；查詢開始後若有失效，查到的結果可能已過時，不寫入快取。
+_family_cache_lock = threading.Lock()
+_family_bindings_cache = {}
+_family_generation = 0
+
+
+def _invalidate_family_cache(*line_user_ids):
+    global _family_generation
+    with _family_cache_lock:
+        _family_generation += 1
+        for user_id in line_user_ids:
+            _family_bindings_cache.pop(user_id, None)
+
 
+# 用藥者名單快取：recorder_id -> tuple(member)，選單顯示直接讀取；
+# 新增、改名、綁定、刪除用藥者時呼叫 _invalidate_member_cache 讓該使用者的名單失效
+# （與家人綁定快取相同，以 _member_generation 避免查詢期間失效後寫回舊名單）
+_member_cache_lock = threading.Lock()
+_member_cache = {}
+_member_generation = 0
 
+
+def _invalidate_member_cache(*recorder_ids):
+    global _member_generation
+    with _member_cache_lock:
+        _member_generation += 1
+        for recorder_id in recorder_ids:
+            _member_cache.pop(recorder_id, None)
+
+
+@read_write
 def add_patient_member(recorder_id, member_name):
     """
     為指定 recorder_id 新增家庭成員。
     """
-    conn = get_conn()
-    cursor = conn.cursor()
     try:
-        cursor.execute(
-            "INSERT INTO patients (recorder_id, member) VALUES (%s, %s)",
-            (recorder_id, member_name)
-        )
-        conn.commit()
+        repository.execute("patients.insert", (recorder_id, member_name))
+        _invalidate_member_cache(recorder_id)
         print(f"DEBUG: Added patient member '{member_name}' for recorder_id {recorder_id}.")
         return True
     except Exception as e:
         print(f"ERROR: Failed to add patient member '{member_name}' for {recorder_id}: {e}")
         return False
-    finally:
-        cursor.close()
-        conn.close()
 
+
+@read_write
+def rename_patient_member(recorder_id, old_name, new_name):
+    """
+    修改家庭成員名稱，回傳是否有資料被更新。
+    """
+    updated = repository.execute("patients.rename", (new_name, recorder_id, old_name)) > 0
+    _invalidate_member_cache(recorder_id)
+    return updated
+
+
+@read_write
+def link_patient_member(recorder_id, member_name, linked_user_id):
+    """
+    把 linked_user_id 綁定為 recorder_id 的家庭成員 member_name（成員不存在時新增）。
+    """
+    repository.execute("patients.link", (recorder_id, member_name, linked_user_id))
+    _invalidate_member_cache(recorder_id)
+
+
+@read_write
+def link_existing_member(recorder_id, member_name, linked_user_id):
+    """
+    把 linked_user_id 綁定到 recorder_id 已存在的成員 member_name，回傳是否有成員被更新。
+    """
+    return repository.execute("patients.link_existing", (linked_user_id, recorder_id, member_name)) > 0
+
+
+@read_write
+def ensure_self_member(recorder_id):
+    """
+    補建「本人」（在加入好友時建立之前就已存在的舊使用者才需要）。
+    """
+    repository.execute("patients.insert_self", (recorder_id,))
+    _invalidate_member_cache(recorder_id)
+
+
+@read_only
 def get_family_members(recorder_id):
     """
-    獲取指定 recorder_id 的所有家庭成員。
+    獲取指定 recorder_id 的所有家庭成員（快取，名單異動時失效）。
     """
-    conn = get_conn()
-    cursor = conn.cursor(dictionary=True, buffered=True)
+    cached = _member_cache.get(recorder_id)
+    if cached is not None:
+        return list(cached)
+
+    generation = _member_generation
     try:
-        cursor.execute(
-            "SELECT member FROM patients WHERE recorder_id = %s",
-            (recorder_id,)
-        )
-        members = cursor.fetchall()
-        print(f"DEBUG: Retrieved {len(members)} family members for recorder_id {recorder_id}.")
-        return [m['member'] for m in members]
+        members = tuple(repository.fetch_column("patients.members", (recorder_id,)))
     except Exception as e:
         print(f"ERROR: Failed to get family members for {recorder_id}: {e}")
         return []
-    finally:
-        cursor.close()
-        conn.close()
+    with _member_cache_lock:
+        if generation == _member_generation:
+            _member_cache[recorder_id] = members
+    return list(members)
 
 # ========================\
 # 🔗 邀請碼與家人綁定
 # ========================\
 
+@read_write
 def generate_invite_code(elder_user_id, expire_minutes=60):
     now = datetime.now()
     code = ''.join(random.choices(string.ascii_uppercase + string.digits, k=6))
     expires_at = now + timedelta(minutes=expire_minutes)
 
-    with get_conn() as conn:
-        cursor = conn.cursor()
-        cursor.execute("""
-            INSERT INTO invite_codes (code, inviter_recorder_id, expires_at)
-            VALUES (%s, %s, %s)
-        """, (code, elder_user_id, expires_at))
-        conn.commit()
-        return code, expires_at
+    repository.execute("invite.insert", (code, elder_user_id, expires_at))
+    return code, expires_at
 
 
+@read_write
 def bind_family(invite_code, recipient_line_id):
     """
     使用邀請碼綁定家庭關係，並通知邀請人。
+    邀請碼以條件式 UPDATE 認領（未使用且未過期才會成功），同一組邀請碼同時送出時只有一方能綁定；
+    綁定紀錄以 (recorder_id, recipient_line_id) 唯一鍵 INSERT IGNORE；已綁定過時整個交易 rollback，
+    邀請碼維持未使用，回傳 (True, 邀請人)。
     """
     create_user_if_not_exists(recipient_line_id)
-    line_bot_api = LineBotApi(CHANNEL_ACCESS_TOKEN)
-
-    with get_conn() as conn:
-        cursor = conn.cursor(dictionary=True, buffered=True)
-
-        # 查詢邀請碼
-        cursor.execute("SELECT * FROM invite_codes WHERE code = %s", (invite_code,))
-        code_row = cursor.fetchone()
-
-        if not code_row:
-            return False, None  # 無此邀請碼
-
-        if code_row['used'] or code_row['expires_at'] < datetime.now():
-            return False, None  # 已使用或已過期
-
-        inviter_id = code_row['inviter_recorder_id']
-
-        # 避免重複綁定
-        cursor.execute("""
-            SELECT * FROM invitation_recipients
-            WHERE recorder_id = %s AND recipient_line_id = %s
-        """, (inviter_id, recipient_line_id))
-        if cursor.fetchone():
+    line_bot_api = get_line_bot_api()
+
+    with repository.session() as db:
+        # 認領邀請碼：不存在、已使用或已過期時不會更新任何資料
+        if db.execute("invite.claim", (recipient_line_id, invite_code)) == 0:
+            db.rollback()
+            return False, None
+
+        # 取得邀請人與被邀請人名稱
+        row = db.fetch_one("invite.claimed_by", (invite_code, recipient_line_id))
+        inviter_id = row['inviter_recorder_id']
+        recipient_name = row['user_name'] or "家人"
+
+        # 寫入綁定紀錄；已綁定過則連同邀請碼的認領一起 rollback
+        if db.execute("family.bind", (inviter_id, recipient_line_id, recipient_name, '家人')) == 0:
+            db.rollback()
             return True, inviter_id  # 已經綁定過
 
-        # 取得被邀請人名稱
-        cursor.execute("SELECT user_name FROM users WHERE recorder_id = %s", (recipient_line_id,))
-        row = cursor.fetchone()
-        recipient_name = row['user_name'] if row else "家人"
-
-        # 寫入綁定紀錄（可依需求補 relation_type、recipient_name）
-        cursor.execute("""
-            INSERT INTO invitation_recipients (recorder_id, recipient_line_id, recipient_name, relation_type)
-            VALUES (%s, %s, %s, %s)
-        """, (inviter_id, recipient_line_id, recipient_name, '家人'))
+        db.commit()
 
-        # 更新邀請碼為已使用
-        cursor.execute("""
-            UPDATE invite_codes 
-            SET used = TRUE, bound_at = NOW(), recipient_line_id = %s
-            WHERE id = %s
-        """, (recipient_line_id, code_row['id']))
+    _invalidate_family_cache(inviter_id, recipient_line_id)
 
-        conn.commit()
-
-        # ✅ 通知邀請人
-        try:
-            line_bot_api.push_message(inviter_id, TextSendMessage(
-                text=f"📬 您邀請的 {recipient_name} 已成功綁定，將接收您的用藥提醒。"
-            ))
-        except Exception as e:
-            print(f"⚠️ 發送綁定通知失敗: {e}")
+    # ✅ 通知邀請人（連線已歸還，不佔用連線池等待 LINE API）
+    try:
+        line_bot_api.push_message(inviter_id, TextSendMessage(
+            text=f"📬 您邀請的 {recipient_name} 已成功綁定，將接收您的用藥提醒。"
+        ))
+    except Exception as e:
+        print(f"⚠️ 發送綁定通知失敗: {e}")
 
-        return True, inviter_id
+    return True, inviter_id
 
 
 
+@read_only
 def get_family_bindings(line_user_id):
-    conn = get_conn()
+    cached = _family_bindings_cache.get(line_user_id)
+    if cached is not None:
+        return list(cached)
+
+    generation = _family_generation
     result = []
     try:
-        cursor = conn.cursor(dictionary=True, buffered=True)
-        cursor.execute("""
-            SELECT '邀請他人' AS role, r.recipient_line_id AS user_id, u.user_name
-            FROM invitation_recipients r
-            JOIN users u ON r.recipient_line_id = u.recorder_id
-            WHERE r.recorder_id = %s
-
-            UNION
-
-            SELECT '被邀請人' AS role, r.recorder_id AS user_id, u.user_name
-            FROM invitation_recipients r
-            JOIN users u ON r.recorder_id = u.recorder_id
-            WHERE r.recipient_line_id = %s
-        """, (line_user_id, line_user_id))
-        result = cursor.fetchall()
+        result = repository.fetch_all("family.bindings", (line_user_id, line_user_id))
+        with _family_cache_lock:
+            if generation == _family_generation:
+                _family_bindings_cache[line_user_id] = result
     except Exception as e:
         print(f"ERROR: get_family_bindings 查詢失敗: {e}")
-    finally:
-        conn.close()
-    return result
+    return list(result)
 
 
+@read_write
 def unbind_family(line_user_id, target_user_id):
-    conn = get_conn()
-    cursor = conn.cursor()
     try:
-        cursor.execute("""
-            DELETE FROM invitation_recipients
-            WHERE (recorder_id = %s AND recipient_line_id = %s)
-               OR (recorder_id = %s AND recipient_line_id = %s)
-        """, (line_user_id, target_user_id, target_user_id, line_user_id))
-        conn.commit()
-        return cursor.rowcount > 0
+        removed = repository.execute("family.unbind", (line_user_id, target_user_id, target_user_id, line_user_id))
+        _invalidate_family_cache(line_user_id, target_user_id)
+        return removed > 0
     except Exception as e:
         print(f"ERROR: unbind_family 解除失敗: {e}")
         return False
-    finally:
-        cursor.close()
-        conn.close()
 
 
 # ========================
 # 💊 用藥提醒設定
 # ========================
 
-def clear_single_time_slot(recorder_id, member, frequency_name, time_str):
-    conn = get_conn()
-    if not conn:
-        return False
+def _clear_time_slot(db, recorder_id, member, frequency_name, time_str):
+    # 語句見 repository 的 reminder.clear_slot：時間參數出現在四個 SET 與 WHERE；
+    # 清除後時段全空的提醒在同一交易中刪除（呼叫端 commit）
+    cleared = db.execute("reminder.clear_slot", (
+        time_str, time_str, time_str, time_str, recorder_id, member, frequency_name, time_str
+    )) > 0
+    if cleared:
+        db.execute("reminder.delete_if_empty", (recorder_id, member, frequency_name))
+    return cleared
 
-    try:
-        cursor = conn.cursor(dictionary=True)
-        cursor.execute("""
-            SELECT time_slot_1, time_slot_2, time_slot_3, time_slot_4
-            FROM reminder_time
-            WHERE recorder_id = %s AND member = %s AND frequency_name = %s
-        """, (recorder_id, member, frequency_name))
-
-        row = cursor.fetchone()
-        if not row:
-            return False
-
-        for i in range(1, 5):
-            time_slot = row.get(f"time_slot_{i}")
-            if time_slot:
-                if hasattr(time_slot, 'strftime'):
-                    time_val = time_slot.strftime("%H:%M")
-                else:
-                    time_val = str(time_slot)
-                if time_val == time_str:
-                    cursor.execute(f"""
-                        UPDATE reminder_time
-                        SET time_slot_{i} = NULL
-                        WHERE recorder_id = %s AND member = %s AND frequency_name = %s
-                    """, (recorder_id, member, frequency_name))
-                    conn.commit()
-                    return True
-        return False
 
+@read_write
+def clear_single_time_slot(recorder_id, member, frequency_name, time_str):
+    """
+    清除提醒中等於 time_str (HH:MM) 的時段（條件式 UPDATE），時段全空時刪除整筆提醒。
+    """
+    try:
+        with repository.session() as db:
+            cleared = _clear_time_slot(db, recorder_id, member, frequency_name, time_str)
+            db.commit()
+            return cleared
     except Exception as e:
-        import logging
         logging.error(f"clear_single_time_slot error: {e}")
         return False
-    finally:
-        if conn.is_connected():
-            conn.close()
 
 
+@read_only
 def get_suggested_times_by_frequency(frequency_code):
     """
     從 suggested_dosage_time 表中獲取指定頻率的建議時間。
     返回時間字符串列表 (例如 ['08:00', '12:00'])。
     """
-    conn = get_conn()
-    cursor = conn.cursor(dictionary=True, buffered=True)
     times = []
     try:
-        cursor.execute(
-            """
-            SELECT time_slot_1, time_slot_2, time_slot_3, time_slot_4
-            FROM suggested_dosage_time
-            WHERE frequency_code = %s
-            """,
-            (frequency_code,)
-        )
-        result = cursor.fetchone()
+        result = repository.fetch_one("frequency.suggested_times", (frequency_code,))
         if result:
             for i in range(1, 5): # 遍歷 time_slot_1 到 time_slot_4
                 time_key = f'time_slot_{i}'
@@ -354,235 +329,281 @@ def get_suggested_times_by_frequency(frequency_code):
     except Exception as e:
         print(f"ERROR: Failed to get suggested times for frequency {frequency_code}: {e}")
         return []
-    finally:
-        cursor.close()
-        conn.close()
 
+@read_only
 def get_frequency_name(frequency_code):
     """
     根據 frequency_code 從資料庫取得對應的 frequency_name。
     如果查無資料則回傳 None。
     """
-    conn = get_conn()
-    if not conn:
-        print("ERROR: 無法連接資料庫")
-        return None
-
     try:
-        with conn.cursor() as cursor:
-            cursor.execute("SELECT frequency_name FROM frequency_code WHERE frequency_code = %s", (frequency_code,))
-            result = cursor.fetchone()
-            if result:
-                return result[0]
-            else:
-                print(f"WARNING: 查無對應的 frequency_code: {frequency_code}")
-                return None
+        frequency_name = repository.fetch_value("frequency.name_by_code", (frequency_code,))
+        if frequency_name is None:
+            print(f"WARNING: 查無對應的 frequency_code: {frequency_code}")
+        return frequency_name
     except Exception as e:
         print(f"ERROR: 查詢 frequency_name 發生錯誤（code={frequency_code}）: {e}")
         return None
-    finally:
-        conn.close()
 
+@read_only
 def get_frequency_code(frequency_name):
     """
     根據 frequency_name 從資料庫取得對應的 frequency_code。
     如果查無資料則回傳 None。
     """
-    conn = get_conn()
-    if not conn:
-        print("ERROR: 無法連接資料庫")
-        return None
-
     try:
-        with conn.cursor() as cursor:
-            cursor.execute("SELECT frequency_code FROM frequency_code WHERE frequency_name = %s", (frequency_name,))
-            result = cursor.fetchone()
-            if result:
-                return result[0]
-            else:
-                print(f"WARNING: 查無對應的 frequency_name: {frequency_name}")
-                return None
+        frequency_code = repository.fetch_value("frequency.code_by_name", (frequency_name,))
+        if frequency_code is None:
+            print(f"WARNING: 查無對應的 frequency_name: {frequency_name}")
+        return frequency_code
     except Exception as e:
         print(f"ERROR: 查詢 frequency_code 發生錯誤（name={frequency_name}）: {e}")
         return None
-    finally:
-        conn.close()
 
+@read_only
 def get_all_frequency_options():
     """
     從 frequency_code 表中取得所有 frequency_code + frequency_name 對應
     :return: List of (code, name)
     """
-    conn = get_conn()
-    if not conn:
-        return []
     try:
-        cursor = conn.cursor()
-        cursor.execute("SELECT frequency_code, frequency_name FROM frequency_code")
-        results = cursor.fetchall()
-        return [(row[0], row[1]) for row in results]
+        return [(row["frequency_code"], row["frequency_name"]) for row in repository.fetch_all("frequency.options")]
     except Exception as e:
         print(f"❗ get_all_frequency_options error: {e}")
         return []
-    finally:
-        conn.close()
 
+@read_only
 def get_times_per_day_by_code(frequency_code):
     """
     根據 frequency_code 從資料庫查詢 times_per_day。
     若查不到則預設回傳 4。
     """
-    conn = get_conn()
-    cursor = conn.cursor()
     try:
-        cursor.execute(
-            "SELECT times_per_day FROM frequency_code WHERE frequency_code = %s",
-            (frequency_code,)
-        )
-        result = cursor.fetchone()
-        if result:
-            return int(result[0])  # 把 float 轉為 int
+        times_per_day = repository.fetch_value("frequency.times_per_day", (frequency_code,))
+        if times_per_day is not None:
+            return int(times_per_day)  # 把 float 轉為 int
         else:
             return 4  # 預設最大次數
     except Exception as e:
         print(f"ERROR: get_times_per_day_by_code({frequency_code}) 發生錯誤: {e}")
         return 4
-    finally:
-        cursor.close()
-        conn.close()
 
+@read_only
 def get_frequency_name_by_code(frequency_code):
     """
     根據 frequency_code 查詢中文名稱，例如 QD → 一日一次
     """
-    conn = get_conn()
-    cursor = conn.cursor()
     try:
-        cursor.execute(
-            "SELECT frequency_name FROM frequency_code WHERE frequency_code = %s",
-            (frequency_code,)
-        )
-        result = cursor.fetchone()
-        return result[0] if result else frequency_code
+        return repository.fetch_value("frequency.name_by_code", (frequency_code,)) or frequency_code
     except Exception as e:
         print(f"ERROR: 查詢頻率名稱失敗 ({frequency_code}): {e}")
         return frequency_code
-    finally:
-        cursor.close()
-        conn.close()
 
-def add_medication_reminder_full(recorder_id, member, medicine_name, frequency_code, dosage, days, times):
-    import re
-    logging.info(f"DEBUG: add_medication_reminder_full called with recorder_id={recorder_id}, member={member}, medicine_name={medicine_name}, frequency_code={frequency_code}, dosage={dosage}, days={days}, times={times}")
-    conn = get_conn()
-    if not conn:
-        logging.error("Failed to connect to database in add_medication_reminder_full.")
-        raise Exception("Database connection failed.")
-    cursor = conn.cursor(buffered=True)  # ✅ 避免 unread result error
+def _split_dosage(dosage):
+    """把 "1錠"、"2.5 ml" 之類的劑量拆成 (數量, 單位)；無法解析時數量為 "1"。"""
+    if dosage:
+        match = re.match(r"(\d+\.?\d*)\s*([a-zA-Z%毫升錠顆包個]*)", dosage)
+        if match:
+            return match.group(1).strip(), match.group(2).strip() or ""
+    return "1", ""
+
 
+# 沒有給藥天數的藥品視為長期用藥，療程結束日記為最大日期（見 migrations/0005_course_end_date.up.sql）
+OPEN_ENDED_COURSE = date(9999, 12, 31)
+
+
+def course_end_date(visit_date, days):
+    """療程結束日：看診日期起算 days 天（含看診當天）；天數無法解析或不大於 0 時視為長期用藥。"""
     try:
-        # 取得中文頻率名稱
-        frequency_name = get_frequency_name(frequency_code)
-        if not frequency_name:
-            raise ValueError(f"❌ 無法從 frequency_code 查到 frequency_name（傳入: {frequency_code}）")
-
-        # 解析劑量與單位
-        parsed_dose_quantity = ""
-        dosage_unit = ""
-        if dosage:
-            match = re.match(r"(\d+\.?\d*)\s*([a-zA-Z%毫升錠顆包個]*)", dosage)
-            if match:
-                parsed_dose_quantity = match.group(1).strip()
-                dosage_unit = match.group(2).strip() or ""
-            else:
-                parsed_dose_quantity = "1"
-        else:
-            parsed_dose_quantity = "1"
-        dose_quantity = parsed_dose_quantity
-
-        # 嘗試找出現有 mm_id（藥單主表）
-        cursor.execute("""
-            SELECT mm_id FROM medication_main 
-            WHERE recorder_id = %s AND member = %s
-        """, (recorder_id, member))
-        result = cursor.fetchone()
-        if result:
-            current_mm_id = result[0]
-        else:
-            cursor.execute("""
-                INSERT INTO medication_main (recorder_id, member, clinic_name, visit_date, doctor_name)
-                VALUES (%s, %s, NULL, CURDATE(), NULL)
-            """, (recorder_id, member))
-            current_mm_id = cursor.lastrowid
-
-        # 新增藥品記錄
-        source_detail = "LineBot"
-        cursor.execute("""
-            INSERT INTO medication_record (
-                mm_id, recorder_id, member, drug_name_zh,
-                frequency_count_code, source_detail, dose_quantity, days
-            ) VALUES (%s, %s, %s, %s, %s, %s, %s, %s)
-        """, (
-            current_mm_id, recorder_id, member, medicine_name,
-            frequency_code, source_detail, dose_quantity, days
-        ))
+        days = int(days)
+    except (TypeError, ValueError):
+        return OPEN_ENDED_COURSE
+    if days <= 0:
+        return OPEN_ENDED_COURSE
+    return visit_date + timedelta(days=days - 1)
 
-        # 準備 reminder_time 時段
-        all_time_slots = [None] * 4
-        for i, t in enumerate(times[:4]):
-            all_time_slots[i] = t
-
-        total_doses_per_day = {
-            "QD": 1, "BID": 2, "TID": 3, "QID": 4
-        }.get(frequency_code, len(times))
-
-        # 查是否已經有對應 reminder_time
-        cursor.execute("""
-            SELECT COUNT(*) FROM reminder_time 
-            WHERE recorder_id = %s AND member = %s AND frequency_name = %s
-        """, (recorder_id, member, frequency_name))
-        exists = cursor.fetchone()[0] > 0
-
-        if exists:
-            cursor.execute("""
-                UPDATE reminder_time
-                SET time_slot_1 = %s, time_slot_2 = %s, time_slot_3 = %s, time_slot_4 = %s,
-                    total_doses_per_day = %s, updated_at = CURRENT_TIMESTAMP
-                WHERE recorder_id = %s AND member = %s AND frequency_name = %s
-            """, (
-                *all_time_slots, total_doses_per_day,
-                recorder_id, member, frequency_name
+
+@read_write
+def add_medication_reminder_full(recorder_id, member, medicine_name, frequency_code, dosage, days, times):
+    """
+    新增藥品記錄並設定該頻率的提醒時段，三個語句一個交易：
+    medication_main 以 (recorder_id, member, visit_date) 唯一鍵 upsert，並以 LAST_INSERT_ID(mm_id) 取回 mm_id；
+    medication_record 直接使用 LAST_INSERT_ID()；
+    reminder_time 以 (recorder_id, member, frequency_name) 唯一鍵 upsert，頻率名稱在同一語句中由 frequency_code 帶出。
+    """
+    logging.info(f"DEBUG: add_medication_reminder_full called with recorder_id={recorder_id}, member={member}, medicine_name={medicine_name}, frequency_code={frequency_code}, dosage={dosage}, days={days}, times={times}")
+    with repository.session() as db:
+        try:
+            # 解析劑量與單位
+            dose_quantity, dosage_unit = _split_dosage(dosage)
+
+            # 當天的藥單主表，接著新增藥品記錄（mm_id 由 LAST_INSERT_ID() 帶入）
+            db.execute("medication.upsert_today_main", (recorder_id, member))
+            source_detail = "LineBot"
+            db.execute("medication.insert_record_for_last_main", (
+                recorder_id, member, medicine_name,
+                frequency_code, source_detail, dose_quantity, days,
+                course_end_date(date.today(), days)
             ))
-        else:
-            cursor.execute("""
-                INSERT INTO reminder_time (
-                    recorder_id, member, frequency_name,
-                    time_slot_1, time_slot_2, time_slot_3, time_slot_4,
-                    total_doses_per_day
-                ) VALUES (%s, %s, %s, %s, %s, %s, %s, %s)
-            """, (
-                recorder_id, member, frequency_name,
-                *all_time_slots, total_doses_per_day
+
+            # 準備 reminder_time 時段
+            all_time_slots = [None] * 4
+            for i, t in enumerate(times[:4]):
+                all_time_slots[i] = t
+
+            total_doses_per_day = {
+                "QD": 1, "BID": 2, "TID": 3, "QID": 4
+            }.get(frequency_code, len(times))
+
+            upserted = db.execute("reminder.upsert_by_code", (
+                recorder_id, member, *all_time_slots, total_doses_per_day, frequency_code
             ))
+            # rowcount 為 0 可能是頻率代碼不存在，也可能是既有提醒的值完全相同；只有這時才多查一次
+            if upserted == 0 and db.fetch_value("frequency.name_by_code", (frequency_code,)) is None:
+                raise ValueError(f"❌ 無法從 frequency_code 查到 frequency_name（傳入: {frequency_code}）")
 
-        conn.commit()
-        logging.info(f"✅ Medication reminder for {medicine_name} added successfully.")
+            db.commit()
+            logging.info(f"✅ Medication reminder for {medicine_name} added successfully.")
 
-    except Exception as e:
-        conn.rollback()
-        logging.error(f"ERROR: Failed to add medication reminder full: {e}")
-        raise
-    finally:
-        if conn and conn.is_connected():
+        except Exception as e:
+            db.rollback()
+            logging.error(f"ERROR: Failed to add medication reminder full: {e}")
+            raise
+
+def _drug_key(drug_name):
+    """藥品去重用的名稱：去掉空白並忽略大小寫。"""
+    return "".join((drug_name or "").split()).casefold()
+
+
+@read_write
+def bulk_import_medications(recorder_id, member, medications, source_detail="OCR_Scan"):
+    """
+    一次匯入 parse_medication_order 解析出的多筆藥品（可來自多張藥袋照片）。
+    在同一個交易內以 executemany 寫入 medication_main、medication_record 與 reminder_time，
+    不論藥品數量，資料庫往返次數固定。
+    IN 清單長度與藥品數量有關，這裡使用一般 cursor，executemany 也才能合併成多列 INSERT。
+
+    - 每個看診日期一筆 medication_main（無日期者記為今天），已存在則沿用。
+    - 以 (medication_main, 藥名) 為自然鍵去重：同一次看診已有的藥品，或本批重複的藥品都會略過。
+    - 療程結束日由看診日期與本次發藥天數算出（course_end_date），提醒排程依此停止已結束的療程。
+    - 頻率代碼與建議時間由 frequency_resolver 在記憶體中解析；
+      reminder_time 只新增尚未存在的頻率，不覆蓋使用者已調整過的時間；療程已結束的藥品不建立提醒。
+
+    回傳 {"inserted", "duplicates", "reminders_added", "unresolved"}，
+    unresolved 為無法辨識頻率、因此沒有建立提醒的藥名。
+    """
+    summary = {"inserted": 0, "duplicates": 0, "reminders_added": 0, "unresolved": []}
+    resolver = get_frequency_resolver()
+    today = datetime.now().date()
+
+    # 先在記憶體中整理本批資料並去除重複
+    drugs = []
+    seen = set()
+    for med in medications:
+        name = (med.get("name") or "").strip()
+        if not name:
+            continue
+        visit_date = parse_visit_date(med.get("visit_date")) or today
+        key = (visit_date, _drug_key(name))
+        if key in seen:
+            summary["duplicates"] += 1
+            continue
+        seen.add(key)
+        frequency_code = resolver.resolve_code(med.get("frequency_text"))
+        if not frequency_code:
+            summary["unresolved"].append(name)
+        dose_quantity, dosage_unit = _split_dosage(med.get("dosage"))
+        days = med.get("days_supply") or None
+        drugs.append((visit_date, name, frequency_code, dose_quantity, dosage_unit, days))
+    if not drugs:
+        return summary
+
+    with repository.session() as db:
+        cursor = db.cursor(buffered=True)
+        try:
+            db.start_transaction()
+            visit_dates = sorted({d[0] for d in drugs})
+            placeholders = ", ".join(["%s"] * len(visit_dates))
+
+            # 1. 取得（或建立）每個看診日期的 medication_main
+            select_mains = f"""
+                SELECT visit_date, mm_id FROM medication_main
+                WHERE recorder_id = %s AND member = %s AND visit_date IN ({placeholders})
+            """
+            cursor.execute(select_mains, (recorder_id, member, *visit_dates))
+            mm_ids = {row[0]: row[1] for row in cursor.fetchall()}
+            missing_dates = [d for d in visit_dates if d not in mm_ids]
+            if missing_dates:
+                cursor.executemany(repository.sql("medication.insert_main"),
+                                   [(recorder_id, member, d) for d in missing_dates])
+                cursor.execute(select_mains, (recorder_id, member, *visit_dates))
+                mm_ids = {row[0]: row[1] for row in cursor.fetchall()}
+
+            # 2. 與資料庫中同一次看診的藥品去重後，一次寫入 medication_record
+            mm_placeholders = ", ".join(["%s"] * len(mm_ids))
+            cursor.execute(f"""
+                SELECT mm_id, drug_name_zh FROM medication_record
+                WHERE recorder_id = %s AND member = %s AND mm_id IN ({mm_placeholders})
+            """, (recorder_id, member, *mm_ids.values()))
+            existing = {(mm_id, _drug_key(name)) for mm_id, name in cursor.fetchall()}
+
+            records = []
+            new_codes = set()
+            for visit_date, name, frequency_code, dose_quantity, dosage_unit, days in drugs:
+                mm_id = mm_ids[visit_date]
+                if (mm_id, _drug_key(name)) in existing:
+                    summary["duplicates"] += 1
+                    continue
+                end_date = course_end_date(visit_date, days)
+                records.append((mm_id, recorder_id, member, name, frequency_code,
+                                source_detail, dose_quantity, dosage_unit, days, end_date))
+                # 療程已結束的舊藥袋只留紀錄，不建立提醒
+                if frequency_code and end_date >= today:
+                    new_codes.add(frequency_code)
+            if records:
+                cursor.executemany(repository.sql("medication.insert_record"), records)
+                summary["inserted"] = len(records)
+
+            # 3. 新出現的頻率補上 reminder_time（有固定時間者才建立）
+            if new_codes:
+                code_placeholders = ", ".join(["%s"] * len(new_codes))
+                cursor.execute(f"""
+                    SELECT fc.frequency_code, fc.frequency_name,
+                           EXISTS (
+                               SELECT 1 FROM reminder_time rt
+                               WHERE rt.recorder_id = %s AND rt.member = %s
+                                 AND rt.frequency_name = fc.frequency_name
+                           ) AS has_reminder
+                    FROM frequency_code fc
+                    WHERE fc.frequency_code IN ({code_placeholders})
+                """, (recorder_id, member, *sorted(new_codes)))
+                reminders = []
+                for frequency_code, frequency_name, has_reminder in cursor.fetchall():
+                    times = resolver.times_for_code(frequency_code)[:4]
+                    if has_reminder or not times:
+                        continue
+                    slots = times + [None] * (4 - len(times))
+                    reminders.append((recorder_id, member, frequency_name, *slots, len(times)))
+                if reminders:
+                    cursor.executemany(repository.sql("reminder.insert_missing"), reminders)
+                    summary["reminders_added"] = len(reminders)
+
+            db.commit()
+            logging.info(f"✅ 批次匯入 {recorder_id}/{member}：{summary}")
+            return summary
+        except Exception as e:
+            db.rollback()
+            logging.error(f"ERROR: Failed to bulk import medications: {e}")
+            raise
+        finally:
             cursor.close()
-            conn.close()
 
+
+@read_write
 def update_medication_reminder_times(recorder_id, member, frequency_code, new_times):
     """
     更新 reminder_time 表中指定用戶與用藥對象的時間欄位。
     """
-    conn = get_conn()
-    cursor = conn.cursor()
     try:
         frequency_name = get_frequency_name(frequency_code)
         time_slots = [None] * 4
@@ -591,249 +612,138 @@ def update_medication_reminder_times(recorder_id, member, frequency_code, new_ti
 
         total_doses = len([t for t in time_slots if t])
 
-        cursor.execute("""
-            UPDATE reminder_time
-            SET time_slot_1 = %s, time_slot_2 = %s, time_slot_3 = %s, time_slot_4 = %s,
-                total_doses_per_day = %s, updated_at = CURRENT_TIMESTAMP
-            WHERE recorder_id = %s AND member = %s AND frequency_name = %s
-        """, (
+        repository.execute("reminder.update_times", (
             *time_slots, total_doses,
             recorder_id, member, frequency_name
         ))
-        conn.commit()
         print(f"✅ 提醒時間更新成功：{recorder_id} - {member} - {frequency_name}")
     except Exception as e:
         print(f"❌ 更新提醒時間失敗：{e}")
-        conn.rollback()
-    finally:
-        cursor.close()
-        conn.close()
 
 
 
+@read_only
 def get_reminder_times_for_user(recorder_id, member):
     """
     從 reminder_time 表中取得用藥提醒時間資訊。
     """
-    conn = get_conn()
-    if not conn:
-        return []
     try:
-        cursor = conn.cursor(dictionary=True, buffered=True)
-        cursor.execute("""
-            SELECT frequency_name, time_slot_1, time_slot_2, time_slot_3, time_slot_4
-            FROM reminder_time
-            WHERE recorder_id = %s AND member = %s
-        """, (recorder_id, member))
-        return cursor.fetchall()
+        return repository.fetch_all("reminder.times_for_member", (recorder_id, member))
     except Exception as e:
         logging.error(f"Error fetching reminder times: {e}")
         return []
-    finally:
-        cursor.close()
-        conn.close()
 
 # ------------------------------------------------------------
 # 刪除用藥提醒時間
 # ------------------------------------------------------------
+@read_write
 def delete_medication_reminder_time(recorder_id, member, frequency_name, time_slot_to_delete=None):
     """
-    刪除 reminder_time 的指定時間欄位或整筆資料。
+    刪除 reminder_time 的指定時間欄位或整筆資料，皆為單一語句。
     """
-    conn = get_conn()
-    cursor = conn.cursor(dictionary=True, buffered=True)
     try:
-        if time_slot_to_delete:
-            # 抓出 reminder_time 記錄
-            cursor.execute("""
-                SELECT time_slot_1, time_slot_2, time_slot_3, time_slot_4
-                FROM reminder_time
-                WHERE recorder_id = %s AND member = %s AND frequency_name = %s
-            """, (recorder_id, member, frequency_name))
-            current_slots = cursor.fetchone()
-
-            if not current_slots:
-                print(f"⚠️ 找不到提醒記錄：{recorder_id} - {member} - {frequency_name}")
-                return False
-
-            # 比對格式：轉為 H:M 做比對
-            updated_slots = []
-            for i in range(1, 5):
-                slot = current_slots.get(f'time_slot_{i}')
-                if slot and slot.strftime('%H:%M') != time_slot_to_delete:
-                    updated_slots.append(slot)
-
-            if not updated_slots:
-                # 若已刪除所有時間 ➜ 整筆 reminder_time 也刪掉
-                cursor.execute("""
-                    DELETE FROM reminder_time
-                    WHERE recorder_id = %s AND member = %s AND frequency_name = %s
-                """, (recorder_id, member, frequency_name))
-                conn.commit()
-                print(f"🗑️ 已刪除整筆 reminder_time：{recorder_id}-{member}-{frequency_name}")
+        with repository.session() as db:
+            if time_slot_to_delete:
+                # 只清除單一時段：與 clear_single_time_slot 相同的條件式 UPDATE
+                cleared = _clear_time_slot(db, recorder_id, member, frequency_name, time_slot_to_delete)
+                db.commit()
+                if not cleared:
+                    print(f"⚠️ 找不到提醒記錄或時段：{recorder_id} - {member} - {frequency_name} - {time_slot_to_delete}")
+                    return False
+                print(f"✅ 刪除時間 {time_slot_to_delete} 成功。")
                 return True
             else:
-                # 更新剩餘欄位
-                sql_update = """
-                    UPDATE reminder_time
-                    SET time_slot_1 = %s, time_slot_2 = %s, time_slot_3 = %s, time_slot_4 = %s,
-                        total_doses_per_day = %s, updated_at = CURRENT_TIMESTAMP
-                    WHERE recorder_id = %s AND member = %s AND frequency_name = %s
-                """
-                slot_values = [None] * 4
-                for i, slot in enumerate(updated_slots):
-                    slot_values[i] = slot
-                cursor.execute(sql_update, (
-                    *slot_values,
-                    len(updated_slots),
-                    recorder_id, member, frequency_name
-                ))
-                conn.commit()
-                print(f"✅ 刪除時間 {time_slot_to_delete} 成功。剩餘：{[t.strftime('%H:%M') for t in updated_slots]}")
-                return True
-        else:
-            # 沒有指定單一時間，刪整筆資料
-            cursor.execute("""
-                DELETE FROM reminder_time
-                WHERE recorder_id = %s AND member = %s AND frequency_name = %s
-            """, (recorder_id, member, frequency_name))
-            conn.commit()
-            print(f"🗑️ 刪除整筆提醒成功：{recorder_id} - {member} - {frequency_name}")
-            return cursor.rowcount > 0
+                # 沒有指定單一時間，刪整筆資料
+                deleted = db.execute("reminder.delete", (recorder_id, member, frequency_name))
+                db.commit()
+                print(f"🗑️ 刪除整筆提醒成功：{recorder_id} - {member} - {frequency_name}")
+                return deleted > 0
     except Exception as e:
         print(f"❌ 刪除 reminder_time 時發生錯誤：{e}")
-        conn.rollback()
         return False
-    finally:
-        cursor.close()
-        conn.close()
 
 
 # ------------------------------------------------------------
 # 查詢用藥提醒
 # ------------------------------------------------------------
+@read_only
 def get_medication_reminders_for_user(line_user_id, member): # 增加 member 參數
     """
-    獲取指定 Line 用戶和成員的所有用藥提醒。
-    從 medication_record 中獲取藥品名稱，並透過 drug_name_zh 連接 drug_info。
+    獲取指定 Line 用戶和成員的所有用藥提醒，每個提醒（頻率）一筆。
+    medicines 為該頻率療程未結束的藥品 list（依藥名排序），每項含 medicine_name、dose_quantity、dosage_unit。
     """
-    conn = get_conn()
-    if not conn:
-        logging.error("Failed to connect to database for get_medication_reminders_for_user.")
-        return []
-
     try:
-        cursor = conn.cursor(dictionary=True, buffered=True)
-        query = """
-        SELECT
-            p.member,
-            mr.drug_name_zh AS medicine_name,
-            mr.dose_quantity,
-            mr.dosage_unit,
-            rt.frequency_name,
-            rt.time_slot_1,
-            rt.time_slot_2,
-            rt.time_slot_3,
-            rt.time_slot_4,
-            rt.total_doses_per_day
-        FROM
-            patients p
-        JOIN
-            medication_record mr ON p.recorder_id = mr.recorder_id AND p.member = mr.member
-        JOIN
-            reminder_time rt ON p.recorder_id = rt.recorder_id AND p.member = rt.member
-        WHERE
-            p.recorder_id = %s AND p.member = %s -- 增加篩選條件：member
-        ORDER BY
-            p.member, rt.frequency_name;
-        """
-        cursor.execute(query, (line_user_id, member)) # 傳入 line_user_id 和 member
-        return cursor.fetchall()
+        reminders = repository.fetch_all("reminder.list_for_member", (line_user_id, member))
+        for reminder in reminders:
+            medicines = [m for m in json.loads(reminder["medicines"] or "[]") if m["medicine_name"]]
+            reminder["medicines"] = sorted(medicines, key=lambda m: m["medicine_name"])
+        return reminders
     except Exception as e:
         logging.error(f"ERROR: Failed to get medication reminders for user {line_user_id} and member {member}: {e}")
         return []
-    finally:
-        cursor.close()
-        if conn and conn.is_connected():
-            conn.close()
+
+
+@read_only
+def get_latest_ocr_record(recorder_id):
+    """
+    取得使用者最近一次藥袋辨識（source_detail = 'OCR_Scan'）寫入的藥品，沒有時回傳 None。
+    """
+    return repository.fetch_one("medication.latest_ocr", (recorder_id,))
 
 # ========================\
 # 藥品資訊
 # ========================\
 
+@read_only
 def get_medicine_list():
     """
     從 drug_info 表中獲取所有藥品名稱。
     """
-    conn = get_conn()
-    cursor = conn.cursor(dictionary=True, buffered=True)
     try:
-        cursor.execute("SELECT drug_name_zh FROM drug_info ORDER BY drug_name_zh")
-        medicines = cursor.fetchall()
-        return [m['drug_name_zh'] for m in medicines]
+        return repository.fetch_column("drug.names")
     except Exception as e:
         print(f"ERROR: Failed to get medicine list: {e}")
         return []
-    finally:
-        cursor.close()
-        conn.close()
 
+@read_only
 def get_medicine_id_by_name(medicine_name):
     """
     根據藥品中文名稱獲取 drug_id。
     """
-    conn = get_conn()
-    cursor = conn.cursor(dictionary=True, buffered=True)
     try:
-        cursor.execute("SELECT drug_id FROM drug_info WHERE drug_name_zh = %s", (medicine_name,))
-        result = cursor.fetchone()
-        return result['drug_id'] if result else None
+        return repository.fetch_value("drug.id_by_name", (medicine_name,))
     except Exception as e:
         print(f"ERROR: Failed to get medicine ID for '{medicine_name}': {e}")
         return None
-    finally:
-        cursor.close()
-        conn.close()
 
 # ========================\
 # ⏳ 暫存狀態處理
 # ========================\
 
+@read_write
 def set_temp_state(recorder_id, state_data):
     """
     將指定 recorder_id 的暫存狀態儲存到 user_temp_state 表中。
     """
-    conn = get_conn()
-    cursor = conn.cursor()
-    
-    state_data_json = json.dumps(state_data) 
-    
+    state_data_json = json.dumps(state_data)
+
     try:
-        cursor.execute(
-            "INSERT INTO user_temp_state (recorder_id, state_data) VALUES (%s, %s) "
-            "ON DUPLICATE KEY UPDATE state_data = %s",
-            (recorder_id, state_data_json, state_data_json)
-        )
-        conn.commit()
+        repository.execute("temp_state.set", (recorder_id, state_data_json))
         print(f"DEBUG: Successfully set temp state for {recorder_id}.")
     except Exception as e:
         print(f"ERROR: Failed to set temp state for {recorder_id}: {e}")
-    finally:
-        cursor.close()
-        conn.close()
 
 def get_temp_state(recorder_id):
     """
     從 user_temp_state 表中獲取指定 recorder_id 的暫存狀態。
+    暫存狀態多半由上一則 webhook 請求寫入，read-your-writes 只涵蓋同一請求，因此一律讀 primary。
     """
-    conn = get_conn()
-    cursor = conn.cursor(dictionary=True, buffered=True)
     try:
-        cursor.execute("SELECT state_data FROM user_temp_state WHERE recorder_id = %s", (recorder_id,))
-        result = cursor.fetchone()
-        
+        with repository.session(readonly=False) as db:
+            result = db.fetch_value("temp_state.get", (recorder_id,))
+
         if result:
-            state_data = json.loads(result['state_data'])
+            state_data = json.loads(result)
             print(f"DEBUG: Retrieved temp state for {recorder_id}: {state_data}")
             return state_data
         else:
@@ -842,86 +752,85 @@ def get_temp_state(recorder_id):
     except Exception as e:
         print(f"ERROR: Failed to get temp state for {recorder_id}: {e}")
         return None
-    finally:
-        cursor.close()
-        conn.close()
 
+@read_write
 def clear_temp_state(recorder_id):
     """
     清除指定 recorder_id 的暫存狀態。
     """
-    conn = get_conn()
-    cursor = conn.cursor()
     try:
-        cursor.execute("DELETE FROM user_temp_state WHERE recorder_id = %s", (recorder_id,))
-        conn.commit()
+        repository.execute("temp_state.clear", (recorder_id,))
         print(f"DEBUG: Cleared temp state for {recorder_id}.")
     except Exception as e:
         print(f"ERROR: Failed to clear temp state for {recorder_id}: {e}")
-    finally:
-        cursor.close()
-        conn.close()
+
+# ========================\
+# ✅ 服藥紀錄
+# ========================\
+
+@read_write
+def record_dose_response(responder_id, patient_id, scheduled_date, slot_time, status):
+    """
+    記錄提醒訊息的「已服用 / 略過」回覆：該時段的每個藥品寫入一筆 dose_log，
+    並在同一交易內把這次寫入的筆數累加到 dose_daily_rollup。
+    回傳寫入的藥品數；0 表示這個時段已回覆過，或回覆者不是該用藥者的記錄者或綁定家人。
+    """
+    token = uuid.uuid4().hex
+    with repository.session() as db:
+        logged = db.execute("dose.log_slot", (
+            scheduled_date, slot_time, status, responder_id, token, scheduled_date,
+            patient_id, responder_id, slot_time
+        ))
+        if logged:
+            db.execute("dose.rollup_response", (patient_id, scheduled_date, slot_time, token))
+        db.commit()
+    return logged
+
+
+@read_only
+def get_dose_adherence(patient_id, days):
+    """最近 days 天每個藥品的已服用 / 略過次數（只查每日彙總）。"""
+    return repository.fetch_all("dose.adherence", (patient_id, days))
 
 # ========================\
 # 📝 用藥記錄
 # ========================\
 
+@read_write
 def add_medication_record(recorder_id, member, drug_name_zh, frequency_name, source_detail, dose_quantity, dosage_unit, days):
     """
     新增一筆用藥記錄到 medication_record 表。
     現在使用 drug_name_zh 而非 drug_id。
     """
-    conn = get_conn()
-    if not conn:
-        logging.error("Failed to connect to database for add_medication_record.")
-        raise Exception("Database connection failed.")
+    with repository.session() as db:
+        try:
+            current_mm_id = db.fetch_value("medication.latest_main", (recorder_id, member))
+            if not current_mm_id:
+                # 如果沒有，則創建一個新的 medication_main 記錄
+                # 假設有一個預設的 clinic_id 和 doctor_name
+                clinic_id = 1 # 假設預設診所ID為1
+                db.execute("medication.insert_named_record", (
+                    current_mm_id, recorder_id, member, drug_name_zh, frequency_name,
+                    source_detail, dose_quantity, dosage_unit, days, course_end_date(date.today(), days)
+                ))
+                current_mm_id = db.lastrowid
+                logging.info(f"DEBUG: Created a default medication_main record with mm_id: {current_mm_id}")
 
-    try:
-        cursor = conn.cursor()
-        current_mm_id = None
-        cursor.execute(
-            "SELECT mm_id FROM medication_main WHERE recorder_id = %s AND member = %s ORDER BY visit_date DESC LIMIT 1",
-            (recorder_id, member)
-        )
-        main_record = cursor.fetchone()
-        if main_record:
-            current_mm_id = main_record[0]
-        else:
-            # 如果沒有，則創建一個新的 medication_main 記錄
-            # 假設有一個預設的 clinic_id 和 doctor_name
-            clinic_id = 1 # 假設預設診所ID為1
-            cursor.execute(
-            """
-            INSERT INTO medication_record (mm_id, recorder_id, member, drug_name_zh, frequency_name, source_detail, dose_quantity, dosage_unit, days)
-            VALUES (%s, %s, %s, %s, %s, %s, %s, %s, %s)
-            """,
-            (current_mm_id, recorder_id, member, drug_name_zh, frequency_name, source_detail, dose_quantity, dosage_unit, days)
-        )
-            current_mm_id = cursor.lastrowid
-            logging.info(f"DEBUG: Created a default medication_main record with mm_id: {current_mm_id}")
-
-
-        if not current_mm_id:
-            raise Exception("Failed to get or create mm_id for medication_record.")
-
-        # 3. 插入 medication_record
-        # 由於 medication_record 沒有 PRIMARY KEY，每次呼叫都會新增一條。
-        # 如果需要更新，則需要在這裡添加 SELECT 和 UPDATE 邏輯。
-        cursor.execute(
-            """
-            INSERT INTO medication_record (mm_id, recorder_id, member, drug_name_zh, frequency_name, source_detail, dose_quantity, dosage_unit, days)
-            VALUES (%s, %s, %s, %s, %s, %s, %s, %s, %s)
-            """,
-            (current_mm_id, recorder_id, member, drug_name_zh, frequency_name, source_detail, dose_quantity, dosage_unit, days)
-        )
-        conn.commit()
-        logging.info(f"DEBUG: Added medication record for {member} with {drug_name_zh}")
 
-    except Exception as e:
-        conn.rollback()
-        logging.error(f"ERROR: Failed to add medication record: {e}")
-        raise
-    finally:
-        cursor.close()
-        if conn and conn.is_connected():
-            conn.close()
\ No newline at end of file
+            if not current_mm_id:
+                raise Exception("Failed to get or create mm_id for medication_record.")
+
+            # 3. 插入 medication_record
+            # 由於 medication_record 沒有 PRIMARY KEY，每次呼叫都會新增一條。
+            # 如果需要更新，則需要在這裡添加 SELECT 和 UPDATE 邏輯。
+            db.execute("medication.insert_named_record", (
+                current_mm_id, recorder_id, member, drug_name_zh, frequency_name,
+                source_detail, dose_quantity, dosage_unit, days, course_end_date(date.today(), days)
+            ))
+            db.commit()
+            logging.info(f"DEBUG: Added medication record for {member} with {drug_name_zh}")
+
+        except Exception as e:
+            db.rollback()
+            logging.error(f"ERROR: Failed to add medication record: {e}")
+            raise
@@ -0,0 +1,113 @@
+import copy
+import json
+import logging
+import os
+import tempfile
+import threading
+import time
+from collections import OrderedDict
+
+from config import OCR_CACHE_MAX_ENTRIES, OCR_CACHE_DIR, OCR_CACHE_DISK_MAX_AGE_DAYS
+
+# ========================
+# 藥袋辨識結果快取（以圖片內容 SHA-256 為 key）
+# ========================
+# 同一張照片重複上傳、或家人上傳同一張照片時，直接回傳上次的 OCR 文字與解析結果，
+# 不再送進 OCR pool。記憶體層為 LRU；設定 OCR_CACHE_DIR 時另有磁碟層，重啟後仍有效。
+
+
+class OcrResultCache:
+
+    def __init__(self, max_entries=OCR_CACHE_MAX_ENTRIES, disk_dir=OCR_CACHE_DIR):
+        self.max_entries = max_entries
+        self.disk_dir = disk_dir
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+        self._stats = {"hits": 0, "disk_hits": 0, "misses": 0, "evictions": 0}
+
+    def get(self, digest):
+        """回傳 (ocr_text, medications)；沒有快取時回傳 None。"""
+        with self._lock:
+            entry = self._entries.get(digest)
+            if entry is not None:
+                self._entries.move_to_end(digest)
+                self._stats["hits"] += 1
+                return entry[0], copy.deepcopy(entry[1])
+
+        entry = self._read_disk(digest)
+        with self._lock:
+            if entry is None:
+                self._stats["misses"] += 1
+                return None
+            self._stats["disk_hits"] += 1
+            self._store(digest, entry)
+        return entry[0], copy.deepcopy(entry[1])
+
+    def put(self, digest, ocr_text, medications):
+        entry = (ocr_text, copy.deepcopy(medications))
+        with self._lock:
+            self._store(digest, entry)
+        self._write_disk(digest, entry)
+
+    def _store(self, digest, entry):
+        self._entries[digest] = entry
+        self._entries.move_to_end(digest)
+        while len(self._entries) > self.max_entries:
+            self._entries.popitem(last=False)
+            self._stats["evictions"] += 1
+
+    def _disk_path(self, digest):
+        return os.path.join(self.disk_dir, digest[:2], f"{digest}.json")
+
+    def _read_disk(self, digest):
+        if not self.disk_dir:
+            return None
+        path = self._disk_path(digest)
+        try:
+            with open(path, encoding="utf-8") as f:
+                data = json.load(f)
+            os.utime(path)  # 更新修改時間，讓常用的檔案不會被 prune_disk 清掉
+            return data["ocr_text"], data["medications"]
+        except FileNotFoundError:
+            return None
+        except (OSError, ValueError, KeyError) as e:
+            logging.warning(f"⚠️ 讀取 OCR 快取檔失敗 {path}：{e}")
+            return None
+
+    def _write_disk(self, digest, entry):
+        if not self.disk_dir:
+            return
+        path = self._disk_path(digest)
+        try:
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+            # 先寫暫存檔再改名，避免其他程序讀到寫一半的檔案
+            fd, tmp_path = tempfile.mkstemp(dir=os.path.dirname(path), suffix=".tmp")
+            with os.fdopen(fd, "w", encoding="utf-8") as f:
+                json.dump({"ocr_text": entry[0], "medications": entry[1]}, f, ensure_ascii=False)
+            os.replace(tmp_path, path)
+        except OSError as e:
+            logging.warning(f"⚠️ 寫入 OCR 快取檔失敗 {path}：{e}")
+
+    def prune_disk(self, max_age_days=OCR_CACHE_DISK_MAX_AGE_DAYS):
+        """刪除超過 max_age_days 未被使用的磁碟快取檔，回傳刪除的檔案數。"""
+        if not self.disk_dir or not os.path.isdir(self.disk_dir):
+            return 0
+        cutoff = time.time() - max_age_days * 86400
+        removed = 0
+        for root, _, files in os.walk(self.disk_dir):
+            for name in files:
+                path = os.path.join(root, name)
+                try:
+                    if os.path.getmtime(path) < cutoff:
+                        os.unlink(path)
+                        removed += 1
+                except OSError:
+                    continue
+        return removed
+
+    def stats(self):
+        with self._lock:
+            return dict(self._stats, entries=len(self._entries), max_entries=self.max_entries)
+
+
+ocr_cache = OcrResultCache()
@@ -0,0 +1,254 @@
+import importlib
+import logging
+import multiprocessing
+import signal
+import threading
+import time
+from abc import ABC, abstractmethod
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures import TimeoutError as FutureTimeoutError
+
+from config import OCR_BACKEND, OCR_POOL_WORKERS, OCR_MAX_PENDING, OCR_TIMEOUT_SECONDS
+from ocr_cache import ocr_cache
+
+logging.basicConfig(level=logging.INFO)
+
+
+class OcrBackend(ABC):
+    """
+    OCR 引擎介面。實作會在 worker process 中建立一次，之後重複呼叫 recognize。
+    每次 recognize 在 worker 中以 OCR_TIMEOUT_SECONDS 限時（SIGALRM），逾時拋出 OcrTimeout；
+    呼叫外部程式的實作（例如 pytesseract）請一併傳入 timeout，讓子程序在逾時時結束。
+    """
+
+    @abstractmethod
+    def recognize(self, image_data: bytes) -> str:
+        """將藥袋圖片辨識為原始文字。"""
+
+
+class LocalOcrBackend(OcrBackend):
+    """
+    本機替身後端，不呼叫任何外部服務，輸出完全由輸入決定：
+    若圖片內容本身就是 UTF-8 文字（測試與基準測試使用）則原樣回傳，
+    否則回傳 call_ocr_service 的範例藥袋文字。
+    """
+
+    def recognize(self, image_data: bytes) -> str:
+        try:
+            text = image_data.decode("utf-8")
+            if "藥品名稱" in text:
+                return text.strip()
+        except UnicodeDecodeError:
+            pass
+        from medication_ocr_parser import call_ocr_service
+        return call_ocr_service(image_data)
+
+
+class OcrQueueFull(Exception):
+    """等待中的 OCR 工作已達 OCR_MAX_PENDING 上限。"""
+
+
+class OcrTimeout(Exception):
+    """OCR 工作未在時限內完成。"""
+
+
+# ------------------------------------------------------------
+# worker process 端
+# ------------------------------------------------------------
+_worker_backend = None
+
+
+def _load_backend(dotted_path):
+    module_name, class_name = dotted_path.rsplit(".", 1)
+    return getattr(importlib.import_module(module_name), class_name)()
+
+
+def _init_worker(dotted_path):
+    global _worker_backend
+    _worker_backend = _load_backend(dotted_path)
+
+
+def _raise_timeout(signum, frame):
+    raise OcrTimeout("OCR 在 worker 中超過時限")
+
+
+def _run_with_deadline(fn, arg, timeout):
+    """在 worker 中限時執行 fn(arg)：逾時由 SIGALRM 中斷並拋出 OcrTimeout，worker 隨即可接下一件工作。"""
+    use_alarm = timeout and hasattr(signal, "setitimer")
+    if use_alarm:
+        signal.signal(signal.SIGALRM, _raise_timeout)
+        signal.setitimer(signal.ITIMER_REAL, timeout)
+    try:
+        return fn(arg)
+    finally:
+        if use_alarm:
+            signal.setitimer(signal.ITIMER_REAL, 0)
+
+
+def _recognize_in_worker(image_data):
+    return _worker_backend.recognize(image_data)
+
+
+def _recognize_file_in_worker(image_path):
+    # 由 worker 自行讀檔，主程序不必持有整張圖片
+    with open(image_path, "rb") as f:
+        return _worker_backend.recognize(f.read())
+
+
+# ------------------------------------------------------------
+# 主程序端
+# ------------------------------------------------------------
+class OcrWorkerPool:
+    """
+    在 process pool 中執行 OCR，避免耗 CPU 的辨識佔用 webhook 執行緒。
+    以 semaphore 限制「已送出但未完成」的工作數，超過上限時立即拒絕而不是無限排隊。
+    每件工作在 worker 中限時 timeout 秒，卡住的辨識不會一直佔用 worker 與佇列名額。
+    """
+
+    def __init__(self, backend=OCR_BACKEND, workers=OCR_POOL_WORKERS, max_pending=OCR_MAX_PENDING,
+                 timeout=OCR_TIMEOUT_SECONDS):
+        self.workers = workers
+        self.max_pending = max_pending
+        self.timeout = timeout
+        self._executor = ProcessPoolExecutor(
+            max_workers=workers,
+            mp_context=multiprocessing.get_context("spawn"),
+            initializer=_init_worker,
+            initargs=(backend,),
+        )
+        self._slots = threading.BoundedSemaphore(max_pending)
+        self._lock = threading.Lock()
+        # wait() 已計為逾時的工作：之後才結束時不再計入完成或失敗
+        self._timed_out = set()
+        self._started_at = time.monotonic()
+        self._stats = {
+            "submitted": 0, "completed": 0, "failed": 0, "timed_out": 0, "rejected": 0,
+            "pending": 0, "max_pending_seen": 0, "busy_seconds": 0.0,
+        }
+
+    def _submit(self, fn, arg):
+        if not self._slots.acquire(blocking=False):
+            with self._lock:
+                self._stats["rejected"] += 1
+            raise OcrQueueFull(f"OCR 佇列已滿（{self.max_pending}）")
+
+        submitted_at = time.monotonic()
+        with self._lock:
+            self._stats["submitted"] += 1
+            self._stats["pending"] += 1
+            self._stats["max_pending_seen"] = max(self._stats["max_pending_seen"], self._stats["pending"])
+
+        def _done(future):
+            self._slots.release()
+            with self._lock:
+                self._stats["pending"] -= 1
+                if future in self._timed_out:
+                    self._timed_out.discard(future)
+                elif future.cancelled():
+                    self._stats["failed"] += 1
+                elif isinstance(future.exception(), OcrTimeout):
+                    self._stats["timed_out"] += 1
+                elif future.exception() is not None:
+                    self._stats["failed"] += 1
+                else:
+                    self._stats["completed"] += 1
+                    self._stats["busy_seconds"] += time.monotonic() - submitted_at
+
+        try:
+            future = self._executor.submit(_run_with_deadline, fn, arg, self.timeout)
+        except Exception:
+            self._slots.release()
+            with self._lock:
+                self._stats["pending"] -= 1
+                self._stats["failed"] += 1
+            raise
+        future.add_done_callback(_done)
+        return future
+
+    def submit(self, image_data: bytes):
+        """送出圖片位元組，回傳 Future[str]。佇列已滿時拋出 OcrQueueFull。"""
+        return self._submit(_recognize_in_worker, image_data)
+
+    def submit_file(self, image_path: str):
+        """送出圖片檔路徑，由 worker 讀檔辨識，回傳 Future[str]。"""
+        return self._submit(_recognize_file_in_worker, image_path)
+
+    def wait(self, future, timeout=OCR_TIMEOUT_SECONDS):
+        """
+        等待結果，timeout 秒內未完成時拋出 OcrTimeout；尚在排隊的工作一併取消，
+        已在執行的工作由 worker 端的時限結束（見 _run_with_deadline）。
+        """
+        try:
+            return future.result(timeout=timeout)
+        except FutureTimeoutError:
+            with self._lock:
+                finished = future.done()
+                if not finished:
+                    # 先標記再取消：取消排隊中的工作會立即觸發 _done
+                    self._timed_out.add(future)
+                    self._stats["timed_out"] += 1
+            if finished:
+                # 剛好在逾時後完成
+                return future.result()
+            future.cancel()
+            raise OcrTimeout(f"OCR 超過 {timeout} 秒未完成")
+
+    def metrics(self):
+        """回傳吞吐量與佇列深度等統計，用於調整 pool 大小。"""
+        with self._lock:
+            stats = dict(self._stats)
+        uptime = time.monotonic() - self._started_at
+        stats["workers"] = self.workers
+        stats["max_pending"] = self.max_pending
+        stats["throughput_per_min"] = round(stats["completed"] / uptime * 60, 2) if uptime else 0.0
+        stats["avg_seconds"] = round(stats["busy_seconds"] / stats["completed"], 3) if stats["completed"] else 0.0
+        return stats
+
+    def shutdown(self):
+        self._executor.shutdown(wait=False, cancel_futures=True)
+
+
+_pool = None
+_pool_lock = threading.Lock()
+
+
+def get_ocr_pool():
+    """延遲建立全域 OCR pool，只在第一次使用時啟動 worker process。"""
+    global _pool
+    if _pool is None:
+        with _pool_lock:
+            if _pool is None:
+                _pool = OcrWorkerPool()
+    return _pool
+
+
+def recognize_and_parse(image_data: bytes, timeout=OCR_TIMEOUT_SECONDS):
+    """
+    在 OCR pool 中辨識圖片，再把文字交給 parse_medication_order。
+    會阻塞呼叫端直到完成，請勿在 webhook 執行緒中呼叫。
+
+    Returns:
+        tuple: (OCR 原始文字, parse_medication_order 的結果)
+    """
+    from medication_ocr_parser import parse_medication_order
+
+    pool = get_ocr_pool()
+    ocr_text = pool.wait(pool.submit(image_data), timeout=timeout)
+    return ocr_text, parse_medication_order(ocr_text)
+
+
+def log_ocr_metrics():
+    cache = ocr_cache.stats()
+    logging.info(
+        f"📊 OCR 快取：命中 {cache['hits']}（磁碟 {cache['disk_hits']}）、未命中 {cache['misses']}、"
+        f"淘汰 {cache['evictions']}，目前 {cache['entries']}/{cache['max_entries']} 筆"
+    )
+    if _pool is None:
+        return
+    stats = _pool.metrics()
+    logging.info(
+        f"📊 OCR pool：完成 {stats['completed']}、失敗 {stats['failed']}、逾時 {stats['timed_out']}、"
+        f"拒絕 {stats['rejected']}，佇列 {stats['pending']}/{stats['max_pending']}"
+        f"（最高 {stats['max_pending_seen']}），每分鐘 {stats['throughput_per_min']} 件，"
+        f"平均 {stats['avg_seconds']} 秒"
+    )
@@ -0,0 +1,694 @@
+import logging
+import threading
+from collections import OrderedDict
+from contextlib import contextmanager
+from datetime import datetime, timedelta
+from typing import NamedTuple, Optional, TypedDict
+
+from mysql.connector import errors, pooling
+
+from config import DB_BACKEND, DB_CONFIG, DB_POOL_SIZE, DB_REPLICA_CONFIG
+from database import get_conn, mark_written, use_replica
+
+# ========================
+# 🗄️ 資料存取層：具名語句 + server-side prepared statement
+# ========================
+# 所有固定的 SQL 在這裡以名稱註冊，透過 prepared cursor 執行：
+# 每條連線第一次執行某個語句時送出 PREPARE，之後只送參數，MySQL 不必重新解析與規劃。
+# prepared cursor 依連線快取，連線來自 pool_reset_session=False 的連線池，
+# 歸還連線時不會 reset session，已 prepare 的語句可以留給下一次借用。
+#
+# 注意：
+# - prepared cursor 以字串物件的 identity 判斷是否為同一語句，必須傳入註冊時的同一個字串，
+#   參數只能用位置參數 %s（%(name)s 每次都會產生新字串而重新 prepare）。
+# - IN (...) 長度不固定的查詢與需要多列 INSERT 的 executemany 仍使用一般 cursor（Session.cursor()）。
+# - 連線池借不到連線時改用一般連線，該次 prepare 的語句在歸還時一併釋放。
+# - 讀寫分離：session() 依 database.py 的 @read_only / @read_write 標示與請求內是否已寫入，
+#   從 primary 或 replica 連線池借連線；commit 後同一請求的讀取改走 primary。
+# - DB_BACKEND = "sqlite" 時不使用連線池與 prepared cursor，語句由 sqlite_backend 轉換語法後執行；
+#   語意無法直接轉換的語句以 register(..., sqlite=...) 另外提供 SQLite 版本。
+
+
+class Statement(NamedTuple):
+    name: str
+    sql: str
+    row_type: Optional[type]
+    sqlite_sql: Optional[str] = None
+
+    def text(self):
+        """目前後端要執行的 SQL（MySQL 時回傳註冊的同一個字串物件）。"""
+        if DB_BACKEND == "sqlite" and self.sqlite_sql is not None:
+            return self.sqlite_sql
+        return self.sql
+
+
+STATEMENTS = {}
+
+
+def register(name, sql, row_type=None, sqlite=None):
+    """
+    註冊具名語句；row_type 為查詢結果每一列的 TypedDict（僅作為型別標示），
+    sqlite 為 SQLite 後端改用的 SQL（不提供時由 sqlite_backend 自動轉換）。
+    """
+    existing = STATEMENTS.get(name)
+    if existing is not None and existing.sql != sql:
+        raise ValueError(f"語句名稱重複：{name}")
+    STATEMENTS[name] = Statement(name, sql, row_type, sqlite)
+    return STATEMENTS[name]
+
+
+def sql(name):
+    """取得註冊的 SQL 文字（給一般 cursor 的 executemany 使用）。"""
+    return STATEMENTS[name].text()
+
+
+# ------------------------------------------------------------
+# 查詢結果型別
+# ------------------------------------------------------------
+
+class UserRow(TypedDict):
+    recorder_id: str
+    user_name: str
+    created_at: datetime
+
+
+class FamilyBindingRow(TypedDict):
+    role: str
+    user_id: str
+    user_name: str
+
+
+class InviteClaimRow(TypedDict):
+    inviter_recorder_id: str
+    user_name: Optional[str]
+
+
+class SuggestedTimeRow(TypedDict):
+    time_slot_1: Optional[timedelta]
+    time_slot_2: Optional[timedelta]
+    time_slot_3: Optional[timedelta]
+    time_slot_4: Optional[timedelta]
+
+
+class FrequencyOptionRow(TypedDict):
+    frequency_code: str
+    frequency_name: str
+
+
+class ReminderTimeRow(TypedDict):
+    frequency_name: str
+    time_slot_1: Optional[timedelta]
+    time_slot_2: Optional[timedelta]
+    time_slot_3: Optional[timedelta]
+    time_slot_4: Optional[timedelta]
+
+
+class MedicationReminderRow(TypedDict):
+    reminder_time_id: int
+    member: str
+    frequency_name: str
+    time_slot_1: Optional[timedelta]
+    time_slot_2: Optional[timedelta]
+    time_slot_3: Optional[timedelta]
+    time_slot_4: Optional[timedelta]
+    total_doses_per_day: Optional[int]
+    medicines: str   # JSON 陣列 [{"medicine_name", "dose_quantity", "dosage_unit"}, ...]
+
+
+class DueReminderRow(TypedDict):
+    recipient_id: str
+    members: str   # JSON 陣列 [{"patient_id", "member", "medicines": [{"medicine_name", "dose_quantity"}, ...]}, ...]
+
+
+class LatestOcrRecordRow(TypedDict):
+    member: str
+    drug_name_zh: str
+    frequency_code: Optional[str]
+    frequency_name: Optional[str]
+    dose_quantity: Optional[str]
+    days: Optional[int]
+
+
+class DoseAdherenceRow(TypedDict):
+    member: str
+    drug_name_zh: str
+    taken: int
+    skipped: int
+
+
+# ------------------------------------------------------------
+# 👤 使用者
+# ------------------------------------------------------------
+register("users.get", "SELECT * FROM users WHERE recorder_id = %s", UserRow)
+register("users.insert_default", "INSERT IGNORE INTO users (recorder_id, user_name) VALUES (%s, %s)")
+register("users.fill_name", "UPDATE users SET user_name = %s WHERE recorder_id = %s AND user_name = %s")
+
+# ------------------------------------------------------------
+# 🧑‍🤝‍🧑 家庭成員與綁定
+# ------------------------------------------------------------
+register("patients.insert", "INSERT INTO patients (recorder_id, member) VALUES (%s, %s)")
+register("patients.insert_self", "INSERT IGNORE INTO patients (recorder_id, member) VALUES (%s, '本人')")
+register("patients.members", "SELECT member FROM patients WHERE recorder_id = %s")
+register("patients.rename", "UPDATE patients SET member = %s WHERE recorder_id = %s AND member = %s")
+# 被邀請人自訂關係：成員不存在時新增，已存在時只更新綁定對象（uq_patients_member）
+register("patients.link", """
+    INSERT INTO patients (recorder_id, member, linked_user_id) VALUES (%s, %s, %s)
+    ON DUPLICATE KEY UPDATE linked_user_id = VALUES(linked_user_id)
+""")
+# 被邀請人確認自己是哪位成員：只更新已存在的成員
+register("patients.link_existing", """
+    UPDATE patients SET linked_user_id = %s
+    WHERE recorder_id = %s AND member = %s
+""")
+register("invite.insert", """
+    INSERT INTO invite_codes (code, inviter_recorder_id, expires_at)
+    VALUES (%s, %s, %s)
+""")
+# 認領邀請碼：不存在、已使用或已過期時不會更新任何資料
+register("invite.claim", """
+    UPDATE invite_codes
+    SET used = TRUE, bound_at = NOW(), recipient_line_id = %s
+    WHERE code = %s AND used = FALSE AND expires_at >= NOW()
+    LIMIT 1
+""")
+register("invite.claimed_by", """
+    SELECT ic.inviter_recorder_id, u.user_name
+    FROM invite_codes ic
+    LEFT JOIN users u ON u.recorder_id = ic.recipient_line_id
+    WHERE ic.code = %s AND ic.recipient_line_id = %s
+    ORDER BY ic.bound_at DESC
+    LIMIT 1
+""", InviteClaimRow)
+register("family.bind", """
+    INSERT IGNORE INTO invitation_recipients (recorder_id, recipient_line_id, recipient_name, relation_type)
+    VALUES (%s, %s, %s, %s)
+""")
+register("family.bindings", """
+    SELECT '邀請他人' AS role, r.recipient_line_id AS user_id, u.user_name
+    FROM invitation_recipients r
+    JOIN users u ON r.recipient_line_id = u.recorder_id
+    WHERE r.recorder_id = %s
+
+    UNION
+
+    SELECT '被邀請人' AS role, r.recorder_id AS user_id, u.user_name
+    FROM invitation_recipients r
+    JOIN users u ON r.recorder_id = u.recorder_id
+    WHERE r.recipient_line_id = %s
+""", FamilyBindingRow)
+register("family.unbind", """
+    DELETE FROM invitation_recipients
+    WHERE (recorder_id = %s AND recipient_line_id = %s)
+       OR (recorder_id = %s AND recipient_line_id = %s)
+""")
+
+# ------------------------------------------------------------
+# 💊 頻率代碼
+# ------------------------------------------------------------
+register("frequency.suggested_times", """
+    SELECT time_slot_1, time_slot_2, time_slot_3, time_slot_4
+    FROM suggested_dosage_time
+    WHERE frequency_code = %s
+""", SuggestedTimeRow)
+register("frequency.name_by_code", "SELECT frequency_name FROM frequency_code WHERE frequency_code = %s")
+register("frequency.code_by_name", "SELECT frequency_code FROM frequency_code WHERE frequency_name = %s")
+register("frequency.options", "SELECT frequency_code, frequency_name FROM frequency_code", FrequencyOptionRow)
+register("frequency.times_per_day", "SELECT times_per_day FROM frequency_code WHERE frequency_code = %s")
+
+# ------------------------------------------------------------
+# ⏰ 用藥提醒
+# ------------------------------------------------------------
+# 清除等於指定時間的時段並重算每日次數；SET 由左到右執行，total_doses_per_day 看到的是清除後的值。
+# 時段全部清空的列由 reminder.delete_if_empty 在同一交易中刪除。
+# 參數依序為：時間 ×4、recorder_id、member、frequency_name、時間。
+# SQLite 的 SET 都看到更新前的值，次數改以同樣的條件計算（?N 依序對應上述參數）。
+register("reminder.clear_slot", """
+    UPDATE reminder_time
+    SET time_slot_1 = IF(time_slot_1 = CAST(%s AS TIME), NULL, time_slot_1),
+        time_slot_2 = IF(time_slot_2 = CAST(%s AS TIME), NULL, time_slot_2),
+        time_slot_3 = IF(time_slot_3 = CAST(%s AS TIME), NULL, time_slot_3),
+        time_slot_4 = IF(time_slot_4 = CAST(%s AS TIME), NULL, time_slot_4),
+        total_doses_per_day = (time_slot_1 IS NOT NULL) + (time_slot_2 IS NOT NULL)
+                            + (time_slot_3 IS NOT NULL) + (time_slot_4 IS NOT NULL),
+        updated_at = CURRENT_TIMESTAMP
+    WHERE recorder_id = %s AND member = %s AND frequency_name = %s
+      AND CAST(%s AS TIME) IN (time_slot_1, time_slot_2, time_slot_3, time_slot_4)
+""", sqlite="""
+    UPDATE reminder_time
+    SET time_slot_1 = IIF(time_slot_1 = time(?1), NULL, time_slot_1),
+        time_slot_2 = IIF(time_slot_2 = time(?2), NULL, time_slot_2),
+        time_slot_3 = IIF(time_slot_3 = time(?3), NULL, time_slot_3),
+        time_slot_4 = IIF(time_slot_4 = time(?4), NULL, time_slot_4),
+        total_doses_per_day = (time_slot_1 IS NOT NULL AND time_slot_1 <> time(?1))
+                            + (time_slot_2 IS NOT NULL AND time_slot_2 <> time(?2))
+                            + (time_slot_3 IS NOT NULL AND time_slot_3 <> time(?3))
+                            + (time_slot_4 IS NOT NULL AND time_slot_4 <> time(?4)),
+        updated_at = datetime('now', 'localtime')
+    WHERE recorder_id = ?5 AND member = ?6 AND frequency_name = ?7
+      AND time(?8) IN (time_slot_1, time_slot_2, time_slot_3, time_slot_4)
+""")
+# 清除時段後沒有剩下任何時段的提醒整筆刪除，避免選單顯示「未設定」、批次匯入誤判為已有提醒
+register("reminder.delete_if_empty", """
+    DELETE FROM reminder_time
+    WHERE recorder_id = %s AND member = %s AND frequency_name = %s
+      AND time_slot_1 IS NULL AND time_slot_2 IS NULL
+      AND time_slot_3 IS NULL AND time_slot_4 IS NULL
+""")
+register("reminder.update_times", """
+    UPDATE reminder_time
+    SET time_slot_1 = %s, time_slot_2 = %s, time_slot_3 = %s, time_slot_4 = %s,
+        total_doses_per_day = %s, updated_at = CURRENT_TIMESTAMP
+    WHERE recorder_id = %s AND member = %s AND frequency_name = %s
+""")
+register("reminder.times_for_member", """
+    SELECT frequency_name, time_slot_1, time_slot_2, time_slot_3, time_slot_4
+    FROM reminder_time
+    WHERE recorder_id = %s AND member = %s
+""", ReminderTimeRow)
+register("reminder.delete", """
+    DELETE FROM reminder_time
+    WHERE recorder_id = %s AND member = %s AND frequency_name = %s
+""")
+# 頻率名稱在同一語句中由 frequency_code 帶出；已有提醒時覆蓋時段
+register("reminder.upsert_by_code", """
+    INSERT INTO reminder_time (
+        recorder_id, member, frequency_name,
+        time_slot_1, time_slot_2, time_slot_3, time_slot_4,
+        total_doses_per_day
+    )
+    SELECT %s, %s, fc.frequency_name, %s, %s, %s, %s, %s
+    FROM frequency_code fc
+    WHERE fc.frequency_code = %s
+    ON DUPLICATE KEY UPDATE
+        time_slot_1 = VALUES(time_slot_1), time_slot_2 = VALUES(time_slot_2),
+        time_slot_3 = VALUES(time_slot_3), time_slot_4 = VALUES(time_slot_4),
+        total_doses_per_day = VALUES(total_doses_per_day), updated_at = CURRENT_TIMESTAMP
+""")
+register("reminder.insert_missing", """
+    INSERT IGNORE INTO reminder_time (
+        recorder_id, member, frequency_name,
+        time_slot_1, time_slot_2, time_slot_3, time_slot_4,
+        total_doses_per_day
+    ) VALUES (%s, %s, %s, %s, %s, %s, %s, %s)
+""")
+# 每個提醒一列：藥品以頻率代碼連到提醒，在資料庫端彙總成 JSON 陣列（只含療程未結束的藥品），
+# 回傳筆數等於提醒數、資料量與藥品數成正比；沒有藥品的提醒 medicines 為 [{"medicine_name": null, ...}]
+register("reminder.list_for_member", """
+    SELECT
+        rt.reminder_time_id,
+        rt.member,
+        rt.frequency_name,
+        rt.time_slot_1,
+        rt.time_slot_2,
+        rt.time_slot_3,
+        rt.time_slot_4,
+        rt.total_doses_per_day,
+        JSON_ARRAYAGG(JSON_OBJECT(
+            'medicine_name', mr.drug_name_zh,
+            'dose_quantity', mr.dose_quantity,
+            'dosage_unit', mr.dosage_unit
+        )) AS medicines
+    FROM reminder_time rt
+    LEFT JOIN frequency_code fc ON fc.frequency_name = rt.frequency_name
+    LEFT JOIN medication_record mr ON mr.recorder_id = rt.recorder_id
+                                  AND mr.member = rt.member
+                                  AND mr.frequency_count_code = fc.frequency_code
+                                  AND mr.course_end_date >= CURDATE()
+    WHERE rt.recorder_id = %s AND rt.member = %s
+    GROUP BY rt.reminder_time_id, rt.member, rt.frequency_name,
+             rt.time_slot_1, rt.time_slot_2, rt.time_slot_3, rt.time_slot_4, rt.total_doses_per_day
+    ORDER BY rt.frequency_name
+""", MedicationReminderRow)
+# 排程每分鐘的到期提醒：每位收件者（記錄者與綁定的用藥者）一列，所到期的用藥者與藥品在資料庫端彙總成 JSON。
+# 時段以等值比對，每個時段欄位各有索引（migrations/0006_reminder_slot_indexes.up.sql）；
+# 同一用藥者同名藥品（多個頻率在同一時段）只列一次。JSON_EXTRACT(x, '$') 讓內層陣列以 JSON 而非字串嵌入。
+# 參數：時間（四個時段各一次）。
+register("reminder.due_payloads", """
+    WITH due_medicines AS (
+        SELECT p.patient_id, p.recorder_id, p.linked_user_id, p.member,
+               COALESCE(di.drug_name_zh, mr.drug_name_zh, '未命名藥品') AS medicine_name,
+               MIN(mr.dose_quantity) AS dose_quantity
+        FROM reminder_time rt
+        JOIN patients p ON p.recorder_id = rt.recorder_id AND p.member = rt.member
+        JOIN frequency_code fc ON fc.frequency_name = rt.frequency_name
+        JOIN medication_record mr ON mr.recorder_id = rt.recorder_id
+                                 AND mr.member = rt.member
+                                 AND mr.frequency_count_code = fc.frequency_code
+                                 AND mr.course_end_date >= CURDATE()
+        LEFT JOIN drug_info di ON di.drug_name_zh = mr.drug_name_zh
+        WHERE rt.time_slot_1 = %s OR rt.time_slot_2 = %s OR rt.time_slot_3 = %s OR rt.time_slot_4 = %s
+        GROUP BY p.patient_id, p.recorder_id, p.linked_user_id, p.member,
+                 COALESCE(di.drug_name_zh, mr.drug_name_zh, '未命名藥品')
+    ),
+    due_members AS (
+        SELECT patient_id, recorder_id, linked_user_id, member,
+               JSON_ARRAYAGG(JSON_OBJECT('medicine_name', medicine_name, 'dose_quantity', dose_quantity)) AS medicines
+        FROM due_medicines
+        GROUP BY patient_id, recorder_id, linked_user_id, member
+    ),
+    recipients AS (
+        SELECT recorder_id AS recipient_id, patient_id, member, medicines FROM due_members
+        UNION ALL
+        SELECT linked_user_id, patient_id, member, medicines FROM due_members
+        WHERE linked_user_id IS NOT NULL AND linked_user_id <> recorder_id
+    )
+    SELECT recipient_id,
+           JSON_ARRAYAGG(JSON_OBJECT(
+               'patient_id', patient_id,
+               'member', member,
+               'medicines', JSON_EXTRACT(medicines, '$')
+           )) AS members
+    FROM recipients
+    GROUP BY recipient_id
+""", DueReminderRow)
+
+# ------------------------------------------------------------
+# 📝 用藥記錄
+# ------------------------------------------------------------
+# 當天的藥單主表：已存在時 LAST_INSERT_ID(mm_id) 讓 lastrowid 回傳既有的 mm_id
+# SQLite 沒有 LAST_INSERT_ID(expr)：主表 INSERT OR IGNORE，記錄再以當天的主表帶出 mm_id
+# 藥品記錄的 course_end_date（療程結束日）由 models.course_end_date() 以看診日期與天數算出
+register("medication.upsert_today_main", """
+    INSERT INTO medication_main (recorder_id, member, clinic_name, visit_date, doctor_name)
+    VALUES (%s, %s, NULL, CURDATE(), NULL)
+    ON DUPLICATE KEY UPDATE mm_id = LAST_INSERT_ID(mm_id)
+""", sqlite="""
+    INSERT OR IGNORE INTO medication_main (recorder_id, member, clinic_name, visit_date, doctor_name)
+    VALUES (?, ?, NULL, date('now', 'localtime'), NULL)
+""")
+register("medication.insert_record_for_last_main", """
+    INSERT INTO medication_record (
+        mm_id, recorder_id, member, drug_name_zh,
+        frequency_count_code, source_detail, dose_quantity, days, course_end_date
+    ) VALUES (LAST_INSERT_ID(), %s, %s, %s, %s, %s, %s, %s, %s)
+""", sqlite="""
+    INSERT INTO medication_record (
+        mm_id, recorder_id, member, drug_name_zh,
+        frequency_count_code, source_detail, dose_quantity, days, course_end_date
+    )
+    SELECT mm_id, ?1, ?2, ?3, ?4, ?5, ?6, ?7, ?8
+    FROM medication_main
+    WHERE recorder_id = ?1 AND member = ?2 AND visit_date = date('now', 'localtime')
+""")
+register("medication.insert_main", """
+    INSERT IGNORE INTO medication_main (recorder_id, member, clinic_name, visit_date, doctor_name)
+    VALUES (%s, %s, NULL, %s, NULL)
+""")
+register("medication.insert_record", """
+    INSERT INTO medication_record (
+        mm_id, recorder_id, member, drug_name_zh, frequency_count_code,
+        source_detail, dose_quantity, dosage_unit, days, course_end_date
+    ) VALUES (%s, %s, %s, %s, %s, %s, %s, %s, %s, %s)
+""")
+register("medication.latest_main", """
+    SELECT mm_id FROM medication_main
+    WHERE recorder_id = %s AND member = %s
+    ORDER BY visit_date DESC LIMIT 1
+""")
+register("medication.insert_named_record", """
+    INSERT INTO medication_record (
+        mm_id, recorder_id, member, drug_name_zh, frequency_name,
+        source_detail, dose_quantity, dosage_unit, days, course_end_date
+    ) VALUES (%s, %s, %s, %s, %s, %s, %s, %s, %s, %s)
+""")
+# 使用者最近一次藥袋辨識寫入的藥品（「選擇頻率」帶入預設值）
+register("medication.latest_ocr", """
+    SELECT mr.member, mr.drug_name_zh, mr.frequency_count_code AS frequency_code, fc.frequency_name,
+           mr.dose_quantity, mr.days
+    FROM medication_record mr
+    LEFT JOIN frequency_code fc ON mr.frequency_count_code = fc.frequency_code
+    WHERE mr.recorder_id = %s AND mr.source_detail = 'OCR_Scan'
+    ORDER BY mr.created_at DESC
+    LIMIT 1
+""", LatestOcrRecordRow)
+
+# ------------------------------------------------------------
+# ✅ 服藥紀錄
+# ------------------------------------------------------------
+# 以提醒當時的時段帶出該用藥者在這個時段的所有藥品，每個藥品一筆；
+# 回覆者必須是記錄者本人或綁定的用藥者。同一時段已回覆過的藥品由唯一鍵略過。
+# 當天已結束療程的藥品不列入（提醒也不會再出現）。
+# 參數依序為：日期、時間、狀態、回覆者、回覆 token、日期、patient_id、回覆者、時間。
+register("dose.log_slot", """
+    INSERT IGNORE INTO dose_log (
+        recorder_id, member, drug_name_zh, scheduled_date, slot_time,
+        status, responder_id, response_token
+    )
+    SELECT DISTINCT p.recorder_id, p.member, COALESCE(mr.drug_name_zh, '未命名藥品'),
+           %s, CAST(%s AS TIME), %s, %s, %s
+    FROM patients p
+    JOIN reminder_time rt ON rt.recorder_id = p.recorder_id AND rt.member = p.member
+    JOIN frequency_code fc ON fc.frequency_name = rt.frequency_name
+    JOIN medication_record mr ON mr.recorder_id = rt.recorder_id
+                             AND mr.member = rt.member
+                             AND mr.frequency_count_code = fc.frequency_code
+                             AND mr.course_end_date >= %s
+    WHERE p.patient_id = %s AND %s IN (p.recorder_id, p.linked_user_id)
+      AND CAST(%s AS TIME) IN (rt.time_slot_1, rt.time_slot_2, rt.time_slot_3, rt.time_slot_4)
+""")
+# 只累加這次回覆（response_token）實際寫入的紀錄；以 uq_dose_log_slot 的前綴定位
+register("dose.rollup_response", """
+    INSERT INTO dose_daily_rollup (recorder_id, member, dose_date, drug_name_zh, taken_count, skipped_count)
+    SELECT dl.recorder_id, dl.member, dl.scheduled_date, dl.drug_name_zh,
+           SUM(dl.status = 'taken'), SUM(dl.status = 'skipped')
+    FROM dose_log dl
+    JOIN patients p ON p.recorder_id = dl.recorder_id AND p.member = dl.member
+    WHERE p.patient_id = %s AND dl.scheduled_date = %s
+      AND dl.slot_time = CAST(%s AS TIME) AND dl.response_token = %s
+    GROUP BY dl.recorder_id, dl.member, dl.scheduled_date, dl.drug_name_zh
+    ON DUPLICATE KEY UPDATE
+        taken_count = taken_count + VALUES(taken_count),
+        skipped_count = skipped_count + VALUES(skipped_count)
+""")
+register("dose.adherence", """
+    SELECT p.member, r.drug_name_zh,
+           SUM(r.taken_count) AS taken, SUM(r.skipped_count) AS skipped
+    FROM patients p
+    JOIN dose_daily_rollup r ON r.recorder_id = p.recorder_id AND r.member = p.member
+    WHERE p.patient_id = %s AND r.dose_date >= CURDATE() - INTERVAL %s DAY
+    GROUP BY p.member, r.drug_name_zh
+    ORDER BY r.drug_name_zh
+""", DoseAdherenceRow)
+# 服藥報告（adherence_report.py）以一般 cursor 分批讀取；順序與 uq_dose_log_slot 相同，不需額外排序
+register("dose.report_rows", """
+    SELECT member, drug_name_zh, scheduled_date, slot_time, status, responded_at
+    FROM dose_log
+    WHERE recorder_id = %s AND scheduled_date BETWEEN %s AND %s
+    ORDER BY member, scheduled_date, slot_time, drug_name_zh
+""")
+
+# ------------------------------------------------------------
+# 💊 藥品資訊
+# ------------------------------------------------------------
+register("drug.names", "SELECT drug_name_zh FROM drug_info ORDER BY drug_name_zh")
+register("drug.id_by_name", "SELECT drug_id FROM drug_info WHERE drug_name_zh = %s")
+
+# ------------------------------------------------------------
+# ⏳ 暫存狀態
+# ------------------------------------------------------------
+register("temp_state.set", """
+    INSERT INTO user_temp_state (recorder_id, state_data) VALUES (%s, %s)
+    ON DUPLICATE KEY UPDATE state_data = VALUES(state_data)
+""")
+register("temp_state.get", "SELECT state_data FROM user_temp_state WHERE recorder_id = %s")
+register("temp_state.clear", "DELETE FROM user_temp_state WHERE recorder_id = %s")
+
+
+# ========================
+# 連線池與 prepared cursor 快取
+# ========================
+
+_pools = {}   # "primary" / "replica" -> MySQLConnectionPool
+_pool_lock = threading.Lock()
+# (連線池名稱, server 連線 ID) -> {語句名稱: prepared cursor}；連線重連後 ID 改變，舊項目不再被取用。
+# server 連線 ID 在 MySQL 執行期間不會重複；重啟後可能重複，因此連線層錯誤時清空該連線池的快取。
+# 最多保留連線池大小兩倍的項目，超過時丟棄最久未用的（不在這裡 close，連線可能正被其他請求使用）。
+_prepared_cache = OrderedDict()
+_cache_lock = threading.Lock()
+
+
+def _get_pool(role):
+    pool = _pools.get(role)
+    if pool is None:
+        with _pool_lock:
+            pool = _pools.get(role)
+            if pool is None:
+                config = DB_REPLICA_CONFIG if role == "replica" else DB_CONFIG
+                pool = pooling.MySQLConnectionPool(
+                    pool_name=f"medbot_{role}", pool_size=DB_POOL_SIZE,
+                    pool_reset_session=False, **config
+                )
+                _pools[role] = pool
+    return pool
+
+
+def _checkout(role):
+    """借一條連線，回傳 (連線, 是否來自連線池)；連線池用完時改用一般連線。"""
+    if DB_BACKEND == "sqlite":
+        return get_conn(), False
+    try:
+        return _get_pool(role).get_connection(), True
+    except errors.PoolError as e:
+        logging.warning(f"WARN: 資料庫連線池（{role}）已滿，改用一般連線: {e}")
+        return get_conn(readonly=role == "replica"), False
+
+
+def _cursor_cache(conn):
+    key = (conn.pool_name, conn.connection_id)
+    with _cache_lock:
+        cursors = _prepared_cache.get(key)
+        if cursors is None:
+            cursors = _prepared_cache[key] = {}
+            while len(_prepared_cache) > DB_POOL_SIZE * 2:
+                _prepared_cache.popitem(last=False)
+        else:
+            _prepared_cache.move_to_end(key)
+    return cursors
+
+
+def _forget_pool_cursors(pool_name):
+    with _cache_lock:
+        for key in [key for key in _prepared_cache if key[0] == pool_name]:
+            del _prepared_cache[key]
+
+
+class Session:
+    """一次借用的連線：以名稱執行註冊過的語句，commit / rollback 由呼叫端決定。"""
+
+    def __init__(self, role, conn, pooled):
+        self.role = role
+        self.conn = conn
+        self._cursors = _cursor_cache(conn) if pooled else {}
+        self._pooled = pooled
+        self._last = None
+
+    def _prepared(self, name):
+        cursor = self._cursors.get(name)
+        if cursor is None:
+            cursor = self.conn.cursor(prepared=True)
+            self._cursors[name] = cursor
+        return cursor
+
+    def _run(self, name, params):
+        cursor = self._prepared(name)
+        try:
+            cursor.execute(STATEMENTS[name].text(), tuple(params))
+        except errors.Error as e:
+            # 執行失敗的 cursor 狀態不明，釋放後下次重新 prepare
+            self._cursors.pop(name, None)
+            try:
+                cursor.close()
+            except errors.Error:
+                pass
+            if self._pooled and isinstance(e, (errors.OperationalError, errors.InterfaceError)):
+                # 連線中斷（例如 server 重啟）：連線 ID 可能被重新分配，整個連線池的快取作廢
+                _forget_pool_cursors(self.conn.pool_name)
+            raise
+        self._last = cursor
+        return cursor
+
+    def execute(self, name, params=()):
+        """執行不回傳資料的語句，回傳影響筆數。"""
+        return self._run(name, params).rowcount
+
+    def fetch_all(self, name, params=()):
+        """回傳所有列，每列為欄位名稱 → 值的 dict（對應註冊時的 row_type）。"""
+        cursor = self._run(name, params)
+        columns = [column[0] for column in cursor.description]
+        return [dict(zip(columns, row)) for row in cursor.fetchall()]
+
+    def fetch_one(self, name, params=()):
+        rows = self.fetch_all(name, params)
+        return rows[0] if rows else None
+
+    def fetch_value(self, name, params=()):
+        """回傳第一列第一欄，沒有資料時回傳 None。"""
+        rows = self._run(name, params).fetchall()
+        return rows[0][0] if rows else None
+
+    def fetch_column(self, name, params=()):
+        return [row[0] for row in self._run(name, params).fetchall()]
+
+    @property
+    def lastrowid(self):
+        return self._last.lastrowid if self._last is not None else None
+
+    def cursor(self, **kwargs):
+        """動態 SQL（長度不固定的 IN 清單、多列 executemany）用的一般 cursor。"""
+        return self.conn.cursor(**kwargs)
+
+    def start_transaction(self):
+        self.conn.start_transaction()
+
+    def commit(self):
+        self.conn.commit()
+        if self.role == "primary":
+            mark_written()
+
+    def rollback(self):
+        self.conn.rollback()
+
+    def close(self):
+        try:
+            # 連線會留給下一位使用者，未 commit 的交易（含 SELECT 開啟的快照）一律結束；
+            # in_transaction 是 client 端記錄的狀態，不需要 ping server
+            if self.conn.in_transaction:
+                self.conn.rollback()
+        except errors.Error as e:
+            logging.warning(f"WARN: 歸還連線前 rollback 失敗: {e}")
+        finally:
+            if not self._pooled:
+                for cursor in self._cursors.values():
+                    cursor.close()
+            self.conn.close()
+
+
+@contextmanager
+def session(readonly=None):
+    """
+    借用一條連線執行多個語句：
+
+        with repository.session() as db:
+            db.execute("temp_state.clear", (user_id,))
+            db.commit()
+
+    readonly=None 時依呼叫端函式的 @read_only / @read_write 標示決定走 primary 或 replica。
+    """
+    role = "replica" if use_replica(readonly) else "primary"
+    db = Session(role, *_checkout(role))
+    try:
+        yield db
+    finally:
+        db.close()
+
+
+# ------------------------------------------------------------
+# 單一語句的簡便函式（各自借用並歸還連線）
+# ------------------------------------------------------------
+
+def fetch_all(name, params=()):
+    with session() as db:
+        return db.fetch_all(name, params)
+
+
+def fetch_one(name, params=()):
+    with session() as db:
+        return db.fetch_one(name, params)
+
+
+def fetch_value(name, params=()):
+    with session() as db:
+        return db.fetch_value(name, params)
+
+
+def fetch_column(name, params=()):
+    with session() as db:
+        return db.fetch_column(name, params)
+
+
+def execute(name, params=()):
+    """執行並 commit，回傳影響筆數；寫入一律走 primary。"""
+    with session(readonly=False) as db:
+        rowcount = db.execute(name, params)
+        db.commit()
+        return rowcount
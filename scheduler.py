@@ -1,12 +1,31 @@
 from apscheduler.schedulers.background import BackgroundScheduler
 from medication_reminder import run_reminders
+from line_client import log_line_api_metrics
+from housekeeping import run_housekeeping
+from ocr_engine import log_ocr_metrics
+from drug_index import refresh_drug_index
+from config import DRUG_INDEX_REFRESH_MINUTES
+from database import reset_routing
 
 scheduler = BackgroundScheduler()
 scheduler_started = False
 
+
+def _job(func, *args):
+    """排程執行緒會重複使用，每次執行前清除上一次工作留下的讀寫分流狀態。"""
+    def run():
+        reset_routing()
+        return func(*args)
+    return run
+
+
 def start_scheduler(line_bot_api):
     global scheduler_started
     if not scheduler_started:
-        scheduler.add_job(lambda: run_reminders(line_bot_api), 'cron', minute='*')
+        scheduler.add_job(_job(run_reminders, line_bot_api), 'cron', minute='*')
+        scheduler.add_job(_job(log_line_api_metrics), 'interval', minutes=15)
+        scheduler.add_job(_job(log_ocr_metrics), 'interval', minutes=15)
+        scheduler.add_job(_job(run_housekeeping), 'cron', hour=3, minute=30)
+        scheduler.add_job(_job(refresh_drug_index), 'interval', minutes=DRUG_INDEX_REFRESH_MINUTES)
         scheduler.start()
         scheduler_started = True
@@ -0,0 +1,277 @@
+import functools
+import os
+import re
+import sqlite3
+import threading
+from datetime import date, datetime, time, timedelta
+
+from config import SQLITE_PATH
+
+# ========================
+# 🪶 SQLite 嵌入式後端（單機、免網路）
+# ========================
+# 小診所只有幾百位用藥者時不必另外架 MySQL：DB_BACKEND = "sqlite" 時 database.get_conn() 回傳這裡的連線。
+# 連線物件模仿 mysql-connector 用到的介面（cursor(dictionary=...)、commit、rollback、in_transaction…），
+# 程式中的 MySQL 語法在執行前轉成 SQLite 語法（結果依 SQL 文字快取），
+# 無法直接轉換的語句在 repository 以 sqlite= 另外提供。
+# schema 來自 migrations/ 的 *.sqlite.up.sql，與 MySQL 版本相同的資料表與索引。
+#
+# - WAL 模式：讀取不會被寫入擋住；寫入同時只有一個，其餘等待 busy_timeout。
+# - 連線依執行緒保留重用，close() 只會 rollback 未完成的交易並放回該執行緒的閒置清單。
+# - TIME / DATE / DATETIME / TIMESTAMP 欄位讀出時轉成 timedelta / date / datetime，與 mysql-connector 相同。
+
+_BUSY_TIMEOUT_MS = 5000
+_MAX_IDLE_PER_THREAD = 4
+_ROOT = os.path.dirname(os.path.abspath(__file__))
+
+
+def database_path():
+    return SQLITE_PATH if os.path.isabs(SQLITE_PATH) else os.path.join(_ROOT, SQLITE_PATH)
+
+
+# ------------------------------------------------------------
+# 型別轉換
+# ------------------------------------------------------------
+
+def _adapt(value):
+    """參數轉成與 MySQL 相同格式的文字，比較與排序才會一致。"""
+    if isinstance(value, datetime):
+        return value.strftime("%Y-%m-%d %H:%M:%S")
+    if isinstance(value, date):
+        return value.isoformat()
+    if isinstance(value, time):
+        return value.strftime("%H:%M:%S")
+    if isinstance(value, timedelta):
+        seconds = int(value.total_seconds())
+        return f"{seconds // 3600:02d}:{seconds // 60 % 60:02d}:{seconds % 60:02d}"
+    return value
+
+
+def _adapt_params(params):
+    if params is None:
+        return ()
+    if isinstance(params, dict):
+        return {key: _adapt(value) for key, value in params.items()}
+    return tuple(_adapt(value) for value in params)
+
+
+def _convert_time(raw):
+    text = raw.decode()
+    try:
+        hours, minutes, *rest = (int(part) for part in text.split(":"))
+        return timedelta(hours=hours, minutes=minutes, seconds=rest[0] if rest else 0)
+    except ValueError:
+        return text
+
+
+def _convert_date(raw):
+    text = raw.decode()
+    try:
+        return date.fromisoformat(text[:10])
+    except ValueError:
+        return text
+
+
+def _convert_datetime(raw):
+    text = raw.decode()
+    try:
+        return datetime.fromisoformat(text)
+    except ValueError:
+        return text
+
+
+sqlite3.register_converter("TIME", _convert_time)
+sqlite3.register_converter("DATE", _convert_date)
+sqlite3.register_converter("DATETIME", _convert_datetime)
+sqlite3.register_converter("TIMESTAMP", _convert_datetime)
+
+
+# ------------------------------------------------------------
+# MySQL → SQLite 語法轉換
+# ------------------------------------------------------------
+
+_DDL = re.compile(r"^\s*(CREATE|DROP|ALTER|PRAGMA)\b", re.I)
+_NAMED_PARAM = re.compile(r"%\((\w+)\)s")
+_INTERVAL = re.compile(
+    r"(NOW\(\)|CURDATE\(\))\s*([-+])\s*INTERVAL\s+(\?|\d+)\s+(DAY|HOUR|MINUTE|SECOND)\b", re.I)
+_DATE_FORMAT = re.compile(r"DATE_FORMAT\(([^,()]+),\s*'([^']*)'\)", re.I)
+_CAST_TIME = re.compile(r"CAST\(([^()]*?)\s+AS\s+TIME\)", re.I)
+_ON_DUPLICATE = re.compile(r"ON\s+DUPLICATE\s+KEY\s+UPDATE", re.I)
+_VALUES_REF = re.compile(r"\bVALUES\((\w+)\)", re.I)
+_DML_LIMIT = re.compile(
+    r"^\s*(DELETE\s+FROM|UPDATE)\s+(\w+)(.*?)\bWHERE\b(.*)\bLIMIT\s+(\?|\d+)\s*$", re.I | re.S)
+_DATE_FORMAT_CODES = {"%i": "%M", "%s": "%S", "%e": "%d", "%k": "%H"}
+
+
+def _interval(match):
+    base, sign, amount, unit = match.groups()
+    function = "date" if base.upper() == "CURDATE()" else "datetime"
+    return f"{function}('now', 'localtime', '{sign}' || {amount} || ' {unit.lower()}s')"
+
+
+def _date_format(match):
+    column, mysql_format = match.groups()
+    sqlite_format = re.sub(r"%[a-zA-Z]", lambda m: _DATE_FORMAT_CODES.get(m.group(0), m.group(0)), mysql_format)
+    return f"strftime('{sqlite_format}', {column})"
+
+
+@functools.lru_cache(maxsize=1024)
+def translate(sql):
+    """把程式中的 MySQL 語法轉成 SQLite；DDL 以外的語句才轉換（schema 使用 .sqlite.up.sql）。"""
+    if _DDL.match(sql):
+        return sql
+    sql = _NAMED_PARAM.sub(r":\1", sql).replace("%s", "?").replace("%%", "%")
+    sql = re.sub(r"\bINSERT\s+IGNORE\b", "INSERT OR IGNORE", sql, flags=re.I)
+    sql = _INTERVAL.sub(_interval, sql)
+    sql = re.sub(r"\bNOW\(\)", "datetime('now', 'localtime')", sql, flags=re.I)
+    sql = re.sub(r"\bCURDATE\(\)", "date('now', 'localtime')", sql, flags=re.I)
+    sql = re.sub(r"\bCURRENT_TIMESTAMP\b", "datetime('now', 'localtime')", sql, flags=re.I)
+    sql = _DATE_FORMAT.sub(_date_format, sql)
+    sql = _CAST_TIME.sub(r"time(\1)", sql)
+    sql = re.sub(r"\bIF\s*\(", "IIF(", sql)
+    sql = re.sub(r"\bJSON_ARRAYAGG\s*\(", "json_group_array(", sql, flags=re.I)
+    duplicate = _ON_DUPLICATE.search(sql)
+    if duplicate:
+        head, tail = sql[:duplicate.start()], sql[duplicate.end():]
+        sql = head + "ON CONFLICT DO UPDATE SET" + _VALUES_REF.sub(r"excluded.\1", tail)
+    limited = _DML_LIMIT.match(sql)
+    if limited:
+        # SQLite 預設不支援 UPDATE / DELETE ... LIMIT，改以 rowid 子查詢限制筆數
+        verb, table, middle, condition, limit = limited.groups()
+        sql = (f"{verb} {table}{middle}WHERE rowid IN ("
+               f"SELECT rowid FROM {table} WHERE{condition}LIMIT {limit})")
+    return sql
+
+
+# ------------------------------------------------------------
+# mysql-connector 相容的連線與 cursor
+# ------------------------------------------------------------
+
+class SQLiteCursor:
+
+    def __init__(self, db, dictionary=False):
+        self._cursor = db.cursor()
+        self._dictionary = dictionary
+
+    def execute(self, operation, params=None):
+        self._cursor.execute(translate(operation), _adapt_params(params))
+
+    def executemany(self, operation, seq_params):
+        self._cursor.executemany(translate(operation), [_adapt_params(p) for p in seq_params])
+
+    def _row(self, row):
+        if row is None or not self._dictionary:
+            return row
+        return {column[0]: value for column, value in zip(self._cursor.description, row)}
+
+    def fetchone(self):
+        return self._row(self._cursor.fetchone())
+
+    def fetchall(self):
+        return [self._row(row) for row in self._cursor.fetchall()]
+
+    def fetchmany(self, size=1):
+        return [self._row(row) for row in self._cursor.fetchmany(size)]
+
+    def __iter__(self):
+        return iter(self.fetchall())
+
+    @property
+    def description(self):
+        return self._cursor.description
+
+    @property
+    def rowcount(self):
+        return self._cursor.rowcount
+
+    @property
+    def lastrowid(self):
+        return self._cursor.lastrowid
+
+    @property
+    def with_rows(self):
+        return self._cursor.description is not None
+
+    def close(self):
+        self._cursor.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+
+class SQLiteConnection:
+
+    def __init__(self, db):
+        self._db = db
+        self._open = True
+
+    @property
+    def connection_id(self):
+        return id(self._db)
+
+    @property
+    def in_transaction(self):
+        return self._db.in_transaction
+
+    def cursor(self, dictionary=False, buffered=None, prepared=None, **kwargs):
+        # SQLite 本身有 statement cache，prepared / buffered 不需要另外處理
+        return SQLiteCursor(self._db, dictionary=dictionary)
+
+    def start_transaction(self):
+        if not self._db.in_transaction:
+            self._db.execute("BEGIN")
+
+    def commit(self):
+        self._db.commit()
+
+    def rollback(self):
+        self._db.rollback()
+
+    def is_connected(self):
+        return self._open
+
+    def close(self):
+        if not self._open:
+            return
+        self._open = False
+        if self._db.in_transaction:
+            self._db.rollback()
+        idle = _idle_connections()
+        if len(idle) < _MAX_IDLE_PER_THREAD:
+            idle.append(self._db)
+        else:
+            self._db.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+
+_local = threading.local()
+
+
+def _idle_connections():
+    idle = getattr(_local, "idle", None)
+    if idle is None:
+        idle = _local.idle = []
+    return idle
+
+
+def _open_database():
+    db = sqlite3.connect(database_path(), timeout=_BUSY_TIMEOUT_MS / 1000,
+                         detect_types=sqlite3.PARSE_DECLTYPES)
+    db.execute("PRAGMA journal_mode = WAL")
+    db.execute("PRAGMA synchronous = NORMAL")
+    db.execute(f"PRAGMA busy_timeout = {_BUSY_TIMEOUT_MS}")
+    return db
+
+
+def connect():
+    """取得目前執行緒的 SQLite 連線（有閒置的就重用）。"""
+    idle = _idle_connections()
+    return SQLiteConnection(idle.pop() if idle else _open_database())
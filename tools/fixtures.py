@@ -0,0 +1,171 @@
+"""
+tools/ 檢查工具共用的測試資料：
+
+- use_temporary_sqlite()：改用暫存的 SQLite 資料庫並套用 migrations（需在匯入 database / repository 之前呼叫）
+- seed(conn)：灌入合成的使用者、用藥者、提醒與藥品記錄（頻率代碼來自 migrations）
+- check_user(user_id)：檢查用的使用者，離開時刪除它寫入的資料
+- count_statements()：記錄目前執行緒經由 repository.Session 送出的語句，用於檢查每個操作的資料庫往返次數
+"""
+import atexit
+import json
+import os
+import random
+import shutil
+import tempfile
+import threading
+from contextlib import contextmanager
+from datetime import datetime, timedelta
+
+# check_user 清除的資料：(資料表, 記錄使用者的欄位)
+_USER_TABLES = (
+    ("user_temp_state", "recorder_id"), ("dose_log", "recorder_id"), ("dose_daily_rollup", "recorder_id"),
+    ("reminder_time", "recorder_id"), ("medication_record", "recorder_id"),
+    ("medication_record_archive", "recorder_id"), ("medication_main", "recorder_id"),
+    ("invitation_recipients", "recorder_id"), ("invitation_recipients", "recipient_line_id"),
+    ("invite_codes", "inviter_recorder_id"), ("invite_codes", "recipient_line_id"),
+    ("patients", "recorder_id"), ("users", "recorder_id"),
+)
+
+
+def use_temporary_sqlite():
+    """把 config 指向暫存目錄中的 SQLite 檔並套用 migrations，回傳檔案路徑；程式結束時刪除。"""
+    import config
+
+    directory = tempfile.mkdtemp(prefix="medbot-check-")
+    atexit.register(shutil.rmtree, directory, ignore_errors=True)
+    config.DB_BACKEND = "sqlite"
+    config.SQLITE_PATH = os.path.join(directory, "medbot.sqlite3")
+
+    from migrate import migrate_up
+    migrate_up()
+    return config.SQLITE_PATH
+
+
+def seed(conn, scale=1, rng=None):
+    """灌入合成資料：預設約 2,000 位使用者、6,000 位用藥者與 3 萬筆藥品記錄。"""
+    rng = rng or random.Random(42)
+    users = 2000 * scale
+    cursor = conn.cursor()
+    user_ids = [f"U{i:06d}" for i in range(1, users + 1)]
+    now = datetime.now()
+
+    # 頻率代碼與建議時間由 migrations（0009_frequency_code_seed）寫入
+    cursor.execute("""
+        SELECT fc.frequency_code, fc.frequency_name,
+               s.time_slot_1, s.time_slot_2, s.time_slot_3, s.time_slot_4
+        FROM frequency_code fc JOIN suggested_dosage_time s ON s.frequency_code = fc.frequency_code
+        ORDER BY fc.frequency_code
+    """)
+    frequencies = [(code, name, [t for t in slots if t is not None]) for code, name, *slots in cursor.fetchall()]
+    scheduled = [f for f in frequencies if f[2]]
+    cursor.executemany("INSERT INTO users (recorder_id, user_name) VALUES (%s, %s)",
+                       [(uid, f"使用者{uid[-4:]}") for uid in user_ids])
+
+    members = ["本人", "爸爸", "媽媽"]
+    cursor.executemany("INSERT INTO patients (recorder_id, member, linked_user_id) VALUES (%s, %s, %s)",
+                       [(uid, m, rng.choice(user_ids) if m != "本人" and rng.random() < 0.3 else None)
+                        for uid in user_ids for m in members])
+
+    reminders, mains, records = [], [], []
+    for uid in user_ids:
+        for m in members:
+            for code, name, times in rng.sample(scheduled, 2):
+                reminders.append((uid, m, name, *(times + [None] * (4 - len(times))), len(times)))
+            for days_ago in (3, 40):
+                mains.append((uid, m, (now - timedelta(days=days_ago)).date()))
+    cursor.executemany(
+        "INSERT INTO reminder_time (recorder_id, member, frequency_name, time_slot_1, time_slot_2, "
+        "time_slot_3, time_slot_4, total_doses_per_day) VALUES (%s, %s, %s, %s, %s, %s, %s, %s)", reminders)
+    cursor.executemany("INSERT INTO medication_main (recorder_id, member, visit_date) VALUES (%s, %s, %s)", mains)
+    # 7 天療程：3 天前看診的仍在服用，40 天前看診的已結束
+    cursor.execute("SELECT mm_id, recorder_id, member, visit_date FROM medication_main")
+    for mm_id, uid, m, visit_date in cursor.fetchall():
+        for _ in range(3):
+            code = rng.choice(frequencies)[0]
+            records.append((mm_id, uid, m, f"藥品{rng.randint(1, 5000)}", code, "seed", "1", "錠", 7,
+                            visit_date + timedelta(days=6)))
+    cursor.executemany(
+        "INSERT INTO medication_record (mm_id, recorder_id, member, drug_name_zh, frequency_count_code, "
+        "source_detail, dose_quantity, dosage_unit, days, course_end_date) "
+        "VALUES (%s, %s, %s, %s, %s, %s, %s, %s, %s, %s)", records)
+
+    cursor.executemany("INSERT INTO drug_info (drug_name_zh) VALUES (%s)",
+                       [(f"藥品{i}",) for i in range(1, 5001)])
+    pairs = {(rng.choice(user_ids), rng.choice(user_ids)) for _ in range(users // 2)}
+    cursor.executemany(
+        "INSERT IGNORE INTO invitation_recipients (recorder_id, recipient_line_id, recipient_name, relation_type) "
+        "VALUES (%s, %s, '家人', '家人')", [p for p in pairs if p[0] != p[1]])
+    cursor.executemany(
+        "INSERT INTO invite_codes (code, inviter_recorder_id, expires_at, used) VALUES (%s, %s, %s, %s)",
+        [(f"C{i:05d}", rng.choice(user_ids), now + timedelta(minutes=rng.randint(-5000, 60)), rng.random() < 0.5)
+         for i in range(users)])
+    cursor.executemany("INSERT INTO user_temp_state (recorder_id, state_data) VALUES (%s, %s)",
+                       [(uid, json.dumps({"state": "IDLE"})) for uid in user_ids[: users // 2]])
+    conn.commit()
+    cursor.close()
+
+
+@contextmanager
+def check_user(user_id):
+    """檢查用的使用者：離開時刪除 user_id 在各資料表留下的資料（包含檢查失敗時）。"""
+    from database import get_conn
+
+    try:
+        yield user_id
+    finally:
+        conn = get_conn(readonly=False)
+        cursor = conn.cursor()
+        try:
+            for table, column in _USER_TABLES:
+                cursor.execute(f"DELETE FROM {table} WHERE {column} = %s", (user_id,))
+            conn.commit()
+        finally:
+            cursor.close()
+            conn.close()
+
+
+class _CountingCursor:
+    """一般 cursor 的包裝：每次 execute / executemany 記為一個語句（executemany 合併為一次送出）。"""
+
+    def __init__(self, cursor, names):
+        self._cursor = cursor
+        self._names = names
+
+    def execute(self, *args, **kwargs):
+        self._names.append("cursor.execute")
+        return self._cursor.execute(*args, **kwargs)
+
+    def executemany(self, *args, **kwargs):
+        self._names.append("cursor.executemany")
+        return self._cursor.executemany(*args, **kwargs)
+
+    def __getattr__(self, name):
+        return getattr(self._cursor, name)
+
+
+@contextmanager
+def count_statements():
+    """
+    記錄 with 區塊內目前執行緒送出的語句：具名語句記名稱，一般 cursor 記為 cursor.execute / cursor.executemany。
+    不含 start_transaction / commit / rollback；背景執行緒（例如暱稱回填）的語句不計入。
+    """
+    import repository
+
+    names = []
+    thread = threading.get_ident()
+    run, cursor = repository.Session._run, repository.Session.cursor
+
+    def counting_run(self, name, params):
+        if threading.get_ident() == thread:
+            names.append(name)
+        return run(self, name, params)
+
+    def counting_cursor(self, **kwargs):
+        plain = cursor(self, **kwargs)
+        return _CountingCursor(plain, names) if threading.get_ident() == thread else plain
+
+    repository.Session._run, repository.Session.cursor = counting_run, counting_cursor
+    try:
+        yield names
+    finally:
+        repository.Session._run, repository.Session.cursor = run, cursor
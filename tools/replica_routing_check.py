@@ -0,0 +1,103 @@
+"""
+讀寫分離檢查：模擬一個請求，確認讀取走 replica、寫入後的讀取改走 primary、新請求重新分流。
+
+    python tools/replica_routing_check.py            使用 config.DB_REPLICA_CONFIG（需已設定）
+    python tools/replica_routing_check.py --standin  沒有 replica 時以 DB_CONFIG 當作替身
+
+每一步會印出實際連到的伺服器（@@hostname:@@port / @@server_id），
+兩台 MySQL 時可以直接看出讀寫各自落在哪一台；替身模式只檢查分流決策。
+會在 user_temp_state 寫入一筆測試資料，結束時刪除。結束代碼：任一步不符預期時為 1。
+"""
+import argparse
+import os
+import sys
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+import database  # noqa: E402
+import repository  # noqa: E402
+from config import DB_CONFIG  # noqa: E402
+from database import read_only, read_write, reset_routing  # noqa: E402
+from tools.fixtures import check_user  # noqa: E402
+
+CHECK_USER_ID = "U_replica_routing_check"
+
+
+def _server(db):
+    cursor = db.cursor()
+    try:
+        cursor.execute("SELECT @@hostname, @@port, @@server_id")
+        host, port, server_id = cursor.fetchone()
+        return f"{host}:{port} (server_id={server_id})"
+    finally:
+        cursor.close()
+
+
+@read_only
+def _read():
+    with repository.session() as db:
+        db.fetch_value("temp_state.get", (CHECK_USER_ID,))
+        return db.role, _server(db)
+
+
+@read_write
+def _write():
+    with repository.session() as db:
+        db.execute("temp_state.set", (CHECK_USER_ID, '{"state": "ROUTING_CHECK"}'))
+        db.commit()
+        return db.role, _server(db)
+
+
+@read_write
+def _read_inside_write():
+    return _read()
+
+
+@read_only
+def _raw_read():
+    conn = database.get_conn()
+    try:
+        cursor = conn.cursor()
+        cursor.execute("SELECT @@server_id")
+        return cursor.fetchone()[0]
+    finally:
+        conn.close()
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--standin", action="store_true", help="以 DB_CONFIG 當作 replica 替身")
+    args = parser.parse_args(argv)
+
+    if args.standin:
+        database.DB_REPLICA_CONFIG = repository.DB_REPLICA_CONFIG = dict(DB_CONFIG)
+    if not database.replica_enabled():
+        print("❌ 未設定 DB_REPLICA_CONFIG；請設定 replica 或加上 --standin")
+        return 2
+
+    steps = []
+
+    def check(label, role_and_server, expected):
+        role, server = role_and_server
+        ok = role == expected
+        steps.append(ok)
+        print(f"{'✅' if ok else '❌'} {label:<24} → {role:<7} {server}")
+
+    with check_user(CHECK_USER_ID):
+        reset_routing()
+        check("請求開始，讀取", _read(), "replica")
+        check("寫入", _write(), "primary")
+        check("同一請求，寫入後讀取", _read(), "primary")
+        reset_routing()
+        check("新請求，讀取", _read(), "replica")
+        check("寫入函式內的讀取", _read_inside_write(), "primary")
+        reset_routing()
+        replica_id = _raw_read()
+        print(f"ℹ️ get_conn()（@read_only）連到 server_id={replica_id}")
+
+    return 0 if all(steps) else 1
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,185 @@
+"""
+寫入路徑往返次數檢查：逐一執行使用者建立、提醒設定與清除、批次匯入、家人綁定，
+比對每個操作送出的語句（即資料庫往返次數，不含 commit）與操作後的資料狀態。
+
+    python tools/round_trip_check.py            使用 config 設定的資料庫
+    python tools/round_trip_check.py --sqlite   使用暫存的 SQLite 資料庫（自動套用 migrations）
+
+每個操作的語句清單必須與 BUDGETS 完全相同：改回先查再寫、或多出一次查詢都會失敗。
+LINE API 以替身取代，不會送出訊息。會以測試用使用者寫入資料，結束時刪除。
+結束代碼：任一步不符預期時為 1。
+"""
+import argparse
+import os
+import sys
+from types import SimpleNamespace
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+from tools import fixtures  # noqa: E402
+
+CHECK_USER_ID = "U_round_trip_check"
+FAMILY_USER_ID = "U_round_trip_check_family"
+MEMBER = "本人"
+FREQUENCY_CODE = "BID"
+
+# ------------------------------------------------------------
+# 每個操作送出的語句：具名語句為 repository 註冊的名稱，動態 SQL 為 cursor.execute / cursor.executemany
+# ------------------------------------------------------------
+BUDGETS = {
+    # 新使用者：users 與「本人」一個交易
+    "create_user_new": ["users.insert_default", "patients.insert_self"],
+    # 已確認存在的使用者只查記憶體
+    "create_user_known": [],
+    "add_reminder": ["medication.upsert_today_main", "medication.insert_record_for_last_main",
+                     "reminder.upsert_by_code"],
+    # 清除時段與刪除全空的提醒在同一交易，固定兩個語句（UPDATE 與 DELETE 無法合併為一個語句）
+    "clear_slot": ["reminder.clear_slot", "reminder.delete_if_empty"],
+    # 沒有符合的時段時不送 DELETE
+    "clear_slot_missing": ["reminder.clear_slot"],
+    # 批次匯入與藥品數量無關：看診日已有 medication_main、新藥品、新頻率
+    "bulk_import": ["cursor.execute", "cursor.execute", "cursor.executemany",
+                    "cursor.execute", "cursor.executemany"],
+    # 重複匯入：查到都已存在，不寫入
+    "bulk_import_duplicate": ["cursor.execute", "cursor.execute"],
+    # 新的被邀請人：建立使用者 + 認領邀請碼、取名稱、寫入綁定
+    "bind_new": ["users.insert_default", "patients.insert_self",
+                 "invite.claim", "invite.claimed_by", "family.bind"],
+    # 已綁定過：INSERT IGNORE 沒有新增，連同邀請碼的認領一起 rollback
+    "bind_duplicate": ["invite.claim", "invite.claimed_by", "family.bind"],
+}
+
+
+class _LineStub:
+    """LINE API 替身：記錄推播對象，暱稱固定回傳。"""
+
+    def __init__(self):
+        self.pushed = []
+
+    def push_message(self, to, messages, **kwargs):
+        self.pushed.append(to)
+
+    def get_profile(self, user_id):
+        return SimpleNamespace(display_name="檢查用戶")
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--sqlite", action="store_true", help="使用暫存的 SQLite 資料庫")
+    args = parser.parse_args(argv)
+
+    if args.sqlite:
+        fixtures.use_temporary_sqlite()
+    # config 需在匯入 database 之前切換
+    import models
+    import repository
+    from database import get_conn
+    from frequency_resolver import _format_time_slot
+
+    line_stub = _LineStub()
+    models.get_line_bot_api = lambda: line_stub
+    steps = []
+
+    def check(label, ok, detail=""):
+        steps.append(ok)
+        print(f"{'✅' if ok else '❌'} {label:<28} {detail}")
+
+    def check_budget(label, budget, names):
+        expected = BUDGETS[budget]
+        detail = f"{len(names)} 個語句" if names == expected else f"預期 {expected}，實際 {names}"
+        check(label, names == expected, detail)
+
+    def slots():
+        """目前的 reminder_time：{頻率名稱: [HH:MM, ...]}"""
+        rows = repository.fetch_all("reminder.times_for_member", (CHECK_USER_ID, MEMBER))
+        return {
+            row["frequency_name"]: [_format_time_slot(row[f"time_slot_{i}"])
+                                    for i in range(1, 5) if row[f"time_slot_{i}"] is not None]
+            for row in rows
+        }
+
+    def invite_used(code):
+        conn = get_conn(readonly=False)
+        try:
+            cursor = conn.cursor()
+            cursor.execute("SELECT used FROM invite_codes WHERE code = %s", (code,))
+            return bool(cursor.fetchone()[0])
+        finally:
+            conn.close()
+
+    with fixtures.check_user(CHECK_USER_ID), fixtures.check_user(FAMILY_USER_ID):
+        frequency_name = models.get_frequency_name(FREQUENCY_CODE)
+
+        with fixtures.count_statements() as names:
+            models.create_user_if_not_exists(CHECK_USER_ID)
+        check_budget("建立新使用者", "create_user_new", names)
+        with fixtures.count_statements() as names:
+            models.create_user_if_not_exists(CHECK_USER_ID)
+        check_budget("已存在的使用者", "create_user_known", names)
+
+        with fixtures.count_statements() as names:
+            models.add_medication_reminder_full(CHECK_USER_ID, MEMBER, "檢查藥A", FREQUENCY_CODE, "1錠", 7,
+                                                ["08:00", "20:00"])
+        check_budget("設定兩個時段", "add_reminder", names)
+        current = slots()
+        check("　→ 提醒時段", current == {frequency_name: ["08:00", "20:00"]}, current)
+
+        with fixtures.count_statements() as names:
+            cleared = models.clear_single_time_slot(CHECK_USER_ID, MEMBER, frequency_name, "08:00")
+        check_budget("清除 08:00", "clear_slot", names)
+        current = slots()
+        check("　→ 提醒仍在", cleared and current == {frequency_name: ["20:00"]}, current)
+        reminders = models.get_medication_reminders_for_user(CHECK_USER_ID, MEMBER)
+        check("　→ 提醒列表只剩 20:00", len(reminders) == 1, f"{len(reminders)} 筆")
+
+        with fixtures.count_statements() as names:
+            cleared = models.clear_single_time_slot(CHECK_USER_ID, MEMBER, frequency_name, "12:00")
+        check_budget("清除不存在的時段", "clear_slot_missing", names)
+        check("　→ 回傳 False", cleared is False, cleared)
+
+        with fixtures.count_statements() as names:
+            cleared = models.delete_medication_reminder_time(CHECK_USER_ID, MEMBER, frequency_name, "20:00")
+        check_budget("清除最後一個時段", "clear_slot", names)
+        current = slots()
+        check("　→ 整筆刪除", cleared and current == {}, current)
+        reminders = models.get_medication_reminders_for_user(CHECK_USER_ID, MEMBER)
+        check("　→ 提醒列表為空", reminders == [], f"{len(reminders)} 筆")
+
+        medications = [
+            {"name": "檢查藥B", "frequency_text": frequency_name, "days_supply": 7},
+            {"name": "檢查藥C", "frequency_text": frequency_name, "days_supply": 7},
+        ]
+        with fixtures.count_statements() as names:
+            summary = models.bulk_import_medications(CHECK_USER_ID, MEMBER, medications)
+        check_budget("批次匯入兩種藥", "bulk_import", names)
+        current = slots()
+        check("　→ 重新建立提醒",
+              summary["inserted"] == 2 and summary["reminders_added"] == 1 and bool(current.get(frequency_name)),
+              current)
+        with fixtures.count_statements() as names:
+            summary = models.bulk_import_medications(CHECK_USER_ID, MEMBER, medications)
+        check_budget("重複匯入", "bulk_import_duplicate", names)
+        check("　→ 全部略過", summary["inserted"] == 0 and summary["duplicates"] == 2, summary)
+
+        code, _ = models.generate_invite_code(CHECK_USER_ID)
+        with fixtures.count_statements() as names:
+            result = models.bind_family(code, FAMILY_USER_ID)
+        check_budget("以邀請碼綁定", "bind_new", names)
+        check("　→ 綁定成功並通知邀請人",
+              result == (True, CHECK_USER_ID) and line_stub.pushed == [CHECK_USER_ID], result)
+        check("　→ 邀請碼已使用", invite_used(code) is True, code)
+
+        code, _ = models.generate_invite_code(CHECK_USER_ID)
+        with fixtures.count_statements() as names:
+            result = models.bind_family(code, FAMILY_USER_ID)
+        check_budget("重複綁定", "bind_duplicate", names)
+        check("　→ 回傳已綁定、不再通知",
+              result == (True, CHECK_USER_ID) and line_stub.pushed == [CHECK_USER_ID], result)
+        check("　→ 邀請碼仍未使用", invite_used(code) is False, code)
+
+    return 0 if all(steps) else 1
+
+
+if __name__ == "__main__":
+    sys.exit(main())